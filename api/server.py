@@ -1,12 +1,139 @@
-import json
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel
+from utils.logging_config import setup_logging
+from utils import serialization
+from configs import APIConfig
+
+setup_logging()
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+class ProfileIndex:
+    """
+    In-memory index of LinkedIn profiles, by email.
+
+    Profiles are serialized once when they are loaded, so serving one is a
+    dictionary lookup. A profile is indexed under its top-level "email" and
+    every address in person.emails.
+
+    Attributes:
+        default (Optional[bytes]): The first profile loaded, served for unknown emails.
+
+    Methods:
+        load: Loads a corpus from a JSON file, an NDJSON file or a directory.
+        add: Adds one profile to the index.
+        get: Returns the serialized profile of an email.
+    """
+
+    def __init__(self, fallback_to_default: bool = APIConfig.FALLBACK_TO_DEFAULT):
+        self.fallback_to_default = fallback_to_default
+        self.default: Optional[bytes] = None
+        self._profiles: dict[str, bytes] = {}
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    @staticmethod
+    def read_profiles(path: Path) -> Iterator[dict]:
+        if path.is_dir():
+            for child in sorted(path.iterdir()):
+                if child.suffix in (".json", ".ndjson", ".jsonl"):
+                    yield from ProfileIndex.read_profiles(child)
+        elif path.suffix in (".ndjson", ".jsonl"):
+            with path.open("rb") as f:
+                for line in f:
+                    if line.strip():
+                        yield serialization.loads(line)
+        else:
+            with path.open("rb") as f:
+                data = serialization.load(f)
+            yield from data if isinstance(data, list) else [data]
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "ProfileIndex":
+        """
+        Loads a corpus from a JSON file (one profile, or a list of profiles),
+        an NDJSON file, or a directory of those.
+
+        Args:
+            path (str): The path of the corpus.
+
+        Returns:
+            ProfileIndex: The loaded index.
+        """
+        index = cls(**kwargs)
+        for profile in cls.read_profiles(Path(path)):
+            index.add(profile)
+        logging.info(f"Loaded {len(index)} profiles from {path}")
+        return index
+
+    def add(self, profile: dict) -> None:
+        raw = serialization.dumps(profile)
+        if self.default is None:
+            self.default = raw
+        emails = [profile.get("email")]
+        emails += ((profile.get("person") or {}).get("emails")) or []
+        for email in emails:
+            if isinstance(email, str) and email:
+                self._profiles[normalize_email(email)] = raw
+
+    def get(self, email: str) -> Optional[bytes]:
+        raw = self._profiles.get(normalize_email(email))
+        if raw is None and self.fallback_to_default:
+            return self.default
+        return raw
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.profiles = ProfileIndex.load(APIConfig.CORPUS_PATH)
+    yield
+
+
+# Responses that are not pre-serialized are rendered with orjson when it is installed
+app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse if serialization.orjson else JSONResponse,
+)
+
+
+class EmailsRequest(BaseModel):
+    emails: list[str]
 
-app = FastAPI()
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"Hello": "World"}
 
+
 @app.get("/get_linkedin_data/{email}")
-def get_linkedin_data(email:str) -> dict:
-    return json.loads(open("test_data/linkedin_example.json").read())
\ No newline at end of file
+async def get_linkedin_data(email: str, request: Request) -> Response:
+    raw = request.app.state.profiles.get(email)
+    if raw is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=raw, media_type="application/json")
+
+
+@app.post("/get_linkedin_data")
+async def get_many_linkedin_data(body: EmailsRequest, request: Request) -> Response:
+    """
+    Returns the profiles of many emails, as an object keyed by email.
+    Unknown emails map to null.
+    """
+    profiles: ProfileIndex = request.app.state.profiles
+    # Profiles are already serialized, so the response is assembled from bytes
+    items = (
+        serialization.dumps(email) + b":" + (profiles.get(email) or b"null")
+        for email in dict.fromkeys(body.emails)
+    )
+    return Response(
+        content=b"{" + b",".join(items) + b"}", media_type="application/json"
+    )
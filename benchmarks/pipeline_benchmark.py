@@ -0,0 +1,355 @@
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import subprocess
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterator, Optional
+import boto3
+import httpx
+from moto import mock_aws
+from motor.motor_asyncio import AsyncIOMotorClient
+from api import server
+from benchmarks.profile_generator import ProfileGenerator
+from database.indexes import build_indexes
+from database.models.lead import Lead
+from database.models.linkedin_data import Linkedin
+from database.models.persona import Persona
+from database.models.persona_lead import PersonaLead
+from database.mongodb_connector import connection_manager, close
+from database.s3_connector import S3Connector
+from data_pipeline.batch_elt import BatchELT
+from data_pipeline.extractor import AsyncExtractor
+from persona_mapping.persona_mapper import PersonaMapper
+from utils.logging_config import setup_logging
+from configs import LINKEDIN_BUCKET, MONGODB_DB_NAME, MongoConfig
+
+setup_logging()
+
+STAGES = [
+    "extract",
+    "raw_load",
+    "s3_archive",
+    "transform",
+    "lead_load",
+    "persona_mapping",
+]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Returns the q-th percentile of values, with linear interpolation.
+
+    Args:
+        values (list[float]): The values.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class StageStats:
+    """
+    Collects the latencies and record counts of one pipeline stage.
+
+    A latency is recorded per call of the stage, which is one request for
+    the extract stage, and one batch for the other stages.
+
+    Methods:
+        measure: Measures one call of the stage.
+        record: Records one call of the stage, measured by the caller.
+        summary: Returns the throughput and latency percentiles of the stage.
+    """
+
+    def __init__(self) -> None:
+        self.latencies: list[float] = []
+        self.records = 0
+        self.seconds = 0.0
+
+    @asynccontextmanager
+    async def measure(self, records: int) -> AsyncIterator[None]:
+        start = time.perf_counter()
+        yield
+        self.record(time.perf_counter() - start, records)
+
+    def record(self, latency: float, records: int) -> None:
+        self.latencies.append(latency)
+        self.records += records
+
+    def summary(self) -> dict:
+        return {
+            "records": self.records,
+            "calls": len(self.latencies),
+            "seconds": round(self.seconds, 6),
+            "records_per_sec": round(self.records / self.seconds, 2)
+            if self.seconds
+            else 0.0,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 3),
+        }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+class BenchmarkExtractor(AsyncExtractor):
+    """An AsyncExtractor that measures every request."""
+
+    def __init__(self, stats: StageStats, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def extract(self, email: str) -> Optional[dict]:
+        async with self.stats.measure(1):
+            return await super().extract(email)
+
+
+class BenchmarkBatchELT(BatchELT):
+    """
+    A BatchELT that measures its stages, for every flush: the raw load, from
+    right before its write until it is written, its archive, its transform
+    and the load of its leads.
+    """
+
+    def __init__(self, stats: dict[str, StageStats], **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.stage_stats = stats
+        self._writes_started: dict[int, float] = {}
+
+    async def archive_payloads(self, docs: list[Linkedin]) -> None:
+        self._writes_started[id(docs)] = time.perf_counter()
+        await super().archive_payloads(docs)
+
+    async def enqueue_flushed(self, docs: list[Linkedin]) -> None:
+        started = self._writes_started.pop(id(docs))
+        self.stage_stats["raw_load"].record(time.perf_counter() - started, len(docs))
+        await super().enqueue_flushed(docs)
+
+    async def archive_flushed(self, docs: list[Linkedin]) -> None:
+        async with self.stage_stats["s3_archive"].measure(len(docs)):
+            await super().archive_flushed(docs)
+
+    async def transform(self, docs: list[Linkedin]) -> list[Lead]:
+        async with self.stage_stats["transform"].measure(len(docs)):
+            return await super().transform(docs)
+
+    async def load_leads(self, leads: list[Lead]) -> None:
+        async with self.stage_stats["lead_load"].measure(len(leads)):
+            await super().load_leads(leads)
+
+
+class PipelineBenchmark:
+    """
+    Benchmarks the pipeline stages against local stand-ins.
+
+    The LinkedIn API is the in-process FastAPI mock, serving synthetic
+    profiles, S3 is moto, and MongoDB is mongomock-motor, or a local mongod
+    when `mongo_uri` is given. The extract, load, archive and transform stages
+    run as a BatchELT, so they overlap as they do in production: their
+    throughput is that of the whole batch ELT, and their latencies tell them
+    apart. Persona mapping runs once the batch ELT is done.
+
+    Attributes:
+        sizes (list[int]): The dataset sizes to run.
+        batch_size (int): The number of records per batch.
+        max_in_flight (int): The maximum number of concurrent API requests.
+        mongo_uri (Optional[str]): The URI of a local mongod, mongomock-motor if None.
+        database (str): The database the benchmark writes to, it is emptied first.
+
+    Methods:
+        run: Runs the benchmark for every size, and returns the report.
+        run_size: Runs the benchmark for one size.
+    """
+
+    def __init__(
+        self,
+        sizes: list[int],
+        batch_size: int = 500,
+        max_in_flight: int = 64,
+        mongo_uri: Optional[str] = None,
+        database: str = "prospects_benchmark",
+        seed: int = 0,
+    ) -> None:
+        self.sizes = sizes
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.mongo_uri = mongo_uri
+        self.database = database
+        self.generator = ProfileGenerator(seed=seed)
+        self.s3_connector: Optional[S3Connector] = None
+
+    async def init_mongo(self) -> None:
+        if self.mongo_uri is None:
+            try:
+                from mongomock_motor import AsyncMongoMockClient
+            except ImportError:
+                raise ImportError(
+                    "The benchmark requires mongomock-motor, or --mongo-uri "
+                    "pointing to a local mongod"
+                )
+
+            client = AsyncMongoMockClient()
+        else:
+            client = AsyncIOMotorClient(self.mongo_uri)
+        # The pipeline registers its models on the default URI and database:
+        # they are routed to this client, and registered there first, so the
+        # pipeline finds them registered and they stay on the benchmark database
+        connection_manager.use_client(client, MongoConfig.MONGO_URI)
+        models = [Linkedin, Lead, Persona, PersonaLead]
+        await connection_manager.init(database=MONGODB_DB_NAME, document_models=models)
+        await connection_manager.init(database=self.database, document_models=models)
+        # Registering the models does not build their indexes
+        await build_indexes(models)
+
+    def batches(self, items: list) -> list[list]:
+        return [
+            items[start : start + self.batch_size]
+            for start in range(0, len(items), self.batch_size)
+        ]
+
+    def serve(self, n: int) -> Iterator[str]:
+        """
+        Generates profiles, and serves each one from the mock API right before
+        its email is yielded, so the dataset is never held in memory.
+
+        Args:
+            n (int): The number of profiles.
+
+        Returns:
+            Iterator[str]: The emails of the profiles.
+        """
+        server.app.state.profiles = server.ProfileIndex(fallback_to_default=False)
+        for profile in self.generator.generate(n):
+            server.app.state.profiles.add(profile)
+            yield profile["person"]["emails"][0]
+
+    async def run_size(self, n: int) -> dict:
+        """
+        Runs the benchmark for one dataset size.
+
+        Args:
+            n (int): The number of profiles.
+
+        Returns:
+            dict: The summary of every stage.
+        """
+        stats = {stage: StageStats() for stage in STAGES}
+        for model in (Linkedin, Lead, Persona, PersonaLead):
+            await model.get_motor_collection().delete_many({})
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app))
+        extractor = BenchmarkExtractor(
+            stats["extract"],
+            linkedin_api="http://mock/get_linkedin_data/{email}",
+            max_in_flight=self.max_in_flight,
+            client=client,
+        )
+        batch_elt = BenchmarkBatchELT(
+            stats,
+            max_in_flight=self.max_in_flight,
+            extractor=extractor,
+            s3_connector=self.s3_connector,
+            batch_size=self.batch_size,
+        )
+        start = time.perf_counter()
+        try:
+            await batch_elt.run(self.serve(n))
+        finally:
+            await client.aclose()
+        seconds = time.perf_counter() - start
+        # Every stage but persona mapping runs in the batch ELT
+        for stage in STAGES[:-1]:
+            stats[stage].seconds = seconds
+
+        # Persona mapping
+        persona_mapper = PersonaMapper()
+        lead_ids = [lead["_id"] for lead in await Lead.get_motor_collection().find(
+            {}, {"_id": 1}
+        ).to_list(None)]
+        start = time.perf_counter()
+        for batch in self.batches(lead_ids):
+            async with stats["persona_mapping"].measure(len(batch)):
+                await persona_mapper.map_many(batch, batch_size=self.batch_size)
+        stats["persona_mapping"].seconds = time.perf_counter() - start
+
+        return {stage: stage_stats.summary() for stage, stage_stats in stats.items()}
+
+    async def run(self) -> dict:
+        """
+        Runs the benchmark for every dataset size.
+
+        Returns:
+            dict: The report, with the summary of every stage for every size.
+        """
+        report = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "mongo": self.mongo_uri or "mongomock",
+            "batch_size": self.batch_size,
+            "max_in_flight": self.max_in_flight,
+            "results": {},
+        }
+        with mock_aws():
+            self.s3_connector = S3Connector(
+                client=boto3.client("s3", region_name="us-east-1")
+            )
+            self.s3_connector.s3.create_bucket(Bucket=LINKEDIN_BUCKET)
+            try:
+                await self.init_mongo()
+                for n in self.sizes:
+                    logging.info(f"Benchmarking {n} profiles")
+                    report["results"][str(n)] = await self.run_size(n)
+            finally:
+                close()
+        return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages.")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000], help="Dataset sizes"
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument(
+        "--mongo-uri", help="URI of a local mongod, mongomock-motor is used otherwise"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file to write the report to")
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        PipelineBenchmark(
+            sizes=args.sizes,
+            batch_size=args.batch_size,
+            max_in_flight=args.max_in_flight,
+            mongo_uri=args.mongo_uri,
+            seed=args.seed,
+        ).run()
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        logging.info(f"Wrote benchmark report to {args.output}")
+    else:
+        print(output)
@@ -0,0 +1,172 @@
+import argparse
+import copy
+import csv
+import logging
+import os
+import random
+from typing import Iterator
+from utils.logging_config import setup_logging
+from utils import serialization
+
+setup_logging()
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "test_data")
+TEMPLATE_PATH = os.path.join(TEST_DATA_DIR, "linkedin_example.json")
+FIELDS_PATH = os.path.join(TEST_DATA_DIR, "field_of_study_exercise.csv")
+
+FIRST_NAMES = [
+    "Julien", "Marie", "Thomas", "Camille", "Lucas", "Emma", "Hugo", "Léa",
+    "Nathan", "Chloé", "Louis", "Manon", "Arthur", "Inès", "Jules", "Sarah",
+]
+LAST_NAMES = [
+    "Keraval", "Martin", "Bernard", "Dubois", "Durand", "Lefebvre", "Moreau",
+    "Laurent", "Simon", "Michel", "Garcia", "Roux", "Fournier", "Girard",
+]
+TITLES = [
+    "Co-founder & CEO", "Co-founder & COO", "Data Engineer", "Software Engineer",
+    "Product Manager", "Marketing Manager", "Sales Director", "Data Scientist",
+    "Head of Growth", "Business Developer", "CTO", "Account Executive",
+]
+SKILLS = [
+    "Python", "SQL", "MongoDB", "Spark", "Airflow", "Kubernetes", "Docker",
+    "Machine Learning", "Growth Marketing", "Salesforce", "Negotiation",
+    "Project Management", "Leadership", "Data Analysis", "AWS", "Terraform",
+]
+
+
+def load_fields_of_study(path: str = FIELDS_PATH) -> list[str]:
+    """
+    Loads the distinct fields of study of the exercise CSV file.
+
+    Args:
+        path (str): The path of the CSV file.
+
+    Returns:
+        list[str]: The fields of study, in file order.
+    """
+    with open(path, newline="") as f:
+        fields = (row["field_of_study"].strip() for row in csv.DictReader(f))
+        return list(dict.fromkeys(field for field in fields if field))
+
+
+class ProfileGenerator:
+    """
+    Generates deterministic variants of the LinkedIn profile fixture.
+
+    Every profile is derived from the template with a random generator
+    seeded by (seed, index), so a profile does not depend on the ones
+    generated before it, and runs with the same seed are reproducible.
+    Profiles vary in identity, email, education (with fields of study drawn
+    from the exercise CSV file), company size, positions and skills.
+
+    Attributes:
+        seed (int): The seed of the generator.
+
+    Methods:
+        profile: Generates the profile at an index.
+        generate: Generates a number of profiles.
+        write_ndjson: Writes a number of profiles to an NDJSON file.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        template_path: str = TEMPLATE_PATH,
+        fields_path: str = FIELDS_PATH,
+    ) -> None:
+        self.seed = seed
+        with open(template_path) as f:
+            self.template: dict = serialization.load(f)
+        self.fields_of_study = load_fields_of_study(fields_path)
+
+    def profile(self, index: int) -> dict:
+        """
+        Generates the profile at an index.
+
+        Args:
+            index (int): The index of the profile.
+
+        Returns:
+            dict: The profile, with the schema of the LinkedIn API.
+        """
+        rng = random.Random(f"{self.seed}:{index}")
+        profile = copy.deepcopy(self.template)
+        person = profile["person"]
+        company = profile["company"]
+
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        email = f"{first_name}.{last_name}.{index}@example.com".lower()
+        person["firstName"] = first_name
+        person["lastName"] = last_name
+        person["publicIdentifier"] = f"{first_name}-{last_name}-{index}".lower()
+        person["linkedInIdentifier"] = f"ACoAA{rng.getrandbits(128):032x}"
+        person["emails"] = [email]
+        person["followerCount"] = rng.randint(0, 20000)
+        person["connectionCount"] = rng.randint(0, 5000)
+
+        education = person["schools"]["educationHistory"]
+        person["schools"]["educationHistory"] = [
+            {**rng.choice(education), "fieldOfStudy": field, "degreeName": field}
+            for field in rng.sample(self.fields_of_study, rng.randint(1, 3))
+        ]
+        person["schools"]["educationsCount"] = len(
+            person["schools"]["educationHistory"]
+        )
+
+        positions = rng.sample(
+            person["positions"]["positionHistory"],
+            rng.randint(1, len(person["positions"]["positionHistory"])),
+        )
+        for position in positions:
+            position["title"] = rng.choice(TITLES)
+        person["positions"]["positionHistory"] = positions
+        person["positions"]["positionsCount"] = len(positions)
+
+        person["skills"] = rng.sample(person["skills"] + SKILLS, rng.randint(3, 20))
+
+        # Company sizes are spread evenly across orders of magnitude
+        company["employeeCount"] = int(10 ** rng.uniform(0, 5))
+        # credits_left and rate_limit_left are the quota of the API, not profile
+        # data, so they keep the values of the template
+        return profile
+
+    def generate(self, n: int, start: int = 0) -> Iterator[dict]:
+        """
+        Generates a number of profiles.
+
+        Args:
+            n (int): The number of profiles.
+            start (int): The index of the first profile.
+
+        Returns:
+            Iterator[dict]: The profiles.
+        """
+        for index in range(start, start + n):
+            yield self.profile(index)
+
+    def write_ndjson(self, path: str, n: int) -> None:
+        """
+        Writes a number of profiles to an NDJSON file, one profile per line.
+
+        Args:
+            path (str): The path of the file.
+            n (int): The number of profiles.
+
+        Returns:
+            None
+        """
+        with open(path, "wb") as f:
+            for profile in self.generate(n):
+                f.write(serialization.dumps(profile) + b"\n")
+        logging.info(f"Wrote {n} profiles to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic LinkedIn profiles.")
+    parser.add_argument("path", help="The NDJSON file to write")
+    parser.add_argument("-n", type=int, default=10000, help="Number of profiles")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generator")
+    args = parser.parse_args()
+
+    ProfileGenerator(seed=args.seed).write_ndjson(args.path, args.n)
@@ -0,0 +1,563 @@
+import argparse
+import asyncio
+import logging
+from typing import Iterable, Iterator, Optional
+from database.models.lead import Lead
+from database.models.linkedin_data import Linkedin, content_hash
+from database.mongodb_connector import init, close
+from database.s3_connector import S3Connector
+from database.s3_archiver import RawArchiver
+from database.bulk_writer import BulkWriter, raw_writer, lead_writer
+from data_pipeline.elt_process import ELT
+from data_pipeline.extractor import AsyncExtractor
+from data_pipeline.response_cache import ResponseCache, response_cache
+from data_pipeline.stages import Stage
+from utils.logging_config import setup_logging
+from utils.metrics import metrics, report
+from utils import serialization
+from configs import MONGODB_DB_NAME, ELTConfig, MetricsConfig, MongoConfig
+
+setup_logging()
+
+
+def read_emails(path: str) -> Iterator[str]:
+    """
+    Reads emails from a file, one per line.
+
+    Each line is either a plain email or a JSON object with an "email" key,
+    so both plain text lists and NDJSON exports can be used as input.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        Iterator[str]: The emails, in file order.
+    """
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                email = serialization.loads(line).get("email")
+                if email:
+                    yield email
+            else:
+                yield line
+
+
+class BatchELT:
+    """
+    Runs the ELT process for many emails, as a pipeline of concurrent stages.
+
+    The stages are connected by bounded queues, and each has its own number
+    of workers, so network and database I/O overlap, and a slow stage blocks
+    the stages feeding it instead of buffering without bound:
+
+    1. extract: `max_in_flight` workers request the LinkedIn API through a
+       shared AsyncExtractor.
+    2. load: `mongo_writers` workers load the extracted records into a raw
+       BulkWriter. Every flush of the writer is queued for the next stages.
+       In slim ingest mode, the full payloads of a flush are archived to an
+       object of their own, which is completed before the documents that
+       reference it are written.
+    3. archive: `s3_uploaders` workers archive every flush of raw documents
+       to an S3 object of its own, as compressed NDJSON.
+    4. transform: `transform_workers` workers transform flushes of raw
+       documents with one aggregation over exactly the flushed LinkedIn
+       identifiers, and write their leads.
+
+    Raw documents whose content hash matches the stored one are not written,
+    so unchanged profiles are neither archived nor transformed again. The
+    hashes of a flush are only stored once it is archived and transformed.
+
+    An email is processed once the flush of its raw document is written,
+    archived and transformed, or once it is found unchanged. Emails the API
+    has no profile for are missing, which is final. Emails whose extraction,
+    load, archive or transform failed are counted as failed, and kept in
+    `failed_emails` to be run again, every email of the flush for a flush
+    that failed. Emails left once the credits ran out are counted as left.
+
+    On shutdown, every stage drains its queue before the next one is
+    stopped, so every extracted record is loaded, archived and transformed.
+
+    Attributes:
+        max_in_flight (int): The number of extract workers.
+        mongo_writers (int): The number of load workers.
+        s3_uploaders (int): The number of archive workers.
+        transform_workers (int): The number of transform workers.
+        queue_size (int): The number of records buffered between extract and load.
+        batch_size (int): The number of raw documents per flush.
+        ingest_mode (str): "full" or "slim", see ELT.
+        extractor (AsyncExtractor): The extractor shared by all emails, reading
+            through the response cache, if any.
+        s3_connector (S3Connector): The S3 connector shared by all emails.
+        failed_emails (list[str]): The emails that failed in the last run.
+
+    Methods:
+        create: A class method that creates an initialized instance of BatchELT.
+        process: Extracts the data for one email, and queues it for loading.
+        load: Loads the raw data of one email into the raw writer.
+        enqueue_flushed: Queues a flush of raw documents for archiving and transforming.
+        drop_unchanged: Drops the payloads of unchanged raw documents.
+        archive_payloads: Archives the full payloads of a flush of slim documents.
+        archive_flushed: Archives a flush of raw documents to S3.
+        transform_loaded: Transforms a flush of raw documents, and loads its leads.
+        transform: Transforms a flush of raw documents to Lead documents.
+        load_leads: Writes the Lead documents of a flush.
+        run: Runs the ELT process for all the given emails.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = ELTConfig.MAX_IN_FLIGHT,
+        extractor: Optional[AsyncExtractor] = None,
+        s3_connector: Optional[S3Connector] = None,
+        mongo_writers: int = ELTConfig.MONGO_WRITERS,
+        s3_uploaders: int = ELTConfig.S3_UPLOADERS,
+        transform_workers: int = ELTConfig.TRANSFORM_WORKERS,
+        queue_size: int = ELTConfig.QUEUE_SIZE,
+        batch_size: int = MongoConfig.BULK_BATCH_SIZE,
+        ingest_mode: str = ELTConfig.INGEST_MODE,
+        rate_limit: float = ELTConfig.RATE_LIMIT,
+        min_credits: int = ELTConfig.MIN_CREDITS,
+        cache: Optional[ResponseCache] = None,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.mongo_writers = mongo_writers
+        self.s3_uploaders = s3_uploaders
+        self.transform_workers = transform_workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.ingest_mode = ingest_mode
+        self.extractor = extractor or AsyncExtractor(
+            max_in_flight=max_in_flight,
+            rate_limit=rate_limit,
+            min_credits=min_credits,
+            cache=cache,
+        )
+        self.s3_connector = s3_connector or S3Connector()
+        self.stats: dict[str, int] = {}
+        self.failed_emails: list[str] = []
+        self.raw_writer: Optional[BulkWriter] = None
+        # The emails of every LinkedIn identifier, from their load until their
+        # flush is archived and transformed
+        self._emails: dict[str, list[str]] = {}
+        # The steps left of every flush in progress, by id of its documents
+        self._steps: dict[int, set[str]] = {}
+        # Full payloads of slim documents by content hash, until they are
+        # archived, so a lead loaded again during a flush keeps its own payload
+        self._payloads: dict[str, dict] = {}
+        self._load: Optional[Stage] = None
+        self._archive: Optional[Stage] = None
+        self._transform: Optional[Stage] = None
+
+    @classmethod
+    async def create(cls, **kwargs):
+        self = BatchELT(**kwargs)
+        await self.init()
+        return self
+
+    async def init(self):
+        await init(database=MONGODB_DB_NAME, document_models=[Linkedin, Lead])
+
+    async def process(self, email: str) -> None:
+        """
+        Extracts the data for an email, and queues it for loading. Emails
+        without data (the request failed, or the credits ran out) count as
+        failed, and emails without a profile, or whose profile has no LinkedIn
+        identifier to load it on, as missing.
+
+        Args:
+            email (str): The email of the lead.
+
+        Returns:
+            None
+        """
+        data = await self.extractor.extract(email)
+        if data == {}:
+            self._record([email], "failed")
+        elif not ((data or {}).get("person") or {}).get("linkedInIdentifier"):
+            self._record([email], "missing")
+        else:
+            await self._load.put((email, data))
+
+    async def load(self, item: tuple[str, dict]) -> None:
+        """
+        Loads the raw data of an email into the raw writer.
+
+        Args:
+            item (tuple[str, dict]): The email and its extracted data.
+
+        Returns:
+            None
+        """
+        email, data = item
+        # Counted as failed unless its flush completes
+        self._emails.setdefault(data["person"]["linkedInIdentifier"], []).append(email)
+        if self.ingest_mode == "slim":
+            # The document gets its payload key when its flush archives it
+            self._payloads[content_hash(data)] = data
+        elt = ELT(
+            email=email,
+            data=data,
+            s3_connector=self.s3_connector,
+            raw_writer=self.raw_writer,
+            ingest_mode=self.ingest_mode,
+        )
+        await elt.async_load_mongo_raw()
+
+    async def enqueue_flushed(self, docs: list[Linkedin]) -> None:
+        """
+        Queues a flush of raw documents for archiving and transforming. Waits
+        while those stages are full, which holds back the load stage.
+
+        Args:
+            docs (list[Linkedin]): The raw documents that were written.
+
+        Returns:
+            None
+        """
+        self._steps[id(docs)] = {"archive", "transform"}
+        await self._archive.put(docs)
+        await self._transform.put(docs)
+
+    async def drop_unchanged(self, docs: list[Linkedin]) -> None:
+        """
+        Drops the payloads of raw documents that were not written because they
+        are unchanged, so they are neither archived nor transformed, and
+        counts their emails as processed.
+
+        Args:
+            docs (list[Linkedin]): The unchanged raw documents.
+
+        Returns:
+            None
+        """
+        for doc in docs:
+            self._payloads.pop(doc.content_hash, None)
+        self._count(docs, "processed")
+
+    def _record(self, emails: list[str], outcome: str) -> None:
+        self.stats[outcome] += len(emails)
+        if outcome == "failed":
+            self.failed_emails.extend(emails)
+
+    def _count(self, docs: list[Linkedin], outcome: str) -> None:
+        for doc in docs:
+            self._record(self._emails.pop(self.raw_writer.key_value(doc), []), outcome)
+
+    async def _step_done(self, docs: list[Linkedin], step: str) -> None:
+        steps = self._steps.get(id(docs))
+        if steps is None:
+            # Another step of the flush failed
+            return
+        steps.discard(step)
+        if not steps:
+            # Only now, so the documents are not skipped on the next run if
+            # their archive or transform failed
+            await self.raw_writer.save_hashes(docs)
+            del self._steps[id(docs)]
+            self._count(docs, "processed")
+
+    def _flush_failed(self, docs: list[Linkedin], error: Exception) -> None:
+        if self._steps.pop(id(docs), None) is not None:
+            self._count(docs, "failed")
+
+    async def archive_payloads(self, docs: list[Linkedin]) -> None:
+        """
+        Archives the full payloads of a flush of slim raw documents, before
+        they are written. Every payload is a member of an object of the flush,
+        which is completed before the documents get its key and their range in
+        it, so a written document never references a payload that is not
+        stored. If archiving fails, the documents are not written.
+
+        Args:
+            docs (list[Linkedin]): The raw documents about to be written.
+
+        Returns:
+            None
+        """
+        payloads = [(doc, self._payloads.pop(doc.content_hash, None)) for doc in docs]
+        payloads = [(doc, payload) for doc, payload in payloads if payload is not None]
+        if not payloads:
+            return
+        archiver = RawArchiver(s3_connector=self.s3_connector)
+
+        def archive() -> list[tuple[int, int]]:
+            with archiver:
+                return [archiver.write_member(payload) for _, payload in payloads]
+
+        with metrics.timer("elt_stage_seconds", stage="archive"):
+            ranges = await asyncio.to_thread(archive)
+        for (doc, _), (offset, length) in zip(payloads, ranges):
+            doc.payload_key = archiver.key
+            doc.payload_offset, doc.payload_length = offset, length
+        metrics.inc("elt_records_total", len(payloads), stage="archive")
+
+    async def archive_flushed(self, docs: list[Linkedin]) -> None:
+        """
+        Archives a flush of raw documents to S3. Slim documents are skipped,
+        since their full payloads were archived before they were written.
+
+        Args:
+            docs (list[Linkedin]): The raw documents that were written.
+
+        Returns:
+            None
+        """
+        records = [
+            # Serialized by pydantic, without building a dict first
+            doc.model_dump_json(
+                exclude={
+                    "id",
+                    "revision_id",
+                    "payload_key",
+                    "payload_offset",
+                    "payload_length",
+                }
+            ).encode()
+            for doc in docs
+            if not doc.payload_key
+        ]
+        if records:
+
+            def archive() -> None:
+                with RawArchiver(s3_connector=self.s3_connector) as archiver:
+                    archiver.write_many(records)
+
+            with metrics.timer("elt_stage_seconds", stage="archive"):
+                await asyncio.to_thread(archive)
+            metrics.inc("elt_records_total", len(records), stage="archive")
+        await self._step_done(docs, "archive")
+
+    async def transform_loaded(self, docs: list[Linkedin]) -> None:
+        """
+        Transforms the raw documents of a raw writer flush to Lead documents,
+        and writes them, so the emails of the flush are only processed once
+        their leads are stored.
+
+        Args:
+            docs (list[Linkedin]): The raw documents that were written.
+
+        Returns:
+            None
+        """
+        await self.load_leads(await self.transform(docs))
+        await self._step_done(docs, "transform")
+
+    async def transform(self, docs: list[Linkedin]) -> list[Lead]:
+        """
+        Transforms the raw documents of a raw writer flush to Lead documents,
+        with one aggregation over exactly their LinkedIn identifiers.
+
+        Args:
+            docs (list[Linkedin]): The raw documents that were written.
+
+        Returns:
+            list[Lead]: The transformed Lead documents.
+        """
+        linkedin_ids = [
+            linkedin_id
+            for linkedin_id in map(self.raw_writer.key_value, docs)
+            if linkedin_id is not None
+        ]
+        if not linkedin_ids:
+            return []
+        return await ELT.transform_many(linkedin_ids)
+
+    async def load_leads(self, leads: list[Lead]) -> None:
+        """
+        Writes the Lead documents of a flush, with one bulk write.
+
+        Args:
+            leads (list[Lead]): The Lead documents.
+
+        Returns:
+            None
+        """
+        if not leads:
+            return
+        writer = lead_writer(max_batch_size=len(leads) + 1)
+        for lead in leads:
+            await writer.add(lead)
+        await writer.flush()
+
+    def _failed(self, email: str, error: Exception) -> None:
+        self._record([email], "failed")
+
+    async def run(self, emails: Iterable[str]) -> dict:
+        """
+        Runs the ELT process for all the given emails.
+
+        The emails are consumed lazily, as the extract stage has room for
+        them, so the input can be much larger than what fits in memory.
+
+        Args:
+            emails (Iterable[str]): The emails to process.
+
+        Returns:
+            dict: The number of processed, missing, failed and left emails.
+        """
+        self.stats = {"processed": 0, "missing": 0, "failed": 0, "left": 0}
+        self.failed_emails = []
+        extract = Stage(
+            "extract",
+            self.process,
+            self.max_in_flight,
+            self.max_in_flight,
+            on_error=self._failed,
+        )
+        # Emails whose load failed are never flushed, and are left in
+        # `_emails` to be counted as failed with the unflushed ones
+        self._load = Stage("load", self.load, self.mongo_writers, self.queue_size)
+        # Queued flushes hold whole batches, so only a few are buffered
+        self._archive = Stage(
+            "archive",
+            self.archive_flushed,
+            self.s3_uploaders,
+            self.s3_uploaders,
+            on_error=self._flush_failed,
+        )
+        self._transform = Stage(
+            "transform",
+            self.transform_loaded,
+            self.transform_workers,
+            self.transform_workers,
+            on_error=self._flush_failed,
+        )
+        stages = [extract, self._load, self._archive, self._transform]
+        try:
+            self._archive.start()
+            self._transform.start()
+            async with raw_writer(
+                max_batch_size=self.batch_size,
+                on_flush=self.enqueue_flushed,
+                on_unchanged=self.drop_unchanged,
+                before_write=self.archive_payloads,
+            ) as self.raw_writer:
+                self._load.start()
+                extract.start()
+                emails = iter(emails)
+                for email in emails:
+                    if self.extractor.credits_exhausted:
+                        # Counted as they are read, without holding them
+                        self.stats["left"] = 1 + sum(1 for _ in emails)
+                        logging.warning(
+                            f"Out of credits, the next {self.stats['left']} "
+                            "emails are left"
+                        )
+                        break
+                    await extract.put(email)
+                await extract.join()
+                await self._load.join()
+            # The raw writer has exited, so its last flush is queued
+            await self._archive.join()
+            await self._transform.join()
+            # Loaded, but never written (a write of their flush failed)
+            for emails in self._emails.values():
+                self._record(emails, "failed")
+        except BaseException:
+            for stage in stages:
+                await stage.cancel()
+            raise
+        finally:
+            self._emails = {}
+            self._steps = {}
+            self._payloads = {}
+            self.raw_writer = None
+            await self.extractor.close()
+
+        stats = dict(self.stats)
+        logging.info("Batch ELT finished: %s", stats)
+        for outcome, count in stats.items():
+            metrics.inc("batch_elt_emails_total", count, outcome=outcome)
+        return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the ELT process for many emails.")
+    parser.add_argument("path", help="File with one email (or JSON object) per line")
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=ELTConfig.MAX_IN_FLIGHT,
+        help="Maximum number of concurrent API requests",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=ELTConfig.RATE_LIMIT,
+        help="Maximum API requests per second, 0 for no limit",
+    )
+    parser.add_argument(
+        "--min-credits",
+        type=int,
+        default=ELTConfig.MIN_CREDITS,
+        help="Stop extracting once the API reports this many credits left",
+    )
+    parser.add_argument(
+        "--bypass-cache",
+        action="store_true",
+        help="Fetch every email from the API, and refresh the response cache",
+    )
+    parser.add_argument(
+        "--mongo-writers",
+        type=int,
+        default=ELTConfig.MONGO_WRITERS,
+        help="Number of workers loading raw data into MongoDB",
+    )
+    parser.add_argument(
+        "--s3-uploaders",
+        type=int,
+        default=ELTConfig.S3_UPLOADERS,
+        help="Number of workers archiving raw data to S3",
+    )
+    parser.add_argument(
+        "--transform-workers",
+        type=int,
+        default=ELTConfig.TRANSFORM_WORKERS,
+        help="Number of workers transforming raw data to leads",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=MongoConfig.BULK_BATCH_SIZE,
+        help="Number of raw documents per flush",
+    )
+    parser.add_argument(
+        "--ingest-mode",
+        choices=["full", "slim"],
+        default=ELTConfig.INGEST_MODE,
+        help="Store whole payloads in MongoDB, or only their core fields",
+    )
+    parser.add_argument(
+        "--metrics-output",
+        default=MetricsConfig.OUTPUT,
+        help="File to write the metrics to, when METRICS_ENABLED=1",
+    )
+    args = parser.parse_args()
+
+    async def main():
+        cache = response_cache(bypass=args.bypass_cache)
+        try:
+            batch_elt = await BatchELT.create(
+                max_in_flight=args.max_in_flight,
+                rate_limit=args.rate_limit,
+                min_credits=args.min_credits,
+                cache=cache,
+                mongo_writers=args.mongo_writers,
+                s3_uploaders=args.s3_uploaders,
+                transform_workers=args.transform_workers,
+                batch_size=args.batch_size,
+                ingest_mode=args.ingest_mode,
+            )
+            await batch_elt.run(read_emails(args.path))
+        finally:
+            if cache:
+                cache.close()
+            close()
+            report(args.metrics_output)
+
+    asyncio.run(main())
+    logging.info("Successfully completed the batch ELT process!")
@@ -1,15 +1,20 @@
 import requests
 import logging
-import json
 import asyncio
 from beanie import Document
 from typing import Optional, Any
 from database.models.lead import Lead, LeadView
-from database.models.linkedin_data import Linkedin
+from database.models.linkedin_data import Linkedin, content_hash
 from database.s3_connector import S3Connector
-from database.mongodb_connector import init
+from database.s3_archiver import partition_prefix
+from database import bulk_writer
+from database.bulk_writer import BulkWriter
+from database.mongodb_connector import init, close
+from data_pipeline.response_cache import ResponseCache, response_cache
 from utils.logging_config import setup_logging
-from configs import LINKEDIN_BUCKET, MONGODB_DB_NAME
+from utils.metrics import metrics, report, timed
+from utils import serialization
+from configs import LINKEDIN_BUCKET, MONGODB_DB_NAME, ELTConfig
 
 setup_logging()
 
@@ -27,6 +32,10 @@ class ELT:
         s3_connector (S3Connector): An instance of the S3Connector class.
         data (Optional[dict]): The extracted data from LinkedIn API.
         mongodb_conn: The MongoDB connection object.
+        ingest_mode (str): "full" to store the whole payload in MongoDB, "slim" to
+            only store its core fields, and reference the payload in S3.
+        payload_key (str): The S3 key of the full payload, for slim documents.
+        cache (Optional[ResponseCache]): The cache of API responses, if any.
 
     Methods:
         extract: Extracts data from LinkedIn API.
@@ -36,65 +45,104 @@ class ELT:
 
     """
 
-    default_linkedin_api = "http://127.0.0.1:8000/get_linkedin_data/{email}"
-
-    def __init__(self, email: Optional[str] = None) -> None:
+    default_linkedin_api = ELTConfig.LINKEDIN_API
+
+    def __init__(
+        self,
+        email: Optional[str] = None,
+        data: Optional[dict] = None,
+        s3_connector: Optional[S3Connector] = None,
+        raw_writer: Optional[BulkWriter] = None,
+        lead_writer: Optional[BulkWriter] = None,
+        ingest_mode: str = ELTConfig.INGEST_MODE,
+        payload_key: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+    ) -> None:
+        if ingest_mode not in ("full", "slim"):
+            raise ValueError(f"Unsupported ingest mode: {ingest_mode}")
         self.email = email
-        self.s3_connector = S3Connector()
+        self.ingest_mode = ingest_mode
+        self.cache = cache
+        self.s3_connector = s3_connector or S3Connector()
+        # Shared writers buffer across ELT instances, otherwise every write is flushed
+        self.raw_writer = raw_writer
+        self.lead_writer = lead_writer
         self.mongodb_conn = None
         self.linkedin_api: str = (
             self.default_linkedin_api.format(email=self.email)
             or self.default_linkedin_api
         )
         self.doc: Optional[Document] = None
-        self.data: Optional[dict] = self.extract()
+        # Data that was already extracted (e.g. by a batch run) skips the request
+        self.data: Optional[dict] = data if data is not None else self.extract()
+        # Batch runs archive payloads elsewhere, single runs upload them with load_s3
+        self.payload_key: str = payload_key or self.s3_key
 
     @classmethod
-    async def create(cls, email: Optional[str] = None):
-        self = ELT(email=email)
+    async def create(cls, email: Optional[str] = None, **kwargs):
+        self = ELT(email=email, **kwargs)
         await self.init()
         return self
 
     async def init(self):
         await init(database=MONGODB_DB_NAME, document_models=[Linkedin, Lead])
 
+    @timed("elt_stage_seconds", stage="extract")
     def extract(self) -> dict:
         """
-        Extracts data from LinkedIn API.
+        Extracts data from LinkedIn API, or from the response cache.
 
         Returns:
             dict: The extracted data from LinkedIn API.
         """
+        if self.cache and self.email:
+            data = self.cache.get(self.email)
+            if data is not None:
+                logging.info("Extracted data from the response cache")
+                return data
         try:
-            resp = requests.get(self.linkedin_api)
+            resp = requests.get(self.linkedin_api, timeout=ELTConfig.REQUEST_TIMEOUT)
             logging.info("Extracted data from LinkedIn")
-            return resp.json()
+            data = serialization.loads(resp.content)
         except Exception as e:
             logging.error(f"Failed to extract data from LinkedIn: {e}")
             return {}
+        if self.cache and self.email:
+            self.cache.put(self.email, data)
+        return data
 
+    @timed("elt_stage_seconds", stage="load_s3")
     def load_s3(self) -> None:
         """
         Loads the raw data into S3.
 
         This method converts the raw data to JSON format and uploads it to
-        the specified S3 bucket.
+        the specified S3 bucket, under a per-lead key in today's partition.
+        Batches of leads are archived with a RawArchiver instead.
 
         Returns:
             None
         """
-        json_data = json.dumps(self.data).encode()
+        json_data = serialization.dumps(self.data)
         # Upload the raw data to s3
         self.s3_connector.put_object(
-            bucket=LINKEDIN_BUCKET, key="raw.json", body=json_data
+            bucket=LINKEDIN_BUCKET, key=self.s3_key, body=json_data
         )
 
+    @property
+    def s3_key(self) -> str:
+        """The S3 key of the raw data of this lead."""
+        return f"{partition_prefix()}/{self.linkedin_id or self.email}.json"
+
+    @timed("elt_stage_seconds", stage="load_mongo_raw")
     async def async_load_mongo_raw(self) -> None:
         """
         Loads the raw data into MongoDB.
 
-        This method initializes the database and inserts the raw data into the
-        MongoDB collection. If there is no data available, it logs a message.
+        This method initializes the database and upserts the raw data into the
+        MongoDB collection, keyed on the LinkedIn identifier. In slim mode, only
+        the core fields are stored, with a reference to the payload in S3. If
+        there is no data available, it logs a message.
 
         Returns:
             None
@@ -103,53 +151,147 @@ class ELT:
         # Insert the raw data to mongodb
 
         if self.data:
-            raw_linkedin_data = Linkedin(
-                credits_left=self.data["credits_left"],
-                person=self.data["person"],
-                rate_limit_left=self.data["rate_limit_left"],
-                success=self.data["success"],
+            slim = self.ingest_mode == "slim"
+            raw_linkedin_data = Linkedin.from_payload(
+                self.data, slim=slim, payload_key=self.payload_key if slim else None
+            )
+            await self._write(
+                raw_linkedin_data, self.raw_writer or bulk_writer.raw_writer()
             )
-            await raw_linkedin_data.insert()
             logging.info("Successfully inserted!")
 
         else:
             logging.info("No data")
 
+    async def is_unchanged(self) -> bool:
+        """
+        Returns whether the raw document stored for this lead has the same
+        content as the extracted data.
+
+        Returns:
+            bool: True if the profile is unchanged.
+        """
+        await init(database=MONGODB_DB_NAME, document_models=[Linkedin])
+        if not self.data or not self.linkedin_id:
+            return False
+        stored = await Linkedin.get_motor_collection().find_one(
+            {
+                "person.linkedInIdentifier": self.linkedin_id,
+                "content_hash": content_hash(self.data),
+            },
+            {"_id": 1},
+        )
+        return stored is not None
+
+    async def save_content_hash(self) -> None:
+        """
+        Stores the content hash of the extracted data on its raw document, so
+        the profile is skipped while unchanged. Called once its lead is stored,
+        so a run that failed on the way is not skipped by the next one.
+
+        Returns:
+            None
+        """
+        if not self.data or not self.linkedin_id:
+            return
+        await Linkedin.get_motor_collection().update_one(
+            {"person.linkedInIdentifier": self.linkedin_id},
+            {"$set": {"content_hash": content_hash(self.data)}},
+        )
+
+    async def _write(self, doc: Document, writer: BulkWriter) -> None:
+        await writer.add(doc)
+        if writer not in (self.raw_writer, self.lead_writer):
+            await writer.flush()
+
+    @property
+    def linkedin_id(self) -> Optional[str]:
+        """The LinkedIn identifier of the extracted data, if any."""
+        person = (self.data or {}).get("person")
+        if isinstance(person, dict):
+            return person.get("linkedInIdentifier")
+        return None
+
     async def transform(self) -> Any:
         """
-        Transforms the raw data from the Linkedin collection to a Lead document.
+        Transforms the raw document loaded by this ELT to a Lead document.
 
         Returns:
             Any: The result of the transformation process.
         """
         await init(database=MONGODB_DB_NAME, document_models=[Linkedin, Lead])
 
+        if not self.linkedin_id:
+            logging.info("No data")
+            return
+
         # Transform the raw data to a Lead document
-        result = await Linkedin.find().sort("-_id").project(LeadView).limit(1).to_list()
+        result = await self.transform_many([self.linkedin_id])
         if result:
-            logging.info(f"Found and Transformed {len(result)} documents")
-            self.doc = Lead(
-                linkedin_id=result[0].linkedin_id,
-                status=result[0].status,
-                first_name=result[0].first_name,
-                last_name=result[0].last_name,
-                email=result[0].email,
-                photo_url=result[0].photo_url,
+            self.doc = result[0]
+            logging.info(f"Transformed lead {self.doc.linkedin_id}")
+
+    @staticmethod
+    @timed("elt_stage_seconds", stage="transform")
+    async def transform_many(linkedin_ids: list[str]) -> list[Lead]:
+        """
+        Transforms the raw documents with the given LinkedIn identifiers to Lead
+        documents, with one aggregation. Only the latest written raw document
+        of every identifier is transformed.
+
+        Args:
+            linkedin_ids (list[str]): The LinkedIn identifiers of the raw documents.
+
+        Returns:
+            list[Lead]: The transformed Lead documents.
+        """
+        # The projection model adds the $project stage of LeadView.Settings.projection
+        result = (
+            await Linkedin.find({"person.linkedInIdentifier": {"$in": linkedin_ids}})
+            .aggregate(
+                [
+                    # _id is a random uuid, only updated_at orders the documents
+                    {"$sort": {"updated_at": -1}},
+                    {
+                        "$group": {
+                            "_id": "$person.linkedInIdentifier",
+                            "latest": {"$first": "$$ROOT"},
+                        }
+                    },
+                    {"$replaceRoot": {"newRoot": "$latest"}},
+                ],
+                projection_model=LeadView,
             )
-        logging.info(result[0])
+            .to_list()
+        )
+        logging.info(f"Found and Transformed {len(result)} documents")
+        metrics.inc("elt_records_total", len(result), stage="transform")
+        return [
+            Lead(
+                linkedin_id=view.linkedin_id,
+                status=view.status,
+                first_name=view.first_name,
+                last_name=view.last_name,
+                email=view.email,
+                photo_url=view.photo_url,
+            )
+            for view in result
+        ]
 
+    @timed("elt_stage_seconds", stage="load_mongo_transformed")
     async def load_mongo_transformed(self) -> None:
         """
         Loads the transformed data into MongoDB.
 
-        This method inserts the transformed data into the MongoDB collection.
+        This method upserts the transformed data into the MongoDB collection,
+        keyed on the LinkedIn identifier.
 
         Returns:
             None
         """
         await init(database=MONGODB_DB_NAME, document_models=[Lead])
         if self.doc:
-            await self.doc.insert()
+            await self._write(self.doc, self.lead_writer or bulk_writer.lead_writer())
             logging.info("Successfully inserted!")
         else:
             logging.info("No data")
@@ -158,16 +300,38 @@ class ELT:
         """
         Main method for the ELT process.
 
-        This method orchestrates the Extract, Load, and Transform process.
+        This method orchestrates the Extract, Load, and Transform process. In
+        slim mode, the payload is uploaded to S3 before the document that
+        references it is written. Unchanged profiles are neither loaded nor
+        transformed again, and a profile is only recorded as unchanged once
+        its lead is stored.
 
         Returns:
             None
         """
+        if await self.is_unchanged():
+            logging.info(f"Lead {self.linkedin_id} is unchanged, skipping")
+            metrics.inc("mongo_documents_unchanged_total", collection="Linkedin")
+            return
+        if self.ingest_mode == "slim" and self.data:
+            await asyncio.to_thread(self.load_s3)
         await self.async_load_mongo_raw()
         await self.transform()
         await self.load_mongo_transformed()
+        await self.save_content_hash()
 
 
 if __name__ == "__main__":
-    asyncio.run(ELT().main())
+
+    async def main():
+        cache = response_cache()
+        try:
+            await ELT(cache=cache).main()
+        finally:
+            if cache:
+                cache.close()
+            close()
+            report()
+
+    asyncio.run(main())
     logging.info("Successfully completed the ELT process!")
@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import random
+import time
+import httpx
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from data_pipeline.response_cache import ResponseCache
+from utils.logging_config import setup_logging
+from utils.metrics import metrics, timed
+from utils import serialization
+from configs import ELTConfig
+
+setup_logging()
+
+# Statuses worth retrying, the others will not change on a retry
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Limits the rate of requests, with bursts of up to `capacity` requests.
+
+    Attributes:
+        rate (float): The requests per second, 0 for no limit.
+        capacity (float): The maximum number of tokens.
+
+    Methods:
+        acquire: Waits for a token.
+        pause: Holds back every request for a number of seconds.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # Waiters are served in order, one at a time
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    return
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        self._updated = max(self._updated, self._paused_until)
+
+
+def retry_after(resp: httpx.Response) -> Optional[float]:
+    """Returns the seconds of the Retry-After header of a response, if any."""
+    try:
+        return max(0.0, float(resp.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return None
+
+
+class AsyncExtractor:
+    """
+    Async client for the LinkedIn API, that paces itself on the quota of the
+    provider.
+
+    The extractor shares one HTTP connection pool between all requests, and
+    paces them in three ways:
+    - A token bucket caps the request rate at `rate_limit` per second.
+    - Concurrency adapts to the quota: every response caps the requests in
+      flight at its `rate_limit_left`, and otherwise lets one more request in,
+      up to `max_in_flight`. A 429 halves it, and holds back every request
+      for its Retry-After.
+    - Once a response reports `min_credits` credits left or fewer, no more
+      requests are sent.
+    Timeouts, transport errors, 429 and 5xx responses are retried up to
+    `max_retries` times, after an exponential backoff with full jitter.
+    Responses found in `cache` skip all of the above.
+
+    Attributes:
+        linkedin_api (str): The URL template of the LinkedIn API.
+        max_in_flight (int): The maximum number of concurrent requests.
+        timeout (float): The per-request timeout, in seconds.
+        rate_limit (float): The maximum requests per second, 0 for no limit.
+        max_retries (int): The number of retries of a failed request.
+        backoff_base (float): The backoff of the first retry, in seconds.
+        backoff_max (float): The maximum backoff, in seconds.
+        min_credits (int): The credits left at which requests stop.
+        limit (int): The current maximum number of concurrent requests.
+        credits_exhausted (bool): Whether requests stopped for lack of credits.
+        cache (Optional[ResponseCache]): The cache of API responses, if any.
+
+    Methods:
+        extract: Extracts the data for one email from the LinkedIn API.
+        close: Closes the underlying HTTP client.
+    """
+
+    def __init__(
+        self,
+        linkedin_api: str = ELTConfig.LINKEDIN_API,
+        max_in_flight: int = ELTConfig.MAX_IN_FLIGHT,
+        timeout: float = ELTConfig.REQUEST_TIMEOUT,
+        client: Optional[httpx.AsyncClient] = None,
+        rate_limit: float = ELTConfig.RATE_LIMIT,
+        max_retries: int = ELTConfig.MAX_RETRIES,
+        backoff_base: float = ELTConfig.BACKOFF_BASE,
+        backoff_max: float = ELTConfig.BACKOFF_MAX,
+        min_credits: int = ELTConfig.MIN_CREDITS,
+        cache: Optional[ResponseCache] = None,
+    ) -> None:
+        self.linkedin_api = linkedin_api
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.min_credits = min_credits
+        self.limit = max_in_flight
+        self.credits_exhausted = False
+        self.cache = cache
+        self._bucket = TokenBucket(rate_limit)
+        self._in_flight = 0
+        self._slots = asyncio.Condition()
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_in_flight,
+                max_keepalive_connections=max_in_flight,
+            ),
+        )
+
+    async def __aenter__(self) -> "AsyncExtractor":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._owns_client:
+            await self.client.aclose()
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._slots:
+                self._in_flight -= 1
+                self._slots.notify_all()
+
+    def _set_limit(self, limit: int) -> None:
+        limit = max(1, min(self.max_in_flight, limit))
+        if limit != self.limit:
+            logging.debug(f"Extractor concurrency: {self.limit} -> {limit}")
+            self.limit = limit
+
+    def _observe(self, data: dict) -> None:
+        """Adapts to the quota reported by a response."""
+        rate_limit_left = data.get("rate_limit_left")
+        if isinstance(rate_limit_left, int):
+            self._set_limit(min(rate_limit_left, self.limit + 1))
+        credits_left = data.get("credits_left")
+        if (
+            isinstance(credits_left, int)
+            and credits_left <= self.min_credits
+            and not self.credits_exhausted
+        ):
+            logging.warning(f"{credits_left} credits left, no more requests are sent")
+            self.credits_exhausted = True
+
+    def _throttled(self, delay: Optional[float]) -> None:
+        self._set_limit(self.limit // 2)
+        if delay:
+            self._bucket.pause(delay)
+
+    def _backoff(self, attempt: int, delay: Optional[float]) -> float:
+        if delay is not None:
+            return delay
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    @timed("elt_stage_seconds", stage="extract")
+    async def extract(self, email: str) -> Optional[dict]:
+        """
+        Extracts data for a given email from the LinkedIn API.
+
+        Args:
+            email (str): The email of the lead.
+
+        Returns:
+            Optional[dict]: The extracted data, an empty dict if the request
+                failed or the credits ran out, or None if the API has no
+                profile for the email.
+        """
+        if self.cache:
+            # SQLite blocks, so the cache is read and written in a thread
+            data = await asyncio.to_thread(self.cache.get, email)
+            if data is not None:
+                metrics.inc("extract_requests_total", outcome="cached")
+                return data
+        if self.credits_exhausted:
+            metrics.inc("extract_requests_total", outcome="no_credits")
+            return {}
+        url = self.linkedin_api.format(email=email)
+        async with self._slot():
+            for attempt in range(self.max_retries + 1):
+                await self._bucket.acquire()
+                delay = None
+                try:
+                    resp = await self.client.get(url)
+                    if resp.status_code in RETRY_STATUSES:
+                        delay = retry_after(resp)
+                        if resp.status_code == 429:
+                            self._throttled(delay)
+                        resp.raise_for_status()
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    error = e
+                else:
+                    if resp.status_code == 404:
+                        # Final, unlike the errors, so it is not retried later
+                        logging.info(f"No profile found for {email}")
+                        metrics.inc("extract_requests_total", outcome="not_found")
+                        return None
+                    try:
+                        resp.raise_for_status()
+                        data = serialization.loads(resp.content)
+                    except Exception as e:
+                        logging.error(f"Failed to extract data for {email}: {e!r}")
+                        metrics.inc("extract_requests_total", outcome="error")
+                        return {}
+                    if isinstance(data, dict):
+                        self._observe(data)
+                        if self.cache:
+                            await asyncio.to_thread(self.cache.put, email, data)
+                    metrics.inc("extract_requests_total", outcome="ok")
+                    return data
+                if attempt < self.max_retries:
+                    metrics.inc("extract_retries_total")
+                    await asyncio.sleep(self._backoff(attempt, delay))
+        logging.error(f"Failed to extract data for {email}: {error!r}")
+        metrics.inc("extract_requests_total", outcome="error")
+        return {}
@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import logging
+from typing import Iterable, Optional
+from database.job_queue import JobQueue
+from database.mongodb_connector import close
+from data_pipeline.batch_elt import BatchELT, read_emails
+from data_pipeline.response_cache import ResponseCache, response_cache
+from persona_mapping.persona_mapper import PersonaMapper, read_lead_ids
+from utils.logging_config import setup_logging
+from utils.metrics import report
+from configs import JobConfig, MetricsConfig
+
+setup_logging()
+
+KINDS = ("elt", "persona")
+
+
+class JobError(Exception):
+    """
+    Raised when some items of a job were not processed, so they are retried.
+
+    Attributes:
+        items (list[str]): The items that were not processed.
+    """
+
+    def __init__(self, message: str, items: list[str]) -> None:
+        super().__init__(message)
+        self.items = items
+
+
+class JobWorker:
+    """
+    Runs the jobs of a JobQueue: batch ELT runs for "elt" jobs, and persona
+    mappings for "persona" jobs.
+
+    A job fails, and is retried with a backoff, if it raises, or if some of
+    its emails were not processed (their extraction, load, archive or
+    transform failed, or the credits ran out before them), in which case only
+    those are retried. Emails the API has no profile for are a final result,
+    not a failure. The lease of a running job is renewed every
+    third of its duration. If the lease is lost (e.g. the worker stalled past it), the job is
+    cancelled, since another worker may already be running it.
+
+    Attributes:
+        queue (JobQueue): The queue the jobs are claimed from.
+        kinds (tuple[str]): The kinds of jobs this worker runs.
+        poll_interval (float): The seconds between two claims, when the queue
+            is empty.
+        cache (Optional[ResponseCache]): The cache of API responses of ELT jobs.
+
+    Methods:
+        handle: Runs one job, and returns its result.
+        run_job: Runs a claimed job while renewing its lease.
+        run: Claims and runs jobs, until the queue is empty or forever.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        kinds: Iterable[str] = KINDS,
+        poll_interval: float = JobConfig.POLL_INTERVAL,
+        cache: Optional[ResponseCache] = None,
+    ) -> None:
+        self.queue = queue
+        self.kinds = tuple(kinds)
+        self.poll_interval = poll_interval
+        self.cache = cache
+
+    async def handle(self, job: dict) -> dict:
+        """
+        Runs one job.
+
+        Args:
+            job (dict): The job.
+
+        Returns:
+            dict: The result of the job.
+
+        Raises:
+            JobError: If some emails of an ELT job were not processed.
+        """
+        if job["kind"] == "elt":
+            # The extractor of a batch is closed at the end of its run
+            batch_elt = await BatchELT.create(cache=self.cache)
+            stats = await batch_elt.run(job["items"])
+            # The emails left once the credits ran out are the last ones
+            left = job["items"][len(job["items"]) - stats["left"] :]
+            unprocessed = batch_elt.failed_emails + left
+            if unprocessed:
+                raise JobError(
+                    f"{len(unprocessed)} of {len(job['items'])} emails were not "
+                    f"processed: {stats}",
+                    unprocessed,
+                )
+            return stats
+        if job["kind"] == "persona":
+            persona_mapper = await PersonaMapper.create()
+            mappings = await persona_mapper.map_many(job["items"])
+            return {
+                "mapped": len(mappings),
+                "unmapped": len(job["items"]) - len(mappings),
+            }
+        raise ValueError(f"Unsupported job kind: {job['kind']}")
+
+    async def _renew(self, job: dict, task: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            if not await self.queue.heartbeat(job):
+                task.cancel()
+                return
+
+    async def run_job(self, job: dict) -> Optional[dict]:
+        """
+        Runs a claimed job while renewing its lease, then completes it, or
+        fails it so it is retried.
+
+        Args:
+            job (dict): The claimed job.
+
+        Returns:
+            Optional[dict]: The result of the job, None if it failed or its lease
+                was lost.
+        """
+        task = asyncio.create_task(self.handle(job))
+        renew = asyncio.create_task(self._renew(job, task))
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if renew.done():
+                logging.warning(f"Cancelled job {job['_id']}, its lease was lost")
+                return None
+            # The worker itself is shutting down
+            task.cancel()
+            await self.queue.release(job)
+            raise
+        except JobError as e:
+            await self.queue.fail(job, repr(e), items=e.items)
+            return None
+        except Exception as e:
+            await self.queue.fail(job, repr(e))
+            return None
+        finally:
+            renew.cancel()
+        await self.queue.complete(job, result)
+        logging.info(f"Completed {job['kind']} job {job['_id']}: {result}")
+        return result
+
+    async def run(self, once: bool = False) -> int:
+        """
+        Claims and runs jobs, one at a time.
+
+        Args:
+            once (bool): Return once no job is available, instead of polling.
+
+        Returns:
+            int: The number of jobs run.
+        """
+        jobs = 0
+        while True:
+            await self.queue.fail_expired()
+            job = await self.queue.claim(self.kinds)
+            if job is None:
+                if once:
+                    return jobs
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self.run_job(job)
+            jobs += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Distribute ELT and persona mapping jobs across workers."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    enqueue = subparsers.add_parser("enqueue", help="Enqueue emails or lead IDs")
+    enqueue.add_argument("kind", choices=KINDS)
+    enqueue.add_argument(
+        "path", help="File with one email (for elt) or lead ID (for persona) per line"
+    )
+    enqueue.add_argument(
+        "--batch-size",
+        type=int,
+        default=JobConfig.BATCH_SIZE,
+        help="Number of emails or lead IDs per job",
+    )
+    work = subparsers.add_parser("work", help="Run jobs")
+    work.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    work.add_argument(
+        "--once", action="store_true", help="Exit once no job is available"
+    )
+    work.add_argument(
+        "--metrics-output",
+        default=MetricsConfig.OUTPUT,
+        help="File to write the metrics to, when METRICS_ENABLED=1",
+    )
+    args = parser.parse_args()
+
+    async def main():
+        cache = None
+        try:
+            queue = await JobQueue.create()
+            if args.command == "enqueue":
+                read = read_emails if args.kind == "elt" else read_lead_ids
+                await queue.enqueue(args.kind, read(args.path), args.batch_size)
+                return
+            cache = response_cache()
+            await JobWorker(queue, kinds=args.kinds, cache=cache).run(once=args.once)
+        finally:
+            if cache:
+                cache.close()
+            close()
+            if args.command == "work":
+                report(args.metrics_output)
+
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from utils.logging_config import setup_logging
+from utils.metrics import metrics
+from utils import serialization
+from configs import ELTConfig
+
+setup_logging()
+
+
+def cache_key(email: str) -> str:
+    return email.strip().lower()
+
+
+class ResponseCache:
+    """
+    Cache of LinkedIn API responses, by normalized email, so replays and
+    retried batches spend neither credits nor requests.
+
+    Responses are stored in a SQLite database, and the most recently used
+    ones are also kept in memory. Entries expire `ttl` seconds after they
+    were fetched, and the least recently used entries are evicted once the
+    database holds more than `max_entries`. Access times are written to the
+    database in batches, with the next write, eviction or close, rather than
+    with a commit on every hit. Only successful responses are cached. The
+    cache can be shared by threads, and its calls block on disk, so async
+    code runs them in a thread.
+
+    Attributes:
+        path (str): The path of the SQLite database.
+        ttl (float): The seconds a response stays valid.
+        max_entries (int): The maximum number of responses on disk.
+        memory_entries (int): The number of responses kept in memory.
+        bypass (bool): Whether reads miss, so every response is fetched and
+            stored again.
+
+    Methods:
+        get: Returns the cached response of an email.
+        put: Caches the response of an email.
+        evict: Deletes the expired and least recently used responses.
+        close: Closes the database.
+    """
+
+    # Evicting takes a scan of the access times, so it runs every few writes
+    evict_every = 100
+    # The number of pending access times that are written at once
+    touch_every = 100
+
+    def __init__(
+        self,
+        path: str = ELTConfig.CACHE_PATH,
+        ttl: float = ELTConfig.CACHE_TTL,
+        max_entries: int = ELTConfig.CACHE_MAX_ENTRIES,
+        memory_entries: int = ELTConfig.CACHE_MEMORY_ENTRIES,
+        bypass: bool = False,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.bypass = bypass
+        self._memory: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        # Access times of disk hits, not written yet
+        self._accessed: dict[str, float] = {}
+        self._writes = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, body BLOB NOT NULL, "
+            "fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+            "ON responses (accessed_at)"
+        )
+        self._db.commit()
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _remember(self, key: str, fetched_at: float, body: bytes) -> None:
+        self._memory[key] = (fetched_at, body)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _touch(self) -> None:
+        if self._accessed:
+            self._db.executemany(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._accessed.items()],
+            )
+            self._accessed = {}
+
+    def get(self, email: str) -> Optional[dict]:
+        """
+        Returns the cached response of an email.
+
+        Args:
+            email (str): The email of the lead.
+
+        Returns:
+            Optional[dict]: The response, None if it is not cached, expired,
+                or the cache is bypassed.
+        """
+        if self.bypass:
+            return None
+        key = cache_key(email)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                metrics.inc("extract_cache_total", outcome="memory_hit")
+                return serialization.loads(entry[1])
+            row = self._db.execute(
+                "SELECT body, fetched_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                self._memory.pop(key, None)
+                metrics.inc("extract_cache_total", outcome="miss")
+                return None
+            body, fetched_at = row
+            self._accessed[key] = now
+            if len(self._accessed) >= self.touch_every:
+                self._touch()
+                self._db.commit()
+            self._remember(key, fetched_at, body)
+        metrics.inc("extract_cache_total", outcome="disk_hit")
+        return serialization.loads(body)
+
+    def put(self, email: str, data: dict) -> None:
+        """
+        Caches the response of an email, if it is a successful one.
+
+        Args:
+            email (str): The email of the lead.
+            data (dict): The response.
+
+        Returns:
+            None
+        """
+        if not data or data.get("success") is False:
+            return
+        key = cache_key(email)
+        body = serialization.dumps(data)
+        now = time.time()
+        with self._lock:
+            self._accessed.pop(key, None)
+            self._touch()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, body, now, now),
+            )
+            self._db.commit()
+            self._remember(key, now, body)
+            self._writes += 1
+            if self._writes % self.evict_every:
+                return
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Deletes the expired responses, then the least recently used ones
+        beyond `max_entries`.
+
+        Returns:
+            int: The number of deleted responses.
+        """
+        with self._lock:
+            self._touch()
+            deleted = self._db.execute(
+                "DELETE FROM responses WHERE fetched_at <= ?", (time.time() - self.ttl,)
+            ).rowcount
+            deleted += self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self._db.commit()
+        if deleted:
+            logging.info(f"Evicted {deleted} cached responses")
+        return deleted
+
+    def close(self) -> None:
+        with self._lock:
+            if self._accessed:
+                self._touch()
+                self._db.commit()
+            self._db.close()
+
+
+def response_cache(**kwargs) -> Optional[ResponseCache]:
+    """
+    Returns the response cache configured by ELTConfig, None if it is disabled.
+    """
+    return ResponseCache(**kwargs) if ELTConfig.CACHE_ENABLED else None
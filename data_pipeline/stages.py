@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+from utils.logging_config import setup_logging
+from utils.metrics import metrics
+
+setup_logging()
+
+# Put on a stage queue once per worker to stop it
+_STOP = object()
+
+
+class Stage:
+    """
+    A pool of async workers consuming a bounded queue.
+
+    Stages are chained by having the handler of one stage put its results
+    on the next stage, so a slow stage fills its queue and blocks the stages
+    feeding it, instead of buffering without bound. A failing item is logged
+    and passed to `on_error`, and never stops its worker, so an error cannot
+    leave a full queue without consumers.
+
+    Attributes:
+        name (str): The name of the stage, used in logs and metrics.
+        handler (Callable): Awaited with every item of the queue.
+        concurrency (int): The number of workers.
+        queue (asyncio.Queue): The bounded input queue of the stage.
+        on_error (Optional[Callable]): Called with the item and the exception of
+            every failed item.
+
+    Methods:
+        start: Starts the workers.
+        put: Puts an item on the queue, waiting while it is full.
+        join: Lets the workers drain the queue, then stops them.
+        cancel: Stops the workers without draining the queue.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[None]],
+        concurrency: int,
+        queue_size: int,
+        on_error: Optional[Callable[[Any, Exception], None]] = None,
+    ) -> None:
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.on_error = on_error
+        self._workers: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"{self.name}-{index}")
+            for index in range(self.concurrency)
+        ]
+
+    async def put(self, item: Any) -> None:
+        await self.queue.put(item)
+
+    async def _work(self) -> None:
+        while True:
+            item = await self.queue.get()
+            if item is _STOP:
+                return
+            try:
+                await self.handler(item)
+            except Exception as e:
+                logging.error(f"Stage {self.name} failed: {e!r}")
+                metrics.inc("elt_stage_errors_total", stage=self.name)
+                if self.on_error:
+                    self.on_error(item, e)
+
+    async def join(self) -> None:
+        """
+        Lets the workers drain the queue, then stops them. Items put after
+        `join` is called are not processed.
+
+        Returns:
+            None
+        """
+        for _ in self._workers:
+            await self.queue.put(_STOP)
+        await asyncio.gather(*self._workers)
+        self._workers = []
+
+    async def cancel(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
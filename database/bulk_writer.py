@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from beanie import Document
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import Any, Awaitable, Callable, Optional, Type
+from .models.lead import Lead
+from .models.linkedin_data import Linkedin
+from utils.logging_config import setup_logging
+from utils.metrics import metrics
+from configs import MongoConfig
+
+setup_logging()
+
+
+class BulkWriter:
+    """
+    Buffers documents and writes them with unordered bulk upserts.
+
+    Documents are upserted on `key` (a dotted field path), so writing the same
+    record twice updates the existing document instead of creating a new one.
+    Documents without a key value are inserted as they are. The buffer is
+    flushed when it holds `max_batch_size` documents, when the oldest buffered
+    document is older than `flush_interval` seconds, and on exit. On exit, a
+    timed flush in progress is awaited rather than cancelled, and its error,
+    if any, is raised. If some documents of a flush fail, `on_flush` still
+    gets the ones that were written, before the error is raised.
+
+    `before_write` is awaited with the documents of every flush right before
+    they are written, so they can reference data that must be stored first;
+    if it raises, the documents are not written.
+
+    With `skip_unchanged`, the name of a hash field, documents whose stored
+    version has the same key and hash are not written, and are passed to
+    `on_unchanged` instead of `on_flush`. The hash is not written with the
+    documents, and the stored one is removed, until `save_hashes` is called
+    once everything depending on them succeeded, so a document whose
+    processing failed is written again on the next run instead of skipped.
+
+    Attributes:
+        document_model (Type[Document]): The Beanie model of the documents.
+        key (str): The field the upserts are keyed on.
+        max_batch_size (int): The number of documents that triggers a flush.
+        flush_interval (float): The age, in seconds, that triggers a flush.
+        on_flush (Optional[Callable]): Awaited with the documents of every flush.
+        before_write (Optional[Callable]): Awaited with the documents of every
+            flush, before they are written.
+        skip_unchanged (Optional[str]): The hash field of unchanged documents.
+        on_unchanged (Optional[Callable]): Awaited with the unchanged documents of
+            every flush.
+
+    Methods:
+        add: Adds a document to the buffer, flushing it if a threshold is hit.
+        flush: Writes all the buffered documents.
+        save_hashes: Stores the hashes of written documents.
+    """
+
+    def __init__(
+        self,
+        document_model: Type[Document],
+        key: str,
+        max_batch_size: int = MongoConfig.BULK_BATCH_SIZE,
+        flush_interval: float = MongoConfig.BULK_FLUSH_INTERVAL,
+        on_flush: Optional[Callable[[list[Document]], Awaitable[Any]]] = None,
+        skip_unchanged: Optional[str] = None,
+        on_unchanged: Optional[Callable[[list[Document]], Awaitable[Any]]] = None,
+        before_write: Optional[Callable[[list[Document]], Awaitable[Any]]] = None,
+    ) -> None:
+        self.document_model = document_model
+        self.key = key
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.skip_unchanged = skip_unchanged
+        self.on_unchanged = on_unchanged
+        self.before_write = before_write
+        self._buffer: dict[Any, Document] = {}
+        self._first_added: Optional[float] = None
+        self._ticker: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    async def __aenter__(self) -> "BulkWriter":
+        self._stopping = asyncio.Event()
+        self._ticker = asyncio.create_task(self._tick())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        ticker, self._ticker = self._ticker, None
+        try:
+            if ticker:
+                # Not cancelled, so a timed flush runs to the end, on_flush
+                # included, and its error, if any, is raised here
+                self._stopping.set()
+                await ticker
+        finally:
+            await self.flush()
+
+    async def _tick(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), timeout=self.flush_interval
+                )
+                return
+            except asyncio.TimeoutError:
+                pass
+            if self._is_stale():
+                await self.flush()
+
+    def _is_stale(self) -> bool:
+        return (
+            self._first_added is not None
+            and time.monotonic() - self._first_added >= self.flush_interval
+        )
+
+    def key_value(self, doc: Document) -> Any:
+        """
+        Returns the value of the upsert key of a document.
+
+        Args:
+            doc (Document): The document.
+
+        Returns:
+            Any: The value of the key, or None if the document has none.
+        """
+        value: Any = doc
+        for part in self.key.split("."):
+            if isinstance(value, dict):
+                value = value.get(part)
+            else:
+                value = getattr(value, part, None)
+            if value is None:
+                return None
+        return value
+
+    def _to_operation(self, doc: Document) -> InsertOne | UpdateOne:
+        document = doc.model_dump(exclude={"revision_id", "updated_at"})
+        _id = document.pop("id")
+        timestamped = "updated_at" in self.document_model.model_fields
+        if self.skip_unchanged:
+            # Stored by save_hashes, once the document is fully processed
+            document.pop(self.skip_unchanged, None)
+        key_value = self.key_value(doc)
+        if key_value is None:
+            if timestamped:
+                document["updated_at"] = datetime.now(timezone.utc)
+            return InsertOne({"_id": _id, **document})
+        # Keep the _id of an existing document, only new documents get ours
+        update = {"$set": document, "$setOnInsert": {"_id": _id}}
+        if self.skip_unchanged:
+            update["$unset"] = {self.skip_unchanged: ""}
+        if timestamped:
+            # Server time, so the change watermark does not depend on client clocks
+            update["$currentDate"] = {"updated_at": True}
+        return UpdateOne({self.key: key_value}, update, upsert=True)
+
+    async def add(self, doc: Document) -> None:
+        """
+        Adds a document to the buffer, flushing it if a threshold is hit.
+
+        A buffered document with the same key is replaced, so only the latest
+        version of a record is written.
+
+        Args:
+            doc (Document): The document to write.
+
+        Returns:
+            None
+        """
+        key_value = self.key_value(doc)
+        self._buffer[key_value if key_value is not None else id(doc)] = doc
+        if self._first_added is None:
+            self._first_added = time.monotonic()
+        if len(self._buffer) >= self.max_batch_size or self._is_stale():
+            await self.flush()
+
+    async def find_unchanged(self, docs: list[Document]) -> set[int]:
+        """
+        Finds the documents whose stored version has the same key and hash.
+
+        Args:
+            docs (list[Document]): The documents.
+
+        Returns:
+            set[int]: The indexes of the unchanged documents.
+        """
+        hashes = {
+            (self.key_value(doc), getattr(doc, self.skip_unchanged, None)): index
+            for index, doc in enumerate(docs)
+        }
+        keys = list({key for key, hash_ in hashes if key is not None and hash_})
+        if not keys:
+            return set()
+        stored = (
+            await self.document_model.get_motor_collection()
+            .find(
+                {self.key: {"$in": keys}},
+                {"_id": 0, self.key: 1, self.skip_unchanged: 1},
+            )
+            .to_list(None)
+        )
+        return {
+            hashes[pair]
+            for pair in (
+                (self.key_value(doc), doc.get(self.skip_unchanged)) for doc in stored
+            )
+            if pair in hashes
+        }
+
+    async def flush(self) -> int:
+        """
+        Writes all the buffered documents with one unordered bulk write.
+
+        Returns:
+            int: The number of documents written.
+        """
+        if not self._buffer:
+            return 0
+        docs = list(self._buffer.values())
+        self._buffer = {}
+        self._first_added = None
+
+        collection = self.document_model.__name__
+        if self.skip_unchanged:
+            unchanged = await self.find_unchanged(docs)
+            if unchanged:
+                skipped = [doc for index, doc in enumerate(docs) if index in unchanged]
+                docs = [doc for index, doc in enumerate(docs) if index not in unchanged]
+                logging.info(f"Skipped {len(skipped)} unchanged {collection} documents")
+                metrics.inc(
+                    "mongo_documents_unchanged_total",
+                    len(skipped),
+                    collection=collection,
+                )
+                if self.on_unchanged:
+                    await self.on_unchanged(skipped)
+                if not docs:
+                    return 0
+        if self.before_write:
+            await self.before_write(docs)
+        try:
+            with metrics.timer("mongo_bulk_write_seconds", collection=collection):
+                await self.document_model.get_motor_collection().bulk_write(
+                    [self._to_operation(doc) for doc in docs], ordered=False
+                )
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            logging.error(
+                f"Bulk write to {self.document_model.__name__} failed for "
+                f"{len(failed)} of {len(docs)} documents"
+            )
+            # The write is unordered, so the other documents were written
+            written = [doc for index, doc in enumerate(docs) if index not in failed]
+            if self.on_flush and written:
+                await self.on_flush(written)
+            raise
+        logging.info(f"Wrote {len(docs)} {collection} documents")
+        metrics.inc("mongo_documents_written_total", len(docs), collection=collection)
+
+        if self.on_flush:
+            await self.on_flush(docs)
+        return len(docs)
+
+    async def save_hashes(self, docs: list[Document]) -> None:
+        """
+        Stores the hashes of written documents, so they are skipped while
+        unchanged. To be called once everything depending on the documents
+        succeeded.
+
+        Args:
+            docs (list[Document]): The written documents.
+
+        Returns:
+            None
+        """
+        operations = [
+            UpdateOne(
+                {self.key: key_value},
+                {"$set": {self.skip_unchanged: getattr(doc, self.skip_unchanged)}},
+            )
+            for doc, key_value in ((doc, self.key_value(doc)) for doc in docs)
+            if key_value is not None and getattr(doc, self.skip_unchanged, None)
+        ]
+        if operations:
+            await self.document_model.get_motor_collection().bulk_write(
+                operations, ordered=False
+            )
+
+
+def raw_writer(**kwargs) -> BulkWriter:
+    """
+    Returns a BulkWriter for raw LinkedIn documents, keyed on the LinkedIn
+    identifier, that skips unchanged profiles.
+    """
+    kwargs.setdefault("skip_unchanged", "content_hash")
+    return BulkWriter(Linkedin, key="person.linkedInIdentifier", **kwargs)
+
+
+def lead_writer(**kwargs) -> BulkWriter:
+    """Returns a BulkWriter for Lead documents, keyed on the LinkedIn identifier."""
+    return BulkWriter(Lead, key="linkedin_id", **kwargs)
@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timezone
+from typing import Any, Optional, Type
+from beanie import Document
+from pymongo import IndexModel, UpdateOne
+from .mongodb_connector import init, close
+from .models.job import Job
+from .models.lead import Lead
+from .models.linkedin_data import Linkedin
+from .models.persona import Persona
+from .models.persona_lead import PersonaLead
+from utils.logging_config import setup_logging
+from configs import MONGODB_DB_NAME
+
+setup_logging()
+
+MODELS: list[Type[Document]] = [Lead, Linkedin, Persona, PersonaLead, Job]
+
+# Lead IDs per bulk write, when moving them out of persona documents
+MIGRATION_BATCH_SIZE = 1000
+
+
+async def merge_duplicate_personas() -> int:
+    """
+    Merges the personas of the same segment into one, so the unique segment
+    index can be built on databases written before it existed. The leads of
+    the duplicates are added to the kept persona before the duplicates are
+    deleted, so the merge can be run again if it is interrupted.
+
+    Returns:
+        int: The number of deleted duplicates.
+    """
+    collection = Persona.get_motor_collection()
+    segments = await collection.aggregate(
+        [
+            {
+                "$group": {
+                    "_id": {
+                        "company_type": "$company_type",
+                        "academic_field": "$academic_field",
+                    },
+                    "ids": {"$push": "$_id"},
+                }
+            },
+            {"$match": {"ids.1": {"$exists": True}}},
+        ]
+    ).to_list(None)
+    deleted = 0
+    for segment in segments:
+        keep, *duplicates = sorted(segment["ids"])
+        lead_ids = [
+            lead_id
+            for persona in await collection.find(
+                {"_id": {"$in": duplicates}}, {"lead_ids": 1}
+            ).to_list(None)
+            for lead_id in persona.get("lead_ids") or []
+        ]
+        if lead_ids:
+            await collection.update_one(
+                {"_id": keep}, {"$addToSet": {"lead_ids": {"$each": lead_ids}}}
+            )
+        result = await collection.delete_many({"_id": {"$in": duplicates}})
+        deleted += result.deleted_count
+        logging.warning(
+            f"Merged {len(duplicates)} duplicate personas of {segment['_id']} "
+            f"into {keep}"
+        )
+    return deleted
+
+
+async def _duplicate_groups(collection, key: str) -> list[list]:
+    # The _ids of the documents sharing a value of the key, newest first
+    groups = await collection.aggregate(
+        [
+            {"$match": {key: {"$type": "string"}}},
+            {"$sort": {"updated_at": -1, "_id": 1}},
+            {"$group": {"_id": f"${key}", "ids": {"$push": "$_id"}}},
+            {"$match": {"ids.1": {"$exists": True}}},
+        ]
+    ).to_list(None)
+    return [group["ids"] for group in groups]
+
+
+async def merge_duplicate_raw_documents() -> int:
+    """
+    Deletes all but the latest written raw document of every LinkedIn
+    identifier, so the unique identifier index can be built on databases
+    written before it existed.
+
+    Returns:
+        int: The number of deleted duplicates.
+    """
+    collection = Linkedin.get_motor_collection()
+    deleted = 0
+    for keep, *duplicates in await _duplicate_groups(
+        collection, "person.linkedInIdentifier"
+    ):
+        result = await collection.delete_many({"_id": {"$in": duplicates}})
+        deleted += result.deleted_count
+    if deleted:
+        logging.warning(f"Deleted {deleted} duplicate raw documents")
+    return deleted
+
+
+async def merge_duplicate_leads() -> int:
+    """
+    Deletes all but the latest written lead of every LinkedIn identifier, so
+    the unique identifier index can be built on databases written before it
+    existed. The kept lead takes the persona membership of a duplicate if it
+    has none, and the memberships of the duplicates are deleted, so the merge
+    can be run again if it is interrupted.
+
+    Returns:
+        int: The number of deleted duplicates.
+    """
+    collection = Lead.get_motor_collection()
+    memberships = PersonaLead.get_motor_collection()
+    deleted = 0
+    for keep, *duplicates in await _duplicate_groups(collection, "linkedin_id"):
+        membership = await memberships.find_one(
+            {"_id": {"$in": duplicates}}, {"_id": 0}
+        )
+        if membership:
+            await memberships.update_one(
+                {"_id": keep}, {"$setOnInsert": membership}, upsert=True
+            )
+        await memberships.delete_many({"_id": {"$in": duplicates}})
+        result = await collection.delete_many({"_id": {"$in": duplicates}})
+        deleted += result.deleted_count
+    if deleted:
+        logging.warning(f"Deleted {deleted} duplicate leads")
+    return deleted
+
+
+async def migrate_persona_leads() -> int:
+    """
+    Moves the lead IDs stored in persona documents, before the *persona_leads*
+    collection existed, to memberships. Leads that already have a membership
+    keep it, since it was written by a later mapping. The lead IDs of a
+    persona are unset once they are all moved, so the migration can be run
+    again if it is interrupted.
+
+    Returns:
+        int: The number of moved lead IDs.
+    """
+    personas = Persona.get_motor_collection()
+    moved = 0
+    async for persona in personas.find(
+        {"lead_ids": {"$exists": True}},
+        {"company_type": 1, "academic_field": 1, "lead_ids": 1},
+    ):
+        lead_ids = persona.get("lead_ids") or []
+        segment = {
+            "company_type": persona.get("company_type"),
+            "academic_field": persona.get("academic_field"),
+        }
+        for start in range(0, len(lead_ids), MIGRATION_BATCH_SIZE):
+            await PersonaLead.get_motor_collection().bulk_write(
+                [
+                    UpdateOne({"_id": lead_id}, {"$setOnInsert": segment}, upsert=True)
+                    for lead_id in lead_ids[start : start + MIGRATION_BATCH_SIZE]
+                ],
+                ordered=False,
+            )
+        await personas.update_one({"_id": persona["_id"]}, {"$unset": {"lead_ids": ""}})
+        moved += len(lead_ids)
+    if moved:
+        logging.warning(f"Moved {moved} lead IDs from personas to persona_leads")
+    return moved
+
+
+async def build_indexes(models: Optional[list[Type[Document]]] = None) -> list[str]:
+    """
+    Builds the indexes declared in the Settings of the document models.
+
+    Indexes that already exist are left as they are, and new ones are built
+    with the background option, so they do not block writes on servers older
+    than MongoDB 4.2 (newer servers always build without blocking). Duplicate
+    raw documents, leads and personas are merged before their unique indexes
+    are built, and the lead IDs still stored in personas are moved to
+    *persona_leads*.
+
+    Args:
+        models (Optional[list[Type[Document]]]): The models, all of them by default.
+
+    Returns:
+        list[str]: The names of the indexes.
+    """
+    names = []
+    for model in models or MODELS:
+        if model is Linkedin:
+            await merge_duplicate_raw_documents()
+        if model is Lead:
+            await merge_duplicate_leads()
+        if model is Persona:
+            await merge_duplicate_personas()
+            await migrate_persona_leads()
+        indexes = [
+            IndexModel(
+                list(index.document["key"].items()),
+                **{
+                    option: value
+                    for option, value in index.document.items()
+                    if option != "key"
+                },
+                background=True,
+            )
+            for index in getattr(model.Settings, "indexes", [])
+        ]
+        if indexes:
+            names += await model.get_motor_collection().create_indexes(indexes)
+    logging.info(f"Built indexes: {', '.join(names)}")
+    return names
+
+
+def hot_queries() -> dict[str, tuple[Type[Document], dict]]:
+    """
+    Returns the queries of the pipeline that must be served by an index, as
+    explainable commands, by name.
+
+    Returns:
+        dict[str, tuple[Type[Document], dict]]: The model and command of every query.
+    """
+    now = datetime.now(timezone.utc)
+
+    def find(model: Type[Document], filter: dict, sort: Optional[dict] = None):
+        command = {"find": model.get_collection_name(), "filter": filter}
+        if sort:
+            command["sort"] = sort
+        return model, command
+
+    def aggregate(model: Type[Document], pipeline: list[dict]):
+        command = {
+            "aggregate": model.get_collection_name(),
+            "pipeline": pipeline,
+            "cursor": {},
+        }
+        return model, command
+
+    return {
+        # ELT.transform_many
+        "transform": aggregate(
+            Linkedin,
+            [
+                {"$match": {"person.linkedInIdentifier": {"$in": ["id"]}}},
+                {"$sort": {"updated_at": -1}},
+                {
+                    "$group": {
+                        "_id": "$person.linkedInIdentifier",
+                        "latest": {"$first": "$$ROOT"},
+                    }
+                },
+            ],
+        ),
+        # PersonaMapper.query_many_persona_features
+        "persona_features": aggregate(
+            Linkedin,
+            [
+                {"$match": {"person.linkedInIdentifier": {"$in": ["id"]}}},
+                {"$sort": {"updated_at": -1}},
+                {"$group": {"_id": "$person.linkedInIdentifier"}},
+            ],
+        ),
+        "raw_by_email": find(Linkedin, {"person.emails": "a@example.com"}),
+        # PersonaMapper.query_linkedin_ids and LeadFinder
+        "leads_by_id": find(Lead, {"_id": {"$in": ["id"]}}),
+        "leads_by_linkedin_id": find(Lead, {"linkedin_id": {"$in": ["id"]}}),
+        "lead_by_email": find(Lead, {"email": "a@example.com"}),
+        "persona_by_segment": find(
+            Persona, {"company_type": "startup", "academic_field": "Other"}
+        ),
+        # LeadFinder.query_lead_ids
+        "persona_leads_page": find(
+            PersonaLead,
+            {
+                "company_type": "startup",
+                "academic_field": "Other",
+                "_id": {"$gt": "id"},
+            },
+            sort={"_id": 1},
+        ),
+        # IncrementalPersonaMapper.poll
+        "lead_changes": find(
+            Lead, {"updated_at": {"$gt": now}}, sort={"updated_at": 1, "_id": 1}
+        ),
+        "raw_changes": find(
+            Linkedin, {"updated_at": {"$gt": now}}, sort={"updated_at": 1, "_id": 1}
+        ),
+        # JobQueue.claim, both branches of its $or
+        "job_claim": find(
+            Job,
+            {
+                "status": "pending",
+                "kind": {"$in": ["elt"]},
+                "available_at": {"$lte": now},
+            },
+            sort={"available_at": 1},
+        ),
+        "job_expired_leases": find(
+            Job, {"status": "running", "lease_expires_at": {"$lte": now}}
+        ),
+    }
+
+
+def find_stages(plan: Any, stage: str, in_winning_plan: bool = False) -> list[dict]:
+    """
+    Returns the stages of a given type in the winning plans of an explain
+    output. Rejected plans are ignored.
+
+    Args:
+        plan (Any): The explain output, or a part of it.
+        stage (str): The stage type, e.g. COLLSCAN.
+        in_winning_plan (bool): Whether `plan` is part of a winning plan.
+
+    Returns:
+        list[dict]: The matching stages.
+    """
+    found = []
+    if isinstance(plan, dict):
+        if in_winning_plan and plan.get("stage") == stage:
+            found.append(plan)
+        for key, value in plan.items():
+            if key == "rejectedPlans":
+                continue
+            found += find_stages(
+                value, stage, in_winning_plan or key in ("winningPlan", "queryPlan")
+            )
+    elif isinstance(plan, list):
+        for value in plan:
+            found += find_stages(value, stage, in_winning_plan)
+    return found
+
+
+async def check_query_plans() -> list[str]:
+    """
+    Explains the hot queries, and returns the ones that scan a whole collection.
+
+    Returns:
+        list[str]: The names of the queries whose winning plan has a COLLSCAN.
+    """
+    collscans = []
+    for name, (model, command) in hot_queries().items():
+        database = model.get_motor_collection().database
+        explain = await database.command(
+            {"explain": command, "verbosity": "queryPlanner"}
+        )
+        if find_stages(explain, "COLLSCAN"):
+            logging.error(
+                f"Query {name} on {model.get_collection_name()} is a COLLSCAN"
+            )
+            collscans.append(name)
+    return collscans
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the indexes, and check the plans of the hot queries."
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only check the query plans, and exit with an error on a COLLSCAN",
+    )
+    args = parser.parse_args()
+
+    async def main() -> int:
+        try:
+            await init(database=MONGODB_DB_NAME, document_models=MODELS)
+            if not args.check:
+                await build_indexes()
+            collscans = await check_query_plans()
+        finally:
+            close()
+        return 1 if collscans else 0
+
+    sys.exit(asyncio.run(main()))
@@ -1,10 +1,10 @@
 import asyncio
 import logging
 from utils.logging_config import setup_logging
-from .mongodb_connector import init
-from .models.lead import Lead
+from .mongodb_connector import init, close
+from .bulk_writer import raw_writer
+from .indexes import MODELS, build_indexes
 from .models.linkedin_data import Linkedin
-from .models.persona import Persona
 from data_pipeline.elt_process import ELT
 from configs import MONGODB_DB_NAME
 
@@ -12,31 +12,42 @@ setup_logging()
 
 
 async def init_load():
-    await init(database=MONGODB_DB_NAME, document_models=[Lead, Linkedin, Persona])
+    # Every model whose indexes are built
+    await init(database=MONGODB_DB_NAME, document_models=MODELS)
     logging.info("Initialized database connections!")
+    # Indexes build in the background, while the initial load runs
+    indexes = asyncio.create_task(build_indexes())
 
     # # Test insert
     # lead = Lead(first_name="Mike", last_name="Doe", email="abc@gmail.com")
     # await lead.insert()
 
     try:
-        data = ELT().extract()
+        # The ELT extracts the data when it is built, off the event loop so
+        # the index build keeps running
+        data = (await asyncio.to_thread(ELT)).data
     except Exception as e:
         logging.error(repr(e))
+        await indexes
+        return
+    if not data:
+        logging.info("No data")
+        await indexes
         return
 
-    linkedin = Linkedin(
-        credits_left=data["credits_left"],
-        person=data["person"],
-        company=data["company"],
-        rate_limit_left=data["rate_limit_left"],
-        success=data["success"],
-    )
-
-    await linkedin.insert()
+    async with raw_writer() as writer:
+        await writer.add(Linkedin.from_payload(data))
+    await indexes
 
 
 if __name__ == "__main__":
-    asyncio.run(init_load())
+
+    async def main():
+        try:
+            await init_load()
+        finally:
+            close()
+
+    asyncio.run(main())
 
     logging.info("Successfullly initialized load!")
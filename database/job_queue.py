@@ -0,0 +1,317 @@
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+from uuid import uuid4
+from pymongo import ReturnDocument
+from .mongodb_connector import init
+from .models.job import Job
+from utils.logging_config import setup_logging
+from utils.metrics import metrics
+from configs import MONGODB_DB_NAME, JobConfig
+
+setup_logging()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobQueue:
+    """
+    A queue of ELT and persona mapping jobs in the *jobs* collection, shared
+    by workers on any number of nodes.
+
+    Producers enqueue batches of emails or lead IDs as jobs. A worker claims
+    a job with one atomic findOneAndUpdate, which gives it a lease of
+    `lease_seconds`, and renews the lease with heartbeats while it works. A
+    job whose lease expired (its worker died, or stalled) can be claimed by
+    another worker. A failed job is retried after an exponential backoff,
+    until it has been attempted `max_attempts` times. Jobs must be
+    idempotent, since a job may run again after a lost lease.
+
+    Attributes:
+        worker_id (str): The identifier of this worker in the leases.
+        lease_seconds (float): The duration of a lease.
+        max_attempts (int): The number of attempts of a job.
+        retry_delay (float): The delay before the first retry, in seconds.
+
+    Methods:
+        create: A class method that creates an initialized instance.
+        enqueue: Enqueues items as jobs of a given size.
+        claim: Claims the next available job.
+        heartbeat: Renews the lease of a claimed job.
+        complete: Marks a claimed job as done.
+        fail: Schedules a retry of a claimed job, or marks it as failed.
+        release: Gives a claimed job back, without counting the attempt.
+        fail_expired: Marks the expired jobs without attempts left as failed.
+        counts: Returns the number of jobs by status.
+    """
+
+    def __init__(
+        self,
+        worker_id: Optional[str] = None,
+        lease_seconds: float = JobConfig.LEASE_SECONDS,
+        max_attempts: int = JobConfig.MAX_ATTEMPTS,
+        retry_delay: float = JobConfig.RETRY_DELAY,
+    ) -> None:
+        self.worker_id = (
+            worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        )
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    @classmethod
+    async def create(cls, **kwargs):
+        self = JobQueue(**kwargs)
+        await self.init()
+        return self
+
+    async def init(self):
+        await init(database=MONGODB_DB_NAME, document_models=[Job])
+
+    @property
+    def _collection(self):
+        return Job.get_motor_collection()
+
+    def _owned(self, job: dict) -> dict:
+        # Updates only apply while this worker holds the lease
+        return {"_id": job["_id"], "status": "running", "worker": self.worker_id}
+
+    async def enqueue(
+        self, kind: str, items: Iterable[str], batch_size: int = JobConfig.BATCH_SIZE
+    ) -> list[str]:
+        """
+        Enqueues items as jobs of up to `batch_size` items each.
+
+        Args:
+            kind (str): The kind of the jobs, "elt" for emails, "persona" for lead IDs.
+            items (Iterable[str]): The emails or lead IDs.
+            batch_size (int): The number of items per job.
+
+        Returns:
+            list[str]: The IDs of the jobs.
+        """
+        items = list(items)
+        now = _now()
+        jobs = [
+            Job(
+                kind=kind,
+                items=items[start : start + batch_size],
+                max_attempts=self.max_attempts,
+                available_at=now,
+                created_at=now,
+            )
+            for start in range(0, len(items), batch_size)
+        ]
+        if not jobs:
+            return []
+        await self._collection.insert_many(
+            [
+                {"_id": job.id, **job.model_dump(exclude={"id", "revision_id"})}
+                for job in jobs
+            ]
+        )
+        logging.info(f"Enqueued {len(items)} items as {len(jobs)} {kind} jobs")
+        metrics.inc("jobs_total", len(jobs), kind=kind, outcome="enqueued")
+        return [job.id for job in jobs]
+
+    async def claim(self, kinds: Iterable[str] = ("elt", "persona")) -> Optional[dict]:
+        """
+        Claims the next available job: the oldest pending job, or a running job
+        whose lease expired, with attempts left.
+
+        Args:
+            kinds (Iterable[str]): The kinds of jobs this worker handles.
+
+        Returns:
+            Optional[dict]: The claimed job, None if there is none.
+        """
+        now = _now()
+        job = await self._collection.find_one_and_update(
+            {
+                "kind": {"$in": list(kinds)},
+                "$or": [
+                    {"status": "pending", "available_at": {"$lte": now}},
+                    {"status": "running", "lease_expires_at": {"$lte": now}},
+                ],
+                "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": self.worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if job:
+            logging.info(
+                f"Claimed {job['kind']} job {job['_id']}, attempt {job['attempts']}"
+            )
+            metrics.inc("jobs_total", kind=job["kind"], outcome="claimed")
+        return job
+
+    async def heartbeat(self, job: dict) -> bool:
+        """
+        Renews the lease of a claimed job.
+
+        Args:
+            job (dict): The job.
+
+        Returns:
+            bool: False if the lease was lost to another worker.
+        """
+        result = await self._collection.update_one(
+            self._owned(job),
+            {
+                "$set": {
+                    "lease_expires_at": _now() + timedelta(seconds=self.lease_seconds)
+                }
+            },
+        )
+        if not result.modified_count:
+            logging.warning(f"Lost the lease of job {job['_id']}")
+        return bool(result.modified_count)
+
+    async def complete(self, job: dict, result: Optional[dict] = None) -> bool:
+        """
+        Marks a claimed job as done.
+
+        Args:
+            job (dict): The job.
+            result (Optional[dict]): The result of the job, e.g. its stats.
+
+        Returns:
+            bool: False if the lease was lost to another worker.
+        """
+        update = await self._collection.update_one(
+            self._owned(job),
+            {
+                "$set": {
+                    "status": "done",
+                    "finished_at": _now(),
+                    "result": result,
+                    "lease_expires_at": None,
+                }
+            },
+        )
+        metrics.inc("jobs_total", kind=job["kind"], outcome="done")
+        return bool(update.modified_count)
+
+    async def fail(
+        self, job: dict, error: str, items: Optional[list[str]] = None
+    ) -> bool:
+        """
+        Schedules a retry of a claimed job after an exponential backoff, or
+        marks it as failed once it has no attempts left.
+
+        Args:
+            job (dict): The job.
+            error (str): The error of the attempt.
+            items (Optional[list[str]]): The items left to process, if only
+                some of them failed, so the others are not run again.
+
+        Returns:
+            bool: False if the lease was lost to another worker.
+        """
+        attempts = job["attempts"]
+        if attempts < job.get("max_attempts", self.max_attempts):
+            delay = self.retry_delay * 2 ** (attempts - 1)
+            update = {
+                "status": "pending",
+                "available_at": _now() + timedelta(seconds=delay),
+            }
+            outcome = "retried"
+            logging.warning(
+                f"Job {job['_id']} failed, retrying in {delay}s: {error}"
+            )
+        else:
+            update = {"status": "failed", "finished_at": _now()}
+            outcome = "failed"
+            logging.error(f"Job {job['_id']} failed after {attempts} attempts: {error}")
+        if items is not None:
+            update["items"] = items
+        result = await self._collection.update_one(
+            self._owned(job),
+            {
+                "$set": {
+                    **update,
+                    "error": error,
+                    "worker": None,
+                    "lease_expires_at": None,
+                }
+            },
+        )
+        metrics.inc("jobs_total", kind=job["kind"], outcome=outcome)
+        return bool(result.modified_count)
+
+    async def release(self, job: dict) -> bool:
+        """
+        Gives a claimed job back to the queue, without counting the attempt,
+        e.g. when the worker shuts down.
+
+        Args:
+            job (dict): The job.
+
+        Returns:
+            bool: False if the lease was lost to another worker.
+        """
+        result = await self._collection.update_one(
+            self._owned(job),
+            {
+                "$set": {
+                    "status": "pending",
+                    "available_at": _now(),
+                    "worker": None,
+                    "lease_expires_at": None,
+                },
+                "$inc": {"attempts": -1},
+            },
+        )
+        return bool(result.modified_count)
+
+    async def fail_expired(self) -> int:
+        """
+        Marks the running jobs whose lease expired, and that have no attempts
+        left, as failed. The others are claimed again by `claim`.
+
+        Returns:
+            int: The number of failed jobs.
+        """
+        result = await self._collection.update_many(
+            {
+                "status": "running",
+                "lease_expires_at": {"$lte": _now()},
+                "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+            },
+            {
+                "$set": {
+                    "status": "failed",
+                    "finished_at": _now(),
+                    "error": "Lease expired",
+                    "worker": None,
+                    "lease_expires_at": None,
+                }
+            },
+        )
+        if result.modified_count:
+            logging.error(f"{result.modified_count} jobs failed with an expired lease")
+        return result.modified_count
+
+    async def counts(self) -> dict[str, int]:
+        """
+        Returns the number of jobs by status.
+
+        Returns:
+            dict[str, int]: The number of jobs of every status.
+        """
+        counts = await self._collection.aggregate(
+            [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+        ).to_list(None)
+        return {count["_id"]: count["count"] for count in counts}
@@ -0,0 +1,44 @@
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+from datetime import datetime
+from typing import Literal, Optional
+from uuid import uuid4
+
+
+class Job(Document):
+    id: str = Field(default_factory=lambda: uuid4().hex)
+    # "elt" jobs hold emails, "persona" jobs hold lead IDs
+    kind: Literal["elt", "persona"]
+    items: list[str]
+    status: Literal["pending", "running", "done", "failed"] = "pending"
+    attempts: int = 0
+    max_attempts: int = 3
+    # Pending jobs are claimable from then on, retries are delayed
+    available_at: Optional[datetime] = None
+    # The worker holding the lease of a running job, until it expires
+    worker: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    result: Optional[dict] = None
+
+    class Settings:
+        name = "jobs"
+        indexes = [
+            # Claims of pending jobs, oldest first
+            IndexModel(
+                [
+                    ("status", ASCENDING),
+                    ("kind", ASCENDING),
+                    ("available_at", ASCENDING),
+                ],
+                name="claim",
+            ),
+            # Claims of running jobs whose lease expired
+            IndexModel(
+                [("status", ASCENDING), ("lease_expires_at", ASCENDING)],
+                name="lease_expires_at",
+            ),
+        ]
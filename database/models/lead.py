@@ -1,5 +1,7 @@
 from beanie import Document
 from pydantic import Field,BaseModel
+from pymongo import ASCENDING, IndexModel
+from datetime import datetime
 from typing import Optional
 from uuid import uuid4
 
@@ -12,9 +14,30 @@ class Lead(Document):
     last_name: Optional[str] = None
     email: Optional[str] = None
     photo_url: Optional[str] = None
+    # Set by the BulkWriter on every write
+    updated_at: Optional[datetime] = None
 
     class Settings:
         name = "leads"
+        indexes = [
+            # One lead per LinkedIn identifier, so concurrent upserts cannot
+            # insert it twice
+            IndexModel(
+                [("linkedin_id", ASCENDING)],
+                name="linkedin_id_unique",
+                unique=True,
+                partialFilterExpression={"linkedin_id": {"$type": "string"}},
+            ),
+            IndexModel(
+                [("email", ASCENDING)],
+                name="email",
+                partialFilterExpression={"email": {"$type": "string"}},
+            ),
+            # Change watermark of the incremental persona mapping
+            IndexModel(
+                [("updated_at", ASCENDING), ("_id", ASCENDING)], name="updated_at"
+            ),
+        ]
 
 
 class LeadView(BaseModel):
@@ -31,6 +54,24 @@ class LeadView(BaseModel):
             "linkedin_id": "$person.linkedInIdentifier",
             "last_name": "$person.lastName",
             "first_name": "$person.firstName",
-            "emails": "$person.email",
+            # The first of the emails of the profile
+            "email": {"$arrayElemAt": ["$person.emails", 0]},
             "photo_url": "$person.photoUrl",
         }
+
+
+class LeadSummary(BaseModel):
+    id: str = Field(alias="_id")
+    linkedin_id: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+
+    class Settings:
+        projection = {
+            "_id": 1,
+            "linkedin_id": 1,
+            "first_name": 1,
+            "last_name": 1,
+            "email": 1,
+        }
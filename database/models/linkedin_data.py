@@ -1,9 +1,64 @@
+import hashlib
+import json
 from beanie import Document
 from pydantic import Field, BaseModel
+from pymongo import ASCENDING, IndexModel
+from datetime import datetime
 from typing import Optional
 from uuid import uuid4
 
 
+# The fields of a raw payload the pipeline reads, the only ones slim documents keep
+CORE_PERSON_FIELDS = (
+    "linkedInIdentifier",
+    "publicIdentifier",
+    "firstName",
+    "lastName",
+    "emails",
+    "photoUrl",
+)
+CORE_COMPANY_FIELDS = ("name", "employeeCount")
+
+
+def slim_person(person: Optional[dict]) -> Optional[dict]:
+    """
+    Returns the core fields of a person, and only the latest field of study,
+    under the same paths as in the full payload, so queries work on both.
+    """
+    if person is None:
+        return None
+    slim = {field: person[field] for field in CORE_PERSON_FIELDS if field in person}
+    education = (person.get("schools") or {}).get("educationHistory") or []
+    if education:
+        slim["schools"] = {
+            "educationHistory": [{"fieldOfStudy": education[0].get("fieldOfStudy")}]
+        }
+    return slim
+
+
+def slim_company(company: Optional[dict]) -> Optional[dict]:
+    """Returns the core fields of a company."""
+    if company is None:
+        return None
+    return {field: company[field] for field in CORE_COMPANY_FIELDS if field in company}
+
+
+def content_hash(data: dict) -> str:
+    """
+    Returns a stable hash of the person and company of a payload, which does
+    not depend on key order or on the quota fields of the response.
+    """
+    # Not orjson, so the hash does not depend on which serializer is installed
+    normalized = json.dumps(
+        {"person": data.get("person"), "company": data.get("company")},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
 class Linkedin(Document):
     id: str = Field(default_factory=lambda: uuid4().hex)
     credits_left: Optional[int] = None
@@ -11,9 +66,67 @@ class Linkedin(Document):
     company: Optional[dict] = None
     rate_limit_left: Optional[int] = None
     success: Optional[bool] = None
+    # The S3 key of the full payload, set on slim documents
+    payload_key: Optional[str] = None
+    # The range of the payload, when it is one member of a batch archive
+    payload_offset: Optional[int] = None
+    payload_length: Optional[int] = None
+    # Of the full payload, so unchanged profiles are not written again
+    content_hash: Optional[str] = None
+    # Set by the BulkWriter on every write
+    updated_at: Optional[datetime] = None
 
     class Settings:
         name = "linkedin_raw_data"
+        indexes = [
+            # Lookups by identifier, and one document per identifier, so
+            # concurrent upserts of a profile cannot insert it twice
+            IndexModel(
+                [("person.linkedInIdentifier", ASCENDING)],
+                name="person_linkedin_identifier_unique",
+                unique=True,
+                partialFilterExpression={
+                    "person.linkedInIdentifier": {"$type": "string"}
+                },
+            ),
+            IndexModel(
+                [("person.emails", ASCENDING)],
+                name="person_emails",
+                partialFilterExpression={"person.emails": {"$exists": True}},
+            ),
+            # Change watermark of the incremental persona mapping
+            IndexModel(
+                [("updated_at", ASCENDING), ("_id", ASCENDING)], name="updated_at"
+            ),
+        ]
+
+    @classmethod
+    def from_payload(
+        cls, data: dict, slim: bool = False, payload_key: Optional[str] = None
+    ) -> "Linkedin":
+        """
+        Builds a raw document from a LinkedIn API payload.
+
+        Args:
+            data (dict): The payload.
+            slim (bool): Whether to only keep the core fields, the full payload
+                being stored at `payload_key`.
+            payload_key (Optional[str]): The S3 key of the full payload.
+
+        Returns:
+            Linkedin: The raw document.
+        """
+        person = data.get("person")
+        company = data.get("company")
+        return cls(
+            credits_left=data.get("credits_left"),
+            person=slim_person(person) if slim else person,
+            company=slim_company(company) if slim else company,
+            rate_limit_left=data.get("rate_limit_left"),
+            success=data.get("success"),
+            payload_key=payload_key,
+            content_hash=content_hash(data),
+        )
 
 
 class PersonaFeaturesView(BaseModel):
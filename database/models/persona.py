@@ -1,5 +1,6 @@
 from beanie import Document
 from pydantic import Field
+from pymongo import ASCENDING, IndexModel
 from typing import Optional, Literal
 from uuid import uuid4
 
@@ -11,7 +12,14 @@ class Persona(Document):
     company_type: Optional[
         Literal["startup", "mid_market", "multi_national"]
     ] = None
-    lead_ids: Optional[list[str]] = None
-    
+
     class Settings:
         name = "personas"
+        # One persona per segment, its leads are in the persona_leads collection
+        indexes = [
+            IndexModel(
+                [("company_type", ASCENDING), ("academic_field", ASCENDING)],
+                name="segment",
+                unique=True,
+            ),
+        ]
@@ -0,0 +1,27 @@
+from beanie import Document
+from pymongo import ASCENDING, IndexModel
+from datetime import datetime
+from typing import Literal, Optional
+
+
+class PersonaLead(Document):
+    # The ID of the lead, which belongs to one persona at a time
+    id: str
+    company_type: Optional[Literal["startup", "mid_market", "multi_national"]] = None
+    academic_field: Optional[str] = None
+    # Set on every mapping of the lead
+    updated_at: Optional[datetime] = None
+
+    class Settings:
+        name = "persona_leads"
+        indexes = [
+            # The leads of a segment, by lead ID, for keyset pagination
+            IndexModel(
+                [
+                    ("company_type", ASCENDING),
+                    ("academic_field", ASCENDING),
+                    ("_id", ASCENDING),
+                ],
+                name="segment_lead",
+            ),
+        ]
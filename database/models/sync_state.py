@@ -0,0 +1,14 @@
+from beanie import Document
+from datetime import datetime
+from typing import Optional
+
+
+class SyncState(Document):
+    # The name of the collection being followed
+    id: str
+    resume_token: Optional[dict] = None
+    updated_at: Optional[datetime] = None
+    last_id: Optional[str] = None
+
+    class Settings:
+        name = "sync_state"
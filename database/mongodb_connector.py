@@ -4,11 +4,157 @@ from dotenv import load_dotenv
 from typing import Type, Optional, List, Union
 from .models.lead import Lead
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from utils.metrics import metrics
 from configs import MongoConfig
 
 load_dotenv()
 
 
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Records every MongoDB round trip, and its duration, by command name.
+    """
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        metrics.inc("mongo_round_trips_total", command=event.command_name)
+        metrics.observe(
+            "mongo_command_seconds",
+            event.duration_micros / 1e6,
+            command=event.command_name,
+        )
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        metrics.inc("mongo_round_trips_total", command=event.command_name)
+        metrics.inc("mongo_command_failures_total", command=event.command_name)
+
+
+class MongoConnectionManager:
+    """
+    Process-wide cache of MongoDB clients and Beanie registrations.
+
+    One pooled client is created per URI, and document models are registered
+    with Beanie once per database, so repeated calls to `init` are cheap.
+    Registering a model does not build its indexes, `database.indexes` does.
+    Motor clients are bound to the event loop they were created on, so the
+    cache is reset when it is used from a new event loop.
+
+    Methods:
+        get_client: Returns the pooled client for a URI.
+        use_client: Uses an existing client for a URI.
+        init: Registers the document models that are not registered yet.
+        close: Closes all the clients and forgets all registrations.
+    """
+
+    def __init__(self) -> None:
+        self._clients: dict[str, AsyncIOMotorClient] = {}
+        self._registered: dict[tuple[str, str], set] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _check_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self.close()
+            self._loop = loop
+            self._lock = asyncio.Lock()
+
+    def get_client(self, uri: str = MongoConfig.MONGO_URI) -> AsyncIOMotorClient:
+        """
+        Returns the pooled client for a URI, creating it on first use.
+
+        Args:
+            uri (str): The MongoDB connection URI.
+
+        Returns:
+            AsyncIOMotorClient: The client for the URI.
+        """
+        client = self._clients.get(uri)
+        if client is None:
+            client = AsyncIOMotorClient(
+                uri,
+                maxPoolSize=MongoConfig.MAX_POOL_SIZE,
+                minPoolSize=MongoConfig.MIN_POOL_SIZE,
+                maxIdleTimeMS=MongoConfig.MAX_IDLE_TIME_MS,
+                # Listeners are fixed at creation, so none is added when disabled
+                event_listeners=[CommandMetrics()] if metrics.enabled else [],
+            )
+            self._clients[uri] = client
+        return client
+
+    def use_client(self, client: AsyncIOMotorClient, uri: str) -> None:
+        """
+        Uses an existing client for a URI, e.g. a mongomock-motor client in
+        tests and benchmarks. Must be called from the event loop that uses it.
+
+        Args:
+            client (AsyncIOMotorClient): The client.
+            uri (str): The URI the client is registered under.
+
+        Returns:
+            None
+        """
+        self._check_loop()
+        self._clients[uri] = client
+        self._registered = {
+            key: models for key, models in self._registered.items() if key[0] != uri
+        }
+
+    async def init(
+        self,
+        database: str,
+        document_models: Optional[List[Union[Type[Document], Type["View"], str]]],
+        uri: str = MongoConfig.MONGO_URI,
+    ) -> None:
+        """
+        Registers the document models with Beanie, skipping the ones that are
+        already registered for this database.
+
+        Args:
+            database (str): The name of the database to connect to.
+            document_models (Optional[List[Union[Type[Document], Type["View"], str]]]):
+                A list of document models to be registered with Beanie.
+            uri (str): The MongoDB connection URI.
+
+        Returns:
+            None
+        """
+        self._check_loop()
+        async with self._lock:
+            registered = self._registered.setdefault((uri, database), set())
+            new_models = [
+                model for model in document_models or [] if model not in registered
+            ]
+            if not new_models:
+                return
+            client = self.get_client(uri)
+            # Indexes are built by database.indexes, not by every process that starts
+            await init_beanie(
+                database=client[database],
+                document_models=new_models,
+                skip_indexes=True,
+            )
+            registered.update(new_models)
+
+    def close(self) -> None:
+        """
+        Closes all the clients and forgets all registrations.
+
+        Returns:
+            None
+        """
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
+        self._registered.clear()
+
+
+connection_manager = MongoConnectionManager()
+
+
 async def init(
     database: str,
     document_models: Optional[List[Union[Type[Document], Type["View"], str]]],
@@ -16,6 +162,9 @@ async def init(
     """
     Initialize the MongoDB connection and Beanie ORM.
 
+    The connection is pooled for the whole process, and models that were
+    already registered are not initialized again.
+
     Args:
         database (str): The name of the database to connect to.
         document_models (Optional[List[Union[Type[Document], Type["View"], str]]]):
@@ -24,11 +173,17 @@ async def init(
     Returns:
         None
     """
-    # Create Motor client
-    client = AsyncIOMotorClient(MongoConfig.MONGO_URI)
+    await connection_manager.init(database=database, document_models=document_models)
+
+
+def close() -> None:
+    """
+    Close all the pooled MongoDB connections.
 
-    # Initialize beanie with the Lead document class and a database
-    await init_beanie(database=client[database], document_models=document_models)
+    Returns:
+        None
+    """
+    connection_manager.close()
 
 
 if __name__ == "__main__":
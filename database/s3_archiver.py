@@ -0,0 +1,337 @@
+import gzip
+import io
+import logging
+import threading
+import zlib
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Optional
+from uuid import uuid4
+from .s3_connector import S3Connector
+from utils.logging_config import setup_logging
+from utils import serialization
+from configs import LINKEDIN_BUCKET, S3Config
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+setup_logging()
+
+EXTENSIONS = {"gzip": "gz", "zstd": "zst"}
+
+
+def partition_prefix(
+    prefix: str = S3Config.ARCHIVE_PREFIX, date: Optional[datetime] = None
+) -> str:
+    """
+    Returns the date partition prefix of the archive, e.g. raw/dt=2024-01-31.
+
+    Args:
+        prefix (str): The prefix of the archive.
+        date (Optional[datetime]): The date of the partition, today (UTC) by default.
+
+    Returns:
+        str: The partition prefix.
+    """
+    date = date or datetime.now(timezone.utc)
+    return f"{prefix}/dt={date:%Y-%m-%d}"
+
+
+def _compressor(compression: str):
+    if compression == "gzip":
+        # wbits=31 writes a gzip header and trailer
+        return zlib.compressobj(wbits=31)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        return zstandard.ZstdCompressor().compressobj()
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+class RawArchiver:
+    """
+    Streams raw records into a compressed NDJSON object in S3.
+
+    Records are serialized and compressed as they are written, and the
+    compressed bytes are uploaded as multipart upload parts whenever
+    `part_size` bytes are buffered, so memory stays bounded by the part size
+    no matter how many records are archived. Small archives are uploaded
+    with a single PUT on close. Objects are written under a date partition,
+    e.g. raw/dt=2024-01-31/part-<uuid>.ndjson.gz.
+
+    Records written with `write_member` are compressed as their own member
+    (a gzip member, or a zstd frame), so they can be read back alone with a
+    ranged GET of their offset and length. The object stays a valid archive
+    for `iter_archive`, since concatenated members decompress as one stream.
+
+    Writes are serialized with a lock, so an archiver can be shared between
+    threads.
+
+    Attributes:
+        bucket (str): The bucket of the archive.
+        key (str): The key of the object being written.
+        compression (str): "gzip" or "zstd".
+        part_size (int): The size of every uploaded part, S3 requires at least 5 MiB.
+        records (int): The number of records written.
+
+    Methods:
+        write: Writes one record.
+        write_many: Writes many records.
+        write_member: Writes one record as its own member, and returns its range.
+        close: Uploads the remaining bytes and completes the object.
+        abort: Discards the object.
+    """
+
+    def __init__(
+        self,
+        s3_connector: Optional[S3Connector] = None,
+        bucket: str = LINKEDIN_BUCKET,
+        prefix: str = S3Config.ARCHIVE_PREFIX,
+        compression: str = S3Config.ARCHIVE_COMPRESSION,
+        part_size: int = S3Config.ARCHIVE_PART_SIZE,
+    ) -> None:
+        self.s3_connector = s3_connector or S3Connector()
+        self.bucket = bucket
+        self.compression = compression
+        self.part_size = part_size
+        self.key = (
+            f"{partition_prefix(prefix)}/part-{uuid4().hex}"
+            f".ndjson.{EXTENSIONS[compression]}"
+        )
+        self.records = 0
+        self._compressor = _compressor(compression)
+        # The records compressed in the current member
+        self._member_records = 0
+        self._buffer = bytearray()
+        # The compressed bytes already uploaded in parts
+        self._uploaded = 0
+        self._upload_id: Optional[str] = None
+        self._parts: list[dict] = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "RawArchiver":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _upload_part(self, body: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.s3_connector.create_multipart_upload(
+                self.bucket, self.key
+            )
+        self._parts.append(
+            self.s3_connector.upload_part(
+                self.bucket, self.key, self._upload_id, len(self._parts) + 1, body
+            )
+        )
+
+    def _flush_parts(self) -> None:
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+            self._uploaded += self.part_size
+
+    def _end_member(self) -> None:
+        if self._member_records:
+            self._buffer += self._compressor.flush()
+            self._compressor = _compressor(self.compression)
+            self._member_records = 0
+
+    def _compress(self, record: dict | bytes) -> None:
+        if not isinstance(record, bytes):
+            record = serialization.dumps(record, default=str)
+        self._buffer += self._compressor.compress(record + b"\n")
+        self._member_records += 1
+        self.records += 1
+
+    def write(self, record: dict | bytes) -> None:
+        """
+        Writes one record.
+
+        Args:
+            record (dict | bytes): The record to archive, or its JSON.
+
+        Returns:
+            None
+        """
+        self.write_many([record])
+
+    def write_many(self, records: Iterable[dict | bytes]) -> None:
+        """
+        Writes many records. Records already serialized to JSON (e.g. with
+        model_dump_json) are written as they are.
+
+        Args:
+            records (Iterable[dict | bytes]): The records to archive, or their JSON.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError("Archiver is closed")
+            for record in records:
+                self._compress(record)
+                self._flush_parts()
+
+    def write_member(self, record: dict | bytes) -> tuple[int, int]:
+        """
+        Writes one record as its own compressed member, which can be read back
+        with `read_payload`, from its offset and length, once the object is
+        closed.
+
+        Args:
+            record (dict | bytes): The record to archive, or its JSON.
+
+        Returns:
+            tuple[int, int]: The offset and length of the member in the object.
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError("Archiver is closed")
+            self._end_member()
+            offset = self._uploaded + len(self._buffer)
+            self._compress(record)
+            self._end_member()
+            length = self._uploaded + len(self._buffer) - offset
+            self._flush_parts()
+            return offset, length
+
+    def close(self) -> Optional[str]:
+        """
+        Uploads the remaining bytes and completes the object.
+
+        Returns:
+            Optional[str]: The key of the object, None if no record was written.
+        """
+        with self._lock:
+            if self._closed:
+                return self.key if self.records else None
+            self._closed = True
+            if not self.records:
+                return None
+            self._end_member()
+            try:
+                if self._upload_id is None:
+                    self.s3_connector.put_object(
+                        bucket=self.bucket, key=self.key, body=bytes(self._buffer)
+                    )
+                else:
+                    # The last part may be smaller than the minimum part size
+                    self._upload_part(bytes(self._buffer))
+                    self.s3_connector.complete_multipart_upload(
+                        self.bucket, self.key, self._upload_id, self._parts
+                    )
+            except Exception:
+                self._abort_upload()
+                raise
+            finally:
+                self._buffer.clear()
+            logging.info(f"Archived {self.records} records to {self.key}")
+            return self.key
+
+    def abort(self) -> None:
+        """
+        Discards the object, and any part that was already uploaded.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._closed = True
+            self._buffer.clear()
+            self._abort_upload()
+
+    def _abort_upload(self) -> None:
+        if self._upload_id is not None:
+            try:
+                self.s3_connector.abort_multipart_upload(
+                    self.bucket, self.key, self._upload_id
+                )
+            except Exception as e:
+                logging.error(f"Failed to abort upload of {self.key}: {e!r}")
+            self._upload_id = None
+
+
+def iter_archive(
+    key: str,
+    s3_connector: Optional[S3Connector] = None,
+    bucket: str = LINKEDIN_BUCKET,
+) -> Iterator[dict]:
+    """
+    Streams the records of an archived object, without loading it into memory.
+
+    Args:
+        key (str): The key of the object.
+        s3_connector (Optional[S3Connector]): The S3 connector to read with.
+        bucket (str): The bucket of the object.
+
+    Returns:
+        Iterator[dict]: The records of the object, in order.
+    """
+    body = (s3_connector or S3Connector()).get_object(bucket, key)
+    if body is None:
+        return
+    if key.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        stream = zstandard.ZstdDecompressor().stream_reader(
+            body, read_across_frames=True
+        )
+    else:
+        stream = gzip.GzipFile(fileobj=body)
+    with body, io.BufferedReader(stream) as lines:
+        for line in lines:
+            yield serialization.loads(line)
+
+
+def _decompress(key: str, data: bytes) -> bytes:
+    if key.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+def read_payload(
+    key: str,
+    offset: Optional[int] = None,
+    length: Optional[int] = None,
+    s3_connector: Optional[S3Connector] = None,
+    bucket: str = LINKEDIN_BUCKET,
+) -> Optional[dict]:
+    """
+    Reads the full payload of a slim raw document, from its `payload_key`, and
+    its `payload_offset` and `payload_length` in an archive. Only the member of
+    the payload is downloaded, however large the archive is.
+
+    Args:
+        key (str): The key of the payload: a JSON object of a single lead, or an
+            archive of a batch.
+        offset (Optional[int]): The offset of the payload in an archive.
+        length (Optional[int]): The length of the payload in an archive.
+        s3_connector (Optional[S3Connector]): The S3 connector to read with.
+        bucket (str): The bucket of the object.
+
+    Returns:
+        Optional[dict]: The payload, None if it was not found.
+    """
+    s3_connector = s3_connector or S3Connector()
+    if key.endswith(".json"):
+        body = s3_connector.get_object(bucket, key)
+        if body is None:
+            return None
+        with body:
+            return serialization.load(body)
+    if offset is None or length is None:
+        raise ValueError(f"The range of the payload in {key} is required")
+    data = s3_connector.get_range(bucket, key, offset, length)
+    if data is None:
+        return None
+    return serialization.loads(_decompress(key, data))
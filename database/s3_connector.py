@@ -1,26 +1,193 @@
 import boto3
 import logging
+import threading
+from botocore.client import BaseClient
+from botocore.config import Config
+from botocore.response import StreamingBody
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
 from utils.logging_config import setup_logging
+from utils.metrics import metrics
 from configs import S3Config
 
+_clients: dict[tuple, BaseClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_s3_client(
+    endpoint_url: str = S3Config.S3_ENDPOINT_URL,
+    max_pool_connections: int = S3Config.MAX_POOL_CONNECTIONS,
+    max_attempts: int = S3Config.MAX_ATTEMPTS,
+) -> BaseClient:
+    """
+    Returns the shared S3 client for an endpoint and pool configuration.
+
+    boto3 clients are thread-safe, so one client (and its connection pool) is
+    created per configuration and shared by the whole process.
+
+    Args:
+        endpoint_url (str): The S3 endpoint.
+        max_pool_connections (int): The size of the connection pool.
+        max_attempts (int): The maximum number of attempts per request.
+
+    Returns:
+        BaseClient: The S3 client.
+    """
+    key = (endpoint_url, max_pool_connections, max_attempts)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            # Sessions are not thread-safe, so every client gets its own
+            client = boto3.session.Session().client(
+                "s3",
+                aws_access_key_id=S3Config.S3_ACCESS_KEY,
+                aws_secret_access_key=S3Config.S3_SECRET_KEY,
+                endpoint_url=endpoint_url,
+                use_ssl=False,
+                config=Config(
+                    max_pool_connections=max_pool_connections,
+                    retries={"max_attempts": max_attempts, "mode": "standard"},
+                ),
+            )
+            _clients[key] = client
+        return client
+
+
+def _size(body: object) -> int:
+    if isinstance(body, str):
+        return len(body.encode())
+    try:
+        return len(body)
+    except TypeError:  # file objects have no length
+        return 0
+
 
 class S3Connector:
-    def __init__(self):
-        self.s3 = boto3.client(
-            "s3",
-            aws_access_key_id=S3Config.S3_ACCESS_KEY,
-            aws_secret_access_key=S3Config.S3_SECRET_KEY,
-            endpoint_url="http://localhost:9000",
-            use_ssl=False,
-        )
+    def __init__(
+        self,
+        client: Optional[BaseClient] = None,
+        max_workers: int = S3Config.MAX_WORKERS,
+    ):
+        self.s3 = client or get_s3_client()
+        self.max_workers = max_workers
         setup_logging()
 
-    def get_object(self, bucket: str, key: str) -> None:
+    def get_object(self, bucket: str, key: str) -> StreamingBody | None:
         try:
-            self.s3.get_object(Bucket=bucket, Key=key)
+            body = self.s3.get_object(Bucket=bucket, Key=key)["Body"]
             logging.info(f"Successfully get object {key}")
+            return body
         except Exception as e:
-            logging.error(f"Failed to get object {object}, error: {repr(e)}")
+            logging.error(f"Failed to get object {key}, error: {repr(e)}")
+            return None
+
+    def get_range(
+        self, bucket: str, key: str, offset: int, length: int
+    ) -> bytes | None:
+        """
+        Downloads `length` bytes of an object, from `offset`, with a ranged GET.
+
+        Args:
+            bucket (str): The bucket of the object.
+            key (str): The key of the object.
+            offset (int): The offset of the first byte.
+            length (int): The number of bytes.
+
+        Returns:
+            bytes | None: The bytes, None if it failed.
+        """
+        try:
+            resp = self.s3.get_object(
+                Bucket=bucket, Key=key, Range=f"bytes={offset}-{offset + length - 1}"
+            )
+            with resp["Body"] as body:
+                return body.read()
+        except Exception as e:
+            logging.error(f"Failed to get range of object {key}, error: {repr(e)}")
+            return None
 
     def put_object(self, bucket: str, key: str, body: object) -> None:
-        return self.s3.put_object(Bucket=bucket, Key=key, Body=body)
+        with metrics.timer("s3_request_seconds", operation="put_object"):
+            resp = self.s3.put_object(Bucket=bucket, Key=key, Body=body)
+        metrics.inc("s3_bytes_written_total", _size(body))
+        return resp
+
+    def get_many(self, bucket: str, keys: Iterable[str]) -> dict[str, bytes | None]:
+        """
+        Downloads many objects concurrently, on a thread pool.
+
+        Args:
+            bucket (str): The bucket of the objects.
+            keys (Iterable[str]): The keys of the objects.
+
+        Returns:
+            dict[str, bytes | None]: The content of every object, None if it failed.
+        """
+
+        def get(key: str) -> bytes | None:
+            body = self.get_object(bucket, key)
+            if body is None:
+                return None
+            with body:
+                return body.read()
+
+        keys = list(keys)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(keys, executor.map(get, keys)))
+
+    def put_many(
+        self, bucket: str, objects: Iterable[tuple[str, object]]
+    ) -> dict[str, bool]:
+        """
+        Uploads many objects concurrently, on a thread pool.
+
+        Args:
+            bucket (str): The bucket of the objects.
+            objects (Iterable[tuple[str, object]]): The (key, body) of every object.
+
+        Returns:
+            dict[str, bool]: Whether every object was uploaded, by key.
+        """
+
+        def put(item: tuple[str, object]) -> bool:
+            key, body = item
+            try:
+                self.put_object(bucket=bucket, key=key, body=body)
+                return True
+            except Exception as e:
+                logging.error(f"Failed to put object {key}, error: {repr(e)}")
+                return False
+
+        objects = list(objects)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip((key for key, _ in objects), executor.map(put, objects)))
+
+    def create_multipart_upload(self, bucket: str, key: str) -> str:
+        return self.s3.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+
+    def upload_part(
+        self, bucket: str, key: str, upload_id: str, part_number: int, body: bytes
+    ) -> dict:
+        with metrics.timer("s3_request_seconds", operation="upload_part"):
+            resp = self.s3.upload_part(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=body,
+            )
+        metrics.inc("s3_bytes_written_total", len(body))
+        return {"ETag": resp["ETag"], "PartNumber": part_number}
+
+    def complete_multipart_upload(
+        self, bucket: str, key: str, upload_id: str, parts: list[dict]
+    ) -> None:
+        self.s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort_multipart_upload(self, bucket: str, key: str, upload_id: str) -> None:
+        self.s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
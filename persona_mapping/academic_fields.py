@@ -0,0 +1,125 @@
+import logging
+import os
+import pickle
+from functools import lru_cache
+from typing import Any, Optional
+from persona_mapping.field_matcher import FieldOfStudyMatcher
+from utils.logging_config import setup_logging
+from configs import PersonaConfig
+
+setup_logging()
+
+# Bumped when the layout of the cache changes
+CACHE_VERSION = 1
+
+
+def cache_path_for(csv_path: str) -> str:
+    return f"{csv_path}.pkl"
+
+
+def read_csv(csv_path: str) -> tuple[list[str], list[Any]]:
+    """
+    Reads the field of study and academic field columns of an academic field CSV.
+
+    Args:
+        csv_path (str): The path of the CSV file.
+
+    Returns:
+        tuple[list[str], list[Any]]: The fields of study, and their academic fields.
+    """
+    # pandas is slow to import, so it is only needed when the cache is stale
+    import pandas as pd
+
+    academic_df = pd.read_csv(csv_path, usecols=["field_of_study", "academic_field"])
+    return (
+        academic_df["field_of_study"].tolist(),
+        academic_df["academic_field"].tolist(),
+    )
+
+
+def _source_stamp(csv_path: str) -> dict:
+    stat = os.stat(csv_path)
+    return {
+        "version": CACHE_VERSION,
+        "path": os.path.abspath(csv_path),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+    }
+
+
+def load_table(
+    csv_path: str = PersonaConfig.ACADEMIC_FIELDS_PATH,
+    cache: bool = PersonaConfig.ACADEMIC_FIELDS_CACHE,
+) -> tuple[list[str], list[Any]]:
+    """
+    Loads the academic field table, from its compiled cache when it is up to date.
+
+    The cache is a pickle of the two columns next to the CSV file, stamped
+    with the modification time and size of the CSV, so editing the CSV
+    recompiles it on the next load. A cache that cannot be written (e.g. a
+    read-only directory) is skipped.
+
+    Args:
+        csv_path (str): The path of the CSV file.
+        cache (bool): Whether to read and write the compiled cache.
+
+    Returns:
+        tuple[list[str], list[Any]]: The fields of study, and their academic fields.
+    """
+    if not cache:
+        return read_csv(csv_path)
+
+    stamp = _source_stamp(csv_path)
+    cache_path = cache_path_for(csv_path)
+    try:
+        with open(cache_path, "rb") as f:
+            compiled = pickle.load(f)
+        if compiled["stamp"] == stamp:
+            return compiled["fields_of_study"], compiled["academic_fields"]
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning(f"Ignoring the academic field cache {cache_path}: {e!r}")
+
+    fields_of_study, academic_fields = read_csv(csv_path)
+    compiled = {
+        "stamp": stamp,
+        "fields_of_study": fields_of_study,
+        "academic_fields": academic_fields,
+    }
+    # Written under another name first, so readers never see a partial file
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(compiled, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+        logging.info(f"Compiled the academic field table to {cache_path}")
+    except OSError as e:
+        logging.warning(f"Failed to write the academic field cache {cache_path}: {e!r}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return fields_of_study, academic_fields
+
+
+@lru_cache(maxsize=None)
+def get_field_matcher(
+    csv_path: Optional[str] = None, cache: Optional[bool] = None
+) -> FieldOfStudyMatcher:
+    """
+    Returns the field of study matcher of an academic field table, loaded on
+    first use and shared by the whole process.
+
+    Args:
+        csv_path (Optional[str]): The path of the CSV file, PersonaConfig's by default.
+        cache (Optional[bool]): Whether to use the compiled cache, PersonaConfig's
+            by default.
+
+    Returns:
+        FieldOfStudyMatcher: The matcher.
+    """
+    return FieldOfStudyMatcher(
+        *load_table(
+            csv_path or PersonaConfig.ACADEMIC_FIELDS_PATH,
+            PersonaConfig.ACADEMIC_FIELDS_CACHE if cache is None else cache,
+        )
+    )
@@ -0,0 +1,96 @@
+from bisect import bisect_right
+from itertools import accumulate
+from typing import TYPE_CHECKING, Any, Iterable, Sequence
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class FieldOfStudyMatcher:
+    """
+    Classifies fields of study against a precompiled academic field table.
+
+    A field of study is mapped to the academic field of the first row whose
+    field of study contains it (case-insensitive). The lowercased rows are
+    joined into a single string once, so a lookup is one substring search
+    plus a binary search for the row, instead of a scan over all the rows.
+    Results are memoized per lowercased input.
+
+    Attributes:
+        default (str): The category returned when no row matches.
+
+    Methods:
+        from_dataframe: Builds a matcher from an academic field DataFrame.
+        classify: Classifies one field of study.
+        classify_many: Classifies many fields of study in one call.
+    """
+
+    # Never part of a field of study, so a match cannot span two rows
+    separator = "\x00"
+    max_cache_size = 100_000
+
+    def __init__(
+        self,
+        fields_of_study: Sequence[str],
+        academic_fields: Sequence[Any],
+        default: str = "Other",
+    ) -> None:
+        lowered = [field.lower() for field in fields_of_study]
+        self._corpus = self.separator.join(lowered)
+        # Offset of every row in the corpus, counting one separator per row
+        self._offsets = [0] + list(
+            accumulate(len(field) + len(self.separator) for field in lowered[:-1])
+        )
+        self._academic_fields = list(academic_fields)
+        self.default = default
+        self._cache: dict[str, Any] = {}
+
+    @classmethod
+    def from_dataframe(cls, academic_df: "pd.DataFrame") -> "FieldOfStudyMatcher":
+        return cls(
+            academic_df["field_of_study"].tolist(),
+            academic_df["academic_field"].tolist(),
+        )
+
+    def classify(self, field_of_study: str) -> Any:
+        """
+        Classifies one field of study.
+
+        Args:
+            field_of_study (str): The field of study.
+
+        Returns:
+            Any: The academic field of the first matching row, or the default.
+        """
+        key = field_of_study.lower()
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        position = -1 if self.separator in key else self._corpus.find(key)
+        if position < 0:
+            result = self.default
+        else:
+            result = self._academic_fields[bisect_right(self._offsets, position) - 1]
+
+        if len(self._cache) >= self.max_cache_size:
+            self._cache.clear()
+        self._cache[key] = result
+        return result
+
+    def classify_many(self, fields_of_study: Iterable[str]) -> list[Any]:
+        """
+        Classifies many fields of study in one call.
+
+        Every distinct field of study is only searched once.
+
+        Args:
+            fields_of_study (Iterable[str]): The fields of study.
+
+        Returns:
+            list[Any]: The academic fields, in input order.
+        """
+        fields_of_study = list(fields_of_study)
+        categories = {field: self.classify(field) for field in set(fields_of_study)}
+        return [categories[field] for field in fields_of_study]
@@ -0,0 +1,363 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Type
+from beanie import Document
+from bson.timestamp import Timestamp
+from pymongo.errors import OperationFailure
+from database.mongodb_connector import init, close
+from database.models.lead import Lead
+from database.models.linkedin_data import Linkedin
+from database.models.persona import Persona
+from database.models.persona_lead import PersonaLead
+from database.models.sync_state import SyncState
+from persona_mapping.persona_mapper import PersonaMapper
+from utils.logging_config import setup_logging
+from utils.metrics import metrics, report
+from configs import MetricsConfig, PersonaConfig
+
+setup_logging()
+
+SOURCES: list[Type[Document]] = [Lead, Linkedin]
+
+
+def _utc(date: datetime) -> datetime:
+    # BSON dates are read back as naive UTC datetimes
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def watermark_filter(
+    updated_at: Optional[datetime], last_id: Optional[str], until: datetime
+) -> dict:
+    """
+    Returns the filter of the documents written after a watermark, and before
+    `until`. Documents are ordered by (updated_at, _id), so documents written
+    at the same time are not skipped. Documents that were never timestamped
+    sort first, so they are read on the first pass.
+
+    Args:
+        updated_at (Optional[datetime]): The updated_at of the last document read.
+        last_id (Optional[str]): The _id of the last document read.
+        until (datetime): The upper bound, exclusive, of updated_at.
+
+    Returns:
+        dict: The filter.
+    """
+    bound = {"$or": [{"updated_at": None}, {"updated_at": {"$lt": until}}]}
+    if updated_at is None and last_id is None:
+        return bound
+    if last_id is None:
+        # Set by a change stream, which saw every document written at that time
+        after = {"updated_at": {"$gt": updated_at}}
+    elif updated_at is None:
+        after = {
+            "$or": [
+                {"updated_at": None, "_id": {"$gt": last_id}},
+                {"updated_at": {"$ne": None}},
+            ]
+        }
+    else:
+        after = {
+            "$or": [
+                {"updated_at": {"$gt": updated_at}},
+                {"updated_at": updated_at, "_id": {"$gt": last_id}},
+            ]
+        }
+    return {"$and": [after, bound]}
+
+
+class IncrementalPersonaMapper:
+    """
+    Keeps personas up to date with the leads and raw LinkedIn documents that
+    were written since the last run.
+
+    Both collections are followed with a change stream when MongoDB supports
+    it (replica sets), and polled with an (updated_at, _id) watermark
+    otherwise. Changes are mapped in micro-batches of up to `batch_size`
+    documents, or whatever arrived within `max_wait` seconds. The resume token
+    and the watermark of every collection are saved in the *sync_state*
+    collection after every micro-batch, so a restarted mapper resumes where
+    it stopped. Mapping is idempotent, so changes seen twice are harmless.
+
+    A changed lead is mapped again, and a changed raw document maps every
+    lead with its LinkedIn identifier. Remapped leads are removed from the
+    personas they no longer belong to.
+
+    Attributes:
+        persona_mapper (PersonaMapper): The mapper of the changed leads.
+        batch_size (int): The maximum number of changes per micro-batch.
+        max_wait (float): The seconds a partial micro-batch waits for more changes.
+        poll_interval (float): The seconds between two polls, when polling.
+        lag (float): The age, in seconds, a write must reach before it is polled.
+
+    Methods:
+        create: A class method that creates an initialized instance.
+        lead_ids: Returns the IDs of the leads affected by changed documents.
+        map_changes: Maps the leads affected by changed documents.
+        poll: Maps all the changes after the watermark of a collection.
+        watch: Maps the changes of a collection from its change stream.
+        follow: Follows a collection, with a change stream or by polling.
+        run: Follows both collections.
+    """
+
+    def __init__(
+        self,
+        persona_mapper: Optional[PersonaMapper] = None,
+        batch_size: int = PersonaConfig.INCREMENTAL_BATCH_SIZE,
+        max_wait: float = PersonaConfig.INCREMENTAL_MAX_WAIT,
+        poll_interval: float = PersonaConfig.INCREMENTAL_POLL_INTERVAL,
+        lag: float = PersonaConfig.INCREMENTAL_LAG,
+    ) -> None:
+        self.persona_mapper = persona_mapper or PersonaMapper()
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.lag = lag
+        # The upper bound of the last poll of every collection
+        self._polled_until: dict[str, datetime] = {}
+
+    @classmethod
+    async def create(cls, **kwargs):
+        self = IncrementalPersonaMapper(**kwargs)
+        await self.init()
+        return self
+
+    async def init(self):
+        await init(
+            database="prospects",
+            document_models=[Lead, Linkedin, Persona, PersonaLead, SyncState],
+        )
+
+    async def load_state(self, source: Type[Document]) -> SyncState:
+        name = source.get_collection_name()
+        return await SyncState.get(name) or SyncState(id=name)
+
+    async def lead_ids(self, source: Type[Document], docs: list[dict]) -> list[str]:
+        """
+        Returns the IDs of the leads affected by changed documents.
+
+        Args:
+            source (Type[Document]): The collection of the documents, Lead or Linkedin.
+            docs (list[dict]): The changed documents.
+
+        Returns:
+            list[str]: The IDs of the affected leads.
+        """
+        if source is Lead:
+            return [doc["_id"] for doc in docs]
+        linkedin_ids = list(
+            {(doc.get("person") or {}).get("linkedInIdentifier") for doc in docs}
+            - {None}
+        )
+        if not linkedin_ids:
+            return []
+        leads = (
+            await Lead.get_motor_collection()
+            .find({"linkedin_id": {"$in": linkedin_ids}}, {"_id": 1})
+            .to_list(None)
+        )
+        return [lead["_id"] for lead in leads]
+
+    async def map_changes(self, source: Type[Document], docs: list[dict]) -> int:
+        """
+        Maps the leads affected by changed documents. The mapper removes them
+        from the personas they no longer belong to.
+
+        Args:
+            source (Type[Document]): The collection of the documents, Lead or Linkedin.
+            docs (list[dict]): The changed documents.
+
+        Returns:
+            int: The number of leads mapped.
+        """
+        lead_ids = await self.lead_ids(source, docs)
+        if not lead_ids:
+            return 0
+        mappings = await self.persona_mapper.map_many(
+            lead_ids, batch_size=self.batch_size
+        )
+        collection = source.get_collection_name()
+        metrics.inc("persona_incremental_changes_total", len(docs), source=collection)
+        logging.info(
+            f"Mapped {len(mappings)} leads from {len(docs)} changes in {collection}"
+        )
+        return len(mappings)
+
+    def _projection(self, source: Type[Document]) -> dict:
+        if source is Lead:
+            return {"_id": 1, "updated_at": 1}
+        return {"_id": 1, "updated_at": 1, "person.linkedInIdentifier": 1}
+
+    async def poll(self, source: Type[Document]) -> int:
+        """
+        Maps all the changes of a collection after its watermark, in
+        micro-batches, and advances the watermark after every one.
+
+        Args:
+            source (Type[Document]): The collection to poll, Lead or Linkedin.
+
+        Returns:
+            int: The number of changed documents.
+        """
+        state = await self.load_state(source)
+        until = datetime.now(timezone.utc) - timedelta(seconds=self.lag)
+        self._polled_until[source.get_collection_name()] = until
+        changes = 0
+        while True:
+            docs = (
+                await source.get_motor_collection()
+                .find(
+                    watermark_filter(state.updated_at, state.last_id, until),
+                    self._projection(source),
+                )
+                .sort([("updated_at", 1), ("_id", 1)])
+                .limit(self.batch_size)
+                .to_list(None)
+            )
+            if not docs:
+                return changes
+            await self.map_changes(source, docs)
+            state.updated_at = docs[-1].get("updated_at")
+            state.last_id = docs[-1]["_id"]
+            await state.save()
+            changes += len(docs)
+            if len(docs) < self.batch_size:
+                return changes
+
+    async def watch(self, source: Type[Document]) -> None:
+        """
+        Maps the changes of a collection from its change stream, until it is
+        cancelled. The stream resumes after the saved resume token, or from
+        the watermark when there is none, or else from the upper bound of the
+        preceding poll, so no write after it is missed.
+
+        Args:
+            source (Type[Document]): The collection to watch, Lead or Linkedin.
+
+        Raises:
+            OperationFailure: If MongoDB does not support change streams.
+
+        Returns:
+            None
+        """
+        state = await self.load_state(source)
+        options = {}
+        if state.resume_token:
+            options["resume_after"] = state.resume_token
+        elif state.updated_at:
+            # Changes seen twice are harmless, so the stream starts a bit early
+            options["start_at_operation_time"] = Timestamp(
+                int(_utc(state.updated_at).timestamp() - self.lag), 0
+            )
+        elif source.get_collection_name() in self._polled_until:
+            # The poll found nothing, and saw every write before its bound
+            until = self._polled_until[source.get_collection_name()]
+            options["start_at_operation_time"] = Timestamp(int(until.timestamp()), 0)
+        pipeline = [
+            {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}
+        ]
+        async with source.get_motor_collection().watch(
+            pipeline,
+            full_document="updateLookup",
+            max_await_time_ms=int(self.max_wait * 1000),
+            **options,
+        ) as stream:
+            while stream.alive:
+                docs = []
+                while len(docs) < self.batch_size:
+                    # None once no change arrived for max_wait seconds
+                    change = await stream.try_next()
+                    if change is None:
+                        break
+                    if change.get("fullDocument"):
+                        docs.append(change["fullDocument"])
+                if not docs:
+                    continue
+                await self.map_changes(source, docs)
+                # The watermark follows the stream, in case we fall back to polling
+                latest = max(
+                    (_utc(doc["updated_at"]) for doc in docs if doc.get("updated_at")),
+                    default=None,
+                )
+                if latest and (
+                    state.updated_at is None or latest > _utc(state.updated_at)
+                ):
+                    state.updated_at = latest
+                    state.last_id = None
+                state.resume_token = stream.resume_token
+                await state.save()
+
+    async def follow(self, source: Type[Document], once: bool = False) -> None:
+        """
+        Follows a collection: catches up with a poll, then watches its change
+        stream, or keeps polling every `poll_interval` seconds if change
+        streams are not supported.
+
+        Args:
+            source (Type[Document]): The collection to follow, Lead or Linkedin.
+            once (bool): Only catch up with one poll, then return.
+
+        Returns:
+            None
+        """
+        state = await self.load_state(source)
+        if not state.resume_token:
+            await self.poll(source)
+        if once:
+            return
+        try:
+            await self.watch(source)
+        except OperationFailure as e:
+            logging.warning(
+                f"Change streams unavailable for {source.get_collection_name()}, "
+                f"polling instead: {e}"
+            )
+        while True:
+            await self.poll(source)
+            await asyncio.sleep(self.poll_interval)
+
+    async def run(self, once: bool = False) -> None:
+        """
+        Follows the leads and raw LinkedIn documents.
+
+        Args:
+            once (bool): Only map the changes since the last run, then return.
+
+        Returns:
+            None
+        """
+        await asyncio.gather(*(self.follow(source, once=once) for source in SOURCES))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Keep personas up to date with new and changed leads."
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Map the changes since the last run, then exit",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=PersonaConfig.INCREMENTAL_BATCH_SIZE,
+        help="Maximum number of changes per micro-batch",
+    )
+    parser.add_argument(
+        "--metrics-output",
+        default=MetricsConfig.OUTPUT,
+        help="File to write the metrics to, when METRICS_ENABLED=1",
+    )
+    args = parser.parse_args()
+
+    async def main():
+        try:
+            mapper = await IncrementalPersonaMapper.create(batch_size=args.batch_size)
+            await mapper.run(once=args.once)
+        finally:
+            close()
+            report(args.metrics_output)
+
+    asyncio.run(main())
@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import time
+import zlib
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, Optional
+from database.mongodb_connector import close
+from persona_mapping.academic_fields import get_field_matcher
+from persona_mapping.persona_mapper import PersonaMapper, read_lead_ids
+from utils.logging_config import setup_logging
+from utils.metrics import metrics, report
+from configs import MetricsConfig, PersonaConfig
+
+setup_logging()
+
+
+def shard_of(lead_id: str, shards: int) -> int:
+    # Not hash(), which is salted per process
+    return zlib.crc32(lead_id.encode()) % shards
+
+
+def partition(lead_ids: Iterable[str], shards: int) -> list[list[str]]:
+    """
+    Partitions lead IDs into shards by hash, so a lead always lands in the
+    same shard. Duplicate IDs are dropped.
+
+    Args:
+        lead_ids (Iterable[str]): The lead IDs.
+        shards (int): The number of shards.
+
+    Returns:
+        list[list[str]]: The lead IDs of every shard, in input order.
+    """
+    partitions: list[list[str]] = [[] for _ in range(shards)]
+    for lead_id in dict.fromkeys(lead_ids):
+        partitions[shard_of(lead_id, shards)].append(lead_id)
+    return partitions
+
+
+def init_worker() -> None:
+    """Loads the academic field table once per worker process."""
+    get_field_matcher()
+
+
+def map_shard(shard: int, lead_ids: list[str], batch_size: int) -> dict:
+    """
+    Maps the personas of the leads of a shard, in a worker process, with its
+    own event loop and MongoDB client.
+
+    Args:
+        shard (int): The index of the shard.
+        lead_ids (list[str]): The lead IDs of the shard.
+        batch_size (int): The number of leads per batch.
+
+    Returns:
+        dict: The persona of every mapped lead, and the stats of the shard.
+    """
+
+    async def main() -> dict[str, tuple[str, str]]:
+        try:
+            persona_mapper = await PersonaMapper.create()
+            return await persona_mapper.map_many(lead_ids, batch_size=batch_size)
+        finally:
+            close()
+
+    start = time.perf_counter()
+    mappings = asyncio.run(main())
+    return {
+        "mappings": mappings,
+        "stats": {
+            "shard": shard,
+            "leads": len(lead_ids),
+            "mapped": len(mappings),
+            "seconds": round(time.perf_counter() - start, 3),
+        },
+    }
+
+
+class ParallelPersonaMapper:
+    """
+    Maps the personas of many leads on several CPU cores.
+
+    Lead IDs are partitioned by hash into one shard per worker, and every
+    shard is mapped in its own process by a PersonaMapper, with its own
+    event loop and MongoDB client. Workers load the academic field table
+    once, when they start. Worker processes are spawned rather than forked,
+    so they never inherit the MongoDB clients of the parent. Shards do not
+    conflict: persona segments are upserted with $setOnInsert, so any shard
+    may create one, and every lead has a single PersonaLead membership,
+    upserted on its ID, which only its own shard writes.
+
+    Attributes:
+        workers (int): The number of worker processes, and shards.
+        batch_size (int): The number of leads per batch, in every shard.
+        shard_stats (list[dict]): The stats of every shard of the last run.
+
+    Methods:
+        map_many: Maps the personas of many leads, and merges the shards.
+    """
+
+    def __init__(
+        self,
+        workers: int = PersonaConfig.WORKERS,
+        batch_size: int = PersonaConfig.BATCH_SIZE,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        self.workers = workers
+        self.batch_size = batch_size
+        self.shard_stats: list[dict] = []
+        self._executor = executor
+
+    def _create_executor(self) -> Executor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
+
+    async def map_many(self, lead_ids: Iterable[str]) -> dict[str, tuple[str, str]]:
+        """
+        Maps the personas of many leads, one shard per worker, and inserts them
+        into the database.
+
+        Args:
+            lead_ids (Iterable[str]): The IDs of the leads.
+
+        Returns:
+            dict[str, tuple[str, str]]: The persona of every mapped lead, by lead ID.
+        """
+        shards = [
+            (shard, ids)
+            for shard, ids in enumerate(partition(lead_ids, self.workers))
+            if ids
+        ]
+        executor = self._executor or self._create_executor()
+        loop = asyncio.get_running_loop()
+        try:
+            results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        executor, map_shard, shard, ids, self.batch_size
+                    )
+                    for shard, ids in shards
+                )
+            )
+        finally:
+            if executor is not self._executor:
+                executor.shutdown()
+
+        mappings: dict[str, tuple[str, str]] = {}
+        for result in results:
+            mappings.update(result["mappings"])
+        self.shard_stats = [result["stats"] for result in results]
+        leads = sum(stats["leads"] for stats in self.shard_stats)
+        for stats in self.shard_stats:
+            logging.info(
+                f"Shard {stats['shard']} mapped {stats['mapped']} of {stats['leads']} "
+                f"leads in {stats['seconds']}s"
+            )
+        logging.info(
+            f"Mapped {len(mappings)} of {leads} leads in {len(shards)} shards"
+        )
+        # Workers record their own metrics, which are lost with their process
+        metrics.inc("persona_leads_total", len(mappings), outcome="mapped")
+        metrics.inc("persona_leads_total", leads - len(mappings), outcome="unmapped")
+        return mappings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Map the personas of leads on several CPU cores."
+    )
+    parser.add_argument("lead_ids", nargs="*", help="The IDs of the leads to map")
+    parser.add_argument("--file", help="File with one lead ID per line")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=PersonaConfig.WORKERS,
+        help="Number of worker processes",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=PersonaConfig.BATCH_SIZE,
+        help="Number of leads mapped per database round trip, in every worker",
+    )
+    parser.add_argument(
+        "--metrics-output",
+        default=MetricsConfig.OUTPUT,
+        help="File to write the metrics to, when METRICS_ENABLED=1",
+    )
+    args = parser.parse_args()
+
+    async def main():
+        lead_ids = list(args.lead_ids)
+        if args.file:
+            lead_ids.extend(read_lead_ids(args.file))
+        try:
+            await ParallelPersonaMapper(
+                workers=args.workers, batch_size=args.batch_size
+            ).map_many(lead_ids)
+        finally:
+            report(args.metrics_output)
+
+    asyncio.run(main())
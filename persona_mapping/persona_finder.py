@@ -1,49 +1,185 @@
 import logging
 import asyncio
-from typing import Literal
-from database.mongodb_connector import init
+from typing import AsyncIterator, Literal, Optional
+from database.mongodb_connector import init, close
 from database.models.persona import Persona
+from database.models.persona_lead import PersonaLead
 from database.models.linkedin_data import Linkedin
-from database.models.lead import Lead
+from database.models.lead import Lead, LeadSummary
 from utils.logging_config import setup_logging
+from configs import PersonaConfig
+
+setup_logging()
+
+Segment = tuple[Literal["startup", "mid_market", "multi_national"], str]
 
-setup_logging() 
 
 class LeadFinder:
     """
     A class that finds Leads, given a Persona.
 
+    A persona is given either as a Persona document or as its
+    (company_type, academic_field) segment. Its leads are read from the
+    *persona_leads* collection in lead ID order, with keyset pagination on
+    the lead ID, so every page is an index range scan that does not depend on
+    how deep it is, and leads moving between personas never shift the pages
+    that follow. Every slice of lead IDs is resolved with one `$in` query.
+
     Attributes:
-        lead_id.
+        page_size (int): The number of leads per page, and per cursor batch.
+        max_in_size (int): The maximum number of lead IDs per `$in` query.
 
     Methods:
-        create: A class method that
+        create: A class method that creates an initialized instance of LeadFinder.
+        query_lead: Queries the Leads for a list of lead IDs.
+        query_lead_ids: Queries the lead IDs of a persona after a given one.
+        page: Returns one page of the leads of a persona, and the next cursor.
+        iter_leads: Iterates over all the leads of a persona.
     """
 
+    def __init__(
+        self,
+        page_size: int = PersonaConfig.FINDER_PAGE_SIZE,
+        max_in_size: int = PersonaConfig.FINDER_MAX_IN_SIZE,
+    ) -> None:
+        self.page_size = page_size
+        self.max_in_size = max_in_size
+
     @classmethod
-    async def create(cls):
-        self = LeadFinder()
+    async def create(cls, **kwargs):
+        self = LeadFinder(**kwargs)
         await self.init()
         return self
 
     async def init(self):
-        await init(database="prospects", document_models=[Lead, Persona])
+        await init(database="prospects", document_models=[Lead, Persona, PersonaLead])
 
-    async def query_lead(self, lead_ids: list[str]) -> str | None:
+    @staticmethod
+    def persona_filter(persona: Persona | Segment) -> dict:
+        if isinstance(persona, Persona):
+            company_type, academic_field = persona.company_type, persona.academic_field
+        else:
+            company_type, academic_field = persona
+        return {"company_type": company_type, "academic_field": academic_field}
+
+    async def query_lead(self, lead_ids: list[str]) -> list[Lead] | None:
         """
-        Queries the Lead for a given Persona.
+        Queries the Leads for a list of lead IDs.
 
         Args:
-            persona (Persona): The Persona to query.
+            lead_ids (list[str]): The IDs of the leads.
 
         Returns:
-            str | None: The Lead ID of the Persona if found, None otherwise.
+            list[Lead] | None: The Leads found, None if there are none.
         """
-        # leads ids is a list
-        lead_ids = await Lead.find(Lead.id in lead_ids)
-        if lead_ids:
-            logging.info("Lead result: %s", lead_ids)
-            return lead_ids
+        leads = []
+        for start in range(0, len(lead_ids), self.max_in_size):
+            chunk = lead_ids[start : start + self.max_in_size]
+            leads.extend(await Lead.find({"_id": {"$in": chunk}}).to_list())
+        if leads:
+            logging.info("Found %s leads", len(leads))
+            return leads
         else:
             logging.error("No lead found!")
             return None
+
+    async def query_lead_ids(
+        self, persona: Persona | Segment, after: Optional[str], limit: int
+    ) -> list[str]:
+        """
+        Queries the lead IDs of a persona that follow a given lead ID.
+
+        Args:
+            persona (Persona | Segment): The persona, or its segment.
+            after (Optional[str]): The last lead ID already read, None to start
+                from the first.
+            limit (int): The maximum number of lead IDs.
+
+        Returns:
+            list[str]: The lead IDs, in order, empty past the end of the persona.
+        """
+        filter = self.persona_filter(persona)
+        if after is not None:
+            filter["_id"] = {"$gt": after}
+        memberships = (
+            await PersonaLead.get_motor_collection()
+            .find(filter, {"_id": 1})
+            .sort("_id", 1)
+            .limit(limit)
+            .to_list(None)
+        )
+        return [membership["_id"] for membership in memberships]
+
+    async def page(
+        self,
+        persona: Persona | Segment,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> tuple[list[LeadSummary], Optional[str]]:
+        """
+        Returns one page of the leads of a persona.
+
+        The cursor is the last lead ID of the previous page, so leads added to
+        or removed from the persona meanwhile never make the next page skip or
+        repeat the others.
+
+        Args:
+            persona (Persona | Segment): The persona, or its segment.
+            cursor (Optional[str]): The cursor returned with the previous page,
+                None for the first.
+            limit (Optional[int]): The number of leads per page.
+
+        Returns:
+            tuple[list[LeadSummary], Optional[str]]: The leads of the page, and the
+                cursor of the next page, None if this is the last page.
+        """
+        limit = min(limit or self.page_size, self.max_in_size)
+        lead_ids = await self.query_lead_ids(persona, cursor, limit)
+        if not lead_ids:
+            return [], None
+        leads = (
+            await Lead.find({"_id": {"$in": lead_ids}}).project(LeadSummary).to_list()
+        )
+        next_cursor = lead_ids[-1] if len(lead_ids) == limit else None
+        return leads, next_cursor
+
+    async def iter_leads(
+        self, persona: Persona | Segment
+    ) -> AsyncIterator[LeadSummary]:
+        """
+        Iterates over all the leads of a persona.
+
+        Args:
+            persona (Persona | Segment): The persona, or its segment.
+
+        Returns:
+            AsyncIterator[LeadSummary]: The leads of the persona.
+        """
+        after = None
+        while True:
+            lead_ids = await self.query_lead_ids(persona, after, self.max_in_size)
+            if not lead_ids:
+                return
+            async for lead in Lead.find(
+                {"_id": {"$in": lead_ids}}, batch_size=self.page_size
+            ).project(LeadSummary):
+                yield lead
+            if len(lead_ids) < self.max_in_size:
+                return
+            after = lead_ids[-1]
+
+
+if __name__ == "__main__":
+
+    async def main(company_type: str, academic_field: str):
+        try:
+            lead_finder = await LeadFinder.create()
+            count = 0
+            async for lead in lead_finder.iter_leads((company_type, academic_field)):
+                logging.debug("Lead: %s", lead.id)
+                count += 1
+            logging.info("Found %s leads", count)
+        finally:
+            close()
+
+    asyncio.run(main(company_type="startup", academic_field="computer science"))
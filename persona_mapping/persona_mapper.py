@@ -1,12 +1,19 @@
-import pandas as pd
+import argparse
 import logging
 import asyncio
-from typing import Literal
-from database.mongodb_connector import init
+from typing import Iterable, Literal, Optional
+from uuid import uuid4
+from pymongo import UpdateOne
+from database.mongodb_connector import init, close
 from database.models.persona import Persona
+from database.models.persona_lead import PersonaLead
 from database.models.linkedin_data import Linkedin
 from database.models.lead import Lead
+from persona_mapping.academic_fields import get_field_matcher
+from persona_mapping.field_matcher import FieldOfStudyMatcher
 from utils.logging_config import setup_logging
+from utils.metrics import metrics, report, timed
+from configs import MetricsConfig, PersonaConfig
 
 setup_logging()
 
@@ -16,16 +23,21 @@ class PersonaMapper:
     A class that maps personas to LinkedIn profiles.
 
     Attributes:
-        academic_df (pd.DataFrame): A DataFrame containing academic data.
+        field_matcher (FieldOfStudyMatcher): A matcher of the academic field table,
+            loaded on first use (see academic_fields).
 
     Methods:
         create: A class method that creates an instance of PersonaMapper.
         init: An asynchronous method that initializes the PersonaMapper instance.
         query_linkedin_id: An asynchronous method that queries the LinkedIn ID for a given lead ID.
         query_persona_features: An asynchronous method that queries the persona features for a given LinkedIn ID.
+        query_linkedin_ids: An asynchronous method that queries the LinkedIn IDs for many lead IDs.
+        query_many_persona_features: An asynchronous method that queries the persona features for many LinkedIn IDs.
+        map_many: An asynchronous method that maps and stores the personas of many lead IDs.
     """
 
-    academic_df: pd.DataFrame = pd.read_csv("test_data/fields_data_transformed.csv")
+    # Set to use another table, the shared one is loaded on first use otherwise
+    field_matcher: Optional[FieldOfStudyMatcher] = None
 
     @classmethod
     async def create(cls):
@@ -34,7 +46,10 @@ class PersonaMapper:
         return self
 
     async def init(self):
-        await init(database="prospects", document_models=[Lead, Linkedin, Persona])
+        await init(
+            database="prospects",
+            document_models=[Lead, Linkedin, Persona, PersonaLead],
+        )
 
     async def query_linkedin_id(self, lead_id: str) -> str | None:
         """
@@ -48,7 +63,7 @@ class PersonaMapper:
         """
         lead_result = await Lead.find_one(Lead.id == lead_id)
         if lead_result:
-            logging.info("Lead result: %s", lead_result)
+            logging.debug("Lead result: %s", lead_result.id)
             return lead_result.linkedin_id
         else:
             logging.error("No linkedin_id found!")
@@ -70,6 +85,9 @@ class PersonaMapper:
             .aggregate(
                 [
                     {"$match": {"person.linkedInIdentifier": f"{linkedin_id}"}},
+                    # _id is a random uuid, only updated_at orders the documents
+                    {"$sort": {"updated_at": -1}},
+                    {"$limit": 1},
                     {
                         "$project": {
                             "company_size": "$company.employeeCount",
@@ -81,19 +99,79 @@ class PersonaMapper:
                             },
                         }
                     },
-                    {"$sort": {"_id": -1}},
-                    {"$limit": 1},
                 ]
             )
             .to_list()
         )
         if persona_features:
-            logging.info("Linkedin result: %s", persona_features[0])
+            logging.debug("Linkedin result: %s", persona_features[0]["_id"])
             return persona_features[0]
         else:
             logging.error("No linkedin data found!")
             return None
 
+    @timed("persona_stage_seconds", stage="query_linkedin_ids")
+    async def query_linkedin_ids(self, lead_ids: list[str]) -> dict[str, str]:
+        """
+        Queries the LinkedIn IDs for many lead IDs, with a single query.
+
+        Args:
+            lead_ids (list[str]): The IDs of the leads.
+
+        Returns:
+            dict[str, str]: The LinkedIn ID of every lead that was found, by lead ID.
+        """
+        leads = (
+            await Lead.find({"_id": {"$in": lead_ids}})
+            .aggregate([{"$project": {"linkedin_id": 1}}])
+            .to_list()
+        )
+        logging.info(f"Found {len(leads)} of {len(lead_ids)} leads")
+        return {
+            lead["_id"]: lead["linkedin_id"] for lead in leads if lead.get("linkedin_id")
+        }
+
+    @timed("persona_stage_seconds", stage="query_persona_features")
+    async def query_many_persona_features(
+        self, linkedin_ids: list[str]
+    ) -> dict[str, dict]:
+        """
+        Queries the persona features for many LinkedIn IDs, with a single aggregation.
+        Only the latest written raw document of every LinkedIn ID is used.
+
+        Args:
+            linkedin_ids (list[str]): The LinkedIn IDs of the leads.
+
+        Returns:
+            dict[str, dict]: The persona features of every LinkedIn ID that was found.
+        """
+        persona_features = (
+            await Linkedin.find({"person.linkedInIdentifier": {"$in": linkedin_ids}})
+            .aggregate(
+                [
+                    # _id is a random uuid, only updated_at orders the documents
+                    {"$sort": {"updated_at": -1}},
+                    {
+                        "$group": {
+                            "_id": "$person.linkedInIdentifier",
+                            "company_size": {"$first": "$company.employeeCount"},
+                            "field_of_study": {
+                                "$first": {
+                                    "$arrayElemAt": [
+                                        "$person.schools.educationHistory.fieldOfStudy",
+                                        0,
+                                    ]
+                                }
+                            },
+                        }
+                    },
+                ]
+            )
+            .to_list()
+        )
+        logging.info(f"Found persona features for {len(persona_features)} linkedin ids")
+        return {features["_id"]: features for features in persona_features}
+
     @staticmethod
     def company_mapper(
         company_size: int,
@@ -125,11 +203,22 @@ class PersonaMapper:
         Returns:
             str: The category of the field of study.
         """
-        field_of_study = field_of_study.lower()
-        for index, row in cls.academic_df.iterrows():
-            if field_of_study in row["field_of_study"].lower():
-                return row["academic_field"]
-        return "Other"
+        return (cls.field_matcher or get_field_matcher()).classify(field_of_study)
+
+    @classmethod
+    def fields_of_study_mapper(cls, fields_of_study: list[str]) -> list[str]:
+        """
+        Maps many fields of study to field categories in one call.
+
+        Args:
+            fields_of_study (list[str]): The fields of study.
+
+        Returns:
+            list[str]: The categories of the fields of study, in input order.
+        """
+        return (cls.field_matcher or get_field_matcher()).classify_many(
+            fields_of_study
+        )
 
     async def insert_persona(
         self,
@@ -138,43 +227,183 @@ class PersonaMapper:
         academic_field: str,
     ) -> None:
         """
-        Inserts the persona features into the database.
+        Adds the lead to the persona of its (company_type, academic_field) pair.
 
         Args:
             lead_id (str): The ID of the lead.
-            persona_features (dict): The persona features of the lead.
+            company_type (str): The company type of the lead.
+            academic_field (str): The academic field of the lead.
 
         Returns:
             None
         """
-        persona = Persona(
-            company_type=company_type,
-            academic_field=academic_field,
-            lead_ids=[lead_id],
-        )
-        await persona.insert()
+        await self.insert_personas({lead_id: (company_type, academic_field)})
         logging.info("Persona inserted successfully!")
 
+    @timed("persona_stage_seconds", stage="insert_personas")
+    async def insert_personas(self, mappings: dict[str, tuple[str, str]]) -> None:
+        """
+        Adds many leads to the personas of their (company_type, academic_field)
+        pairs, with one unordered bulk write per collection. Personas that do not
+        exist yet are created.
 
-if __name__ == "__main__":
+        Every lead has one membership in the *persona_leads* collection, keyed on
+        its ID, so a lead that is mapped again moves to its new persona, and is
+        never part of two.
 
-    async def main(lead_id: str):
-        persona_mapper = await PersonaMapper.create()
-        linkedin_id = await persona_mapper.query_linkedin_id(lead_id)
-        logging.info("Linkedin_id: %s", linkedin_id)
-        if linkedin_id:
-            persona_features = await persona_mapper.query_persona_features(linkedin_id)
-        if persona_features:
-            company_type = persona_mapper.company_mapper(
-                persona_features["company_size"]
+        Args:
+            mappings (dict[str, tuple[str, str]]): The (company_type, academic_field)
+                pair of every lead, by lead ID.
+
+        Returns:
+            None
+        """
+        segments = set(mappings.values())
+        if not segments:
+            return
+        await Persona.get_motor_collection().bulk_write(
+            [
+                UpdateOne(
+                    {"company_type": company_type, "academic_field": academic_field},
+                    {"$setOnInsert": {"_id": uuid4().hex}},
+                    upsert=True,
+                )
+                for company_type, academic_field in segments
+            ],
+            ordered=False,
+        )
+        await PersonaLead.get_motor_collection().bulk_write(
+            [
+                UpdateOne(
+                    {"_id": lead_id},
+                    {
+                        "$set": {
+                            "company_type": company_type,
+                            "academic_field": academic_field,
+                        },
+                        "$currentDate": {"updated_at": True},
+                    },
+                    upsert=True,
+                )
+                for lead_id, (company_type, academic_field) in mappings.items()
+            ],
+            ordered=False,
+        )
+        logging.info(f"Upserted {len(segments)} personas for {len(mappings)} leads")
+
+    @timed("persona_stage_seconds", stage="map_features")
+    def map_features(self, features: dict[str, dict]) -> dict[str, tuple[str, str]]:
+        """
+        Maps the persona features of many leads to (company_type, academic_field)
+        pairs. Leads without a company size cannot be mapped, and are left out.
+
+        Args:
+            features (dict[str, dict]): The persona features of every lead, by lead ID.
+
+        Returns:
+            dict[str, tuple[str, str]]: The persona of every mapped lead, by lead ID.
+        """
+        fields_of_study = list(
+            {feature.get("field_of_study") for feature in features.values()}
+            - {None, ""}
+        )
+        academic_fields = dict(
+            zip(fields_of_study, self.fields_of_study_mapper(fields_of_study))
+        )
+        return {
+            lead_id: (
+                self.company_mapper(feature["company_size"]),
+                academic_fields.get(feature.get("field_of_study"), "Other"),
+            )
+            for lead_id, feature in features.items()
+            if feature.get("company_size") is not None
+        }
+
+    async def map_many(
+        self, lead_ids: Iterable[str], batch_size: int = PersonaConfig.BATCH_SIZE
+    ) -> dict[str, tuple[str, str]]:
+        """
+        Maps the personas of many leads, and inserts them into the database.
+        Leads that were mapped before move to their new persona.
+
+        The leads are processed in batches of `batch_size`, with one query for
+        the leads and one aggregation for the persona features per batch.
+
+        Args:
+            lead_ids (Iterable[str]): The IDs of the leads.
+            batch_size (int): The number of leads per batch.
+
+        Returns:
+            dict[str, tuple[str, str]]: The persona of every mapped lead, by lead ID.
+        """
+        lead_ids = list(dict.fromkeys(lead_ids))
+        results: dict[str, tuple[str, str]] = {}
+        for start in range(0, len(lead_ids), batch_size):
+            batch = lead_ids[start : start + batch_size]
+            linkedin_ids = await self.query_linkedin_ids(batch)
+            if not linkedin_ids:
+                continue
+            features = await self.query_many_persona_features(
+                list(set(linkedin_ids.values()))
             )
-            logging.info("Company type: %s", company_type)
-            academic_field = persona_mapper.fied_of_study_mapper(
-                persona_features["field_of_study"]
+            mappings = self.map_features(
+                {
+                    lead_id: features[linkedin_id]
+                    for lead_id, linkedin_id in linkedin_ids.items()
+                    if linkedin_id in features
+                }
             )
-            logging.info("Academic field: %s", academic_field)
+            await self.insert_personas(mappings)
+            results.update(mappings)
+        logging.info(f"Mapped {len(results)} of {len(lead_ids)} leads")
+        metrics.inc("persona_leads_total", len(results), outcome="mapped")
+        metrics.inc(
+            "persona_leads_total", len(lead_ids) - len(results), outcome="unmapped"
+        )
+        return results
+
+
+def read_lead_ids(path: str) -> Iterable[str]:
+    """
+    Reads lead IDs from a file, one per line.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        Iterable[str]: The lead IDs, in file order.
+    """
+    with open(path) as f:
+        yield from (line.strip() for line in f if line.strip())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Map the personas of leads.")
+    parser.add_argument("lead_ids", nargs="*", help="The IDs of the leads to map")
+    parser.add_argument("--file", help="File with one lead ID per line")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=PersonaConfig.BATCH_SIZE,
+        help="Number of leads mapped per database round trip",
+    )
+    parser.add_argument(
+        "--metrics-output",
+        default=MetricsConfig.OUTPUT,
+        help="File to write the metrics to, when METRICS_ENABLED=1",
+    )
+    args = parser.parse_args()
 
-            await persona_mapper.insert_persona(lead_id, company_type, academic_field)
+    async def main():
+        lead_ids = list(args.lead_ids)
+        if args.file:
+            lead_ids.extend(read_lead_ids(args.file))
+        try:
+            persona_mapper = await PersonaMapper.create()
+            await persona_mapper.map_many(lead_ids, batch_size=args.batch_size)
+        finally:
+            close()
+            report(args.metrics_output)
 
-    asyncio.run(main(lead_id="dd4483e4748c4277b1f989358dc51408"))
+    asyncio.run(main())
 
@@ -0,0 +1,56 @@
+import os
+from persona_mapping import academic_fields
+from persona_mapping.academic_fields import cache_path_for, get_field_matcher, load_table
+
+CSV = "level,field_of_study,academic_field\nbachelor,Computer Science,computing\n"
+
+
+def write_csv(tmp_path, content=CSV):
+    path = tmp_path / "fields.csv"
+    path.write_text(content)
+    return str(path)
+
+
+def test_load_table_compiles_cache(tmp_path, mocker):
+    csv_path = write_csv(tmp_path)
+    assert load_table(csv_path) == (["Computer Science"], ["computing"])
+    assert os.path.exists(cache_path_for(csv_path))
+
+    spy = mocker.spy(academic_fields, "read_csv")
+    assert load_table(csv_path) == (["Computer Science"], ["computing"])
+    spy.assert_not_called()
+
+
+def test_load_table_recompiles_changed_csv(tmp_path):
+    csv_path = write_csv(tmp_path)
+    load_table(csv_path)
+    write_csv(tmp_path, CSV + "master,Physics,science\n")
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert load_table(csv_path) == (
+        ["Computer Science", "Physics"],
+        ["computing", "science"],
+    )
+
+
+def test_load_table_ignores_corrupt_cache(tmp_path):
+    csv_path = write_csv(tmp_path)
+    with open(cache_path_for(csv_path), "wb") as f:
+        f.write(b"not a pickle")
+
+    assert load_table(csv_path) == (["Computer Science"], ["computing"])
+
+
+def test_load_table_without_cache(tmp_path):
+    csv_path = write_csv(tmp_path)
+    assert load_table(csv_path, cache=False) == (["Computer Science"], ["computing"])
+    assert not os.path.exists(cache_path_for(csv_path))
+
+
+def test_get_field_matcher_is_shared(tmp_path):
+    csv_path = write_csv(tmp_path)
+    matcher = get_field_matcher(csv_path)
+
+    assert get_field_matcher(csv_path) is matcher
+    assert matcher.classify("computer") == "computing"
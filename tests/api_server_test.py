@@ -0,0 +1,53 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from api import server
+from configs import APIConfig
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = tmp_path / "profiles.ndjson"
+    profiles = [
+        {"person": {"linkedInIdentifier": "a", "emails": ["a@example.com"]}},
+        {"email": "B@example.com", "person": {"linkedInIdentifier": "b"}},
+    ]
+    path.write_text("\n".join(json.dumps(profile) for profile in profiles))
+    return path
+
+
+@pytest.fixture
+def client(mocker, corpus):
+    mocker.patch.object(APIConfig, "CORPUS_PATH", str(corpus))
+    with TestClient(server.app) as client:
+        yield client
+
+
+def test_get_linkedin_data(client):
+    resp = client.get("/get_linkedin_data/b@example.com")
+    assert resp.status_code == 200
+    assert resp.json()["person"]["linkedInIdentifier"] == "b"
+
+
+def test_get_linkedin_data_unknown_email_falls_back(client):
+    resp = client.get("/get_linkedin_data/unknown@example.com")
+    assert resp.json()["person"]["linkedInIdentifier"] == "a"
+
+
+def test_get_many_linkedin_data(client, mocker):
+    mocker.patch.object(client.app.state.profiles, "fallback_to_default", False)
+    resp = client.post(
+        "/get_linkedin_data",
+        json={"emails": ["a@example.com", "unknown@example.com", "a@example.com"]},
+    )
+    assert resp.json() == {
+        "a@example.com": {
+            "person": {"linkedInIdentifier": "a", "emails": ["a@example.com"]}
+        },
+        "unknown@example.com": None,
+    }
+
+
+def test_load_default_corpus():
+    profiles = server.ProfileIndex.load(APIConfig.CORPUS_PATH)
+    assert json.loads(profiles.get("anyone@example.com"))["success"] is True
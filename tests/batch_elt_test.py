@@ -0,0 +1,297 @@
+import asyncio
+import boto3
+import httpx
+import pytest
+from unittest.mock import MagicMock
+from moto import mock_aws
+from database.bulk_writer import raw_writer
+from data_pipeline.batch_elt import BatchELT, read_emails
+from data_pipeline.elt_process import ELT
+from database.models.lead import Lead
+from database.models.linkedin_data import Linkedin
+from database.s3_archiver import read_payload
+from database.s3_connector import S3Connector
+from data_pipeline.extractor import AsyncExtractor
+from configs import LINKEDIN_BUCKET
+
+
+def make_extractor(handler, max_in_flight=2):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return AsyncExtractor(
+        linkedin_api="http://test/get_linkedin_data/{email}",
+        max_in_flight=max_in_flight,
+        client=client,
+        backoff_base=0.001,
+    )
+
+
+def test_read_emails(tmp_path):
+    path = tmp_path / "emails.jsonl"
+    path.write_text('a@example.com\n\n{"email": "b@example.com"}\n{"other": 1}\n')
+    assert list(read_emails(str(path))) == ["a@example.com", "b@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_extract_success():
+    extractor = make_extractor(
+        lambda request: httpx.Response(200, json={"email": request.url.path})
+    )
+    data = await extractor.extract("a@example.com")
+    assert data == {"email": "/get_linkedin_data/a@example.com"}
+
+
+@pytest.mark.asyncio
+async def test_extract_failure():
+    extractor = make_extractor(lambda request: httpx.Response(500))
+    assert await extractor.extract("a@example.com") == {}
+
+
+def mock_raw_collection(mocker):
+    mocker.patch("database.bulk_writer.BulkWriter._to_operation")
+    mocker.patch(
+        "database.bulk_writer.Linkedin.get_motor_collection",
+        create=True,
+        return_value=mocker.MagicMock(
+            bulk_write=mocker.AsyncMock(),
+            find=mocker.MagicMock(
+                return_value=mocker.MagicMock(to_list=mocker.AsyncMock(return_value=[]))
+            ),
+        ),
+    )
+
+
+async def add_raw_document(elt):
+    await elt.raw_writer.add(
+        MagicMock(person={"linkedInIdentifier": elt.email}, payload_key=None)
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_bounds_every_stage(mocker):
+    in_flight = {"extract": 0, "load": 0}
+    peak = {"extract": 0, "load": 0}
+
+    async def track(stage, delay):
+        in_flight[stage] += 1
+        peak[stage] = max(peak[stage], in_flight[stage])
+        await asyncio.sleep(delay)
+        in_flight[stage] -= 1
+
+    async def handler(request):
+        await track("extract", 0.01)
+        if "missing" in request.url.path:
+            return httpx.Response(404)
+        email = request.url.path.rsplit("/", 1)[-1]
+        return httpx.Response(200, json={"person": {"linkedInIdentifier": email}})
+
+    async def fake_load(self):
+        if self.email == "broken@example.com":
+            raise ValueError("broken")
+        # Loading is the slow stage, so its queue fills up
+        await track("load", 0.05)
+        await add_raw_document(self)
+
+    mock_raw_collection(mocker)
+    mocker.patch.object(ELT, "async_load_mongo_raw", fake_load)
+    mocker.patch.object(ELT, "transform_many", mocker.AsyncMock(return_value=[]))
+    batch_elt = BatchELT(
+        max_in_flight=2,
+        extractor=make_extractor(handler),
+        s3_connector=mocker.MagicMock(),
+        mongo_writers=3,
+        queue_size=1,
+        batch_size=2,
+    )
+    emails = [f"lead{i}@example.com" for i in range(12)]
+    emails += ["missing@example.com", "broken@example.com"]
+    stats = await batch_elt.run(emails)
+
+    assert stats == {"processed": 12, "missing": 1, "failed": 1, "left": 0}
+    assert batch_elt.failed_emails == ["broken@example.com"]
+    assert peak == {"extract": 2, "load": 3}
+
+
+@pytest.mark.asyncio
+async def test_run_leaves_emails_once_credits_run_out(mocker):
+    mock_raw_collection(mocker)
+    mocker.patch.object(ELT, "async_load_mongo_raw", add_raw_document)
+    mocker.patch.object(ELT, "transform_many", mocker.AsyncMock(return_value=[]))
+    mocker.patch("data_pipeline.batch_elt.RawArchiver")
+
+    def handler(request):
+        email = request.url.path.rsplit("/", 1)[-1]
+        person = {"linkedInIdentifier": email}
+        return httpx.Response(200, json={"person": person, "credits_left": 0})
+
+    batch_elt = BatchELT(
+        max_in_flight=1,
+        extractor=make_extractor(handler, max_in_flight=1),
+        s3_connector=mocker.MagicMock(),
+        batch_size=2,
+    )
+    batch_elt.extractor.min_credits = 1
+    emails = [f"lead{i}@example.com" for i in range(5)]
+
+    stats = await batch_elt.run(iter(emails))
+
+    # Extracted once the credits ran out, or never read
+    assert stats["processed"] == 1
+    assert stats["left"] >= 3
+    left = emails[len(emails) - stats["left"] :]
+    assert sorted(batch_elt.failed_emails + left) == emails[1:]
+
+
+@pytest.mark.asyncio
+async def test_run_archives_and_transforms_every_flush(mocker):
+    transformed = []
+
+    async def fake_transform_many(linkedin_ids):
+        await asyncio.sleep(0.01)
+        transformed.extend(linkedin_ids)
+        return []
+
+    mock_raw_collection(mocker)
+    mocker.patch.object(ELT, "async_load_mongo_raw", add_raw_document)
+    mocker.patch.object(ELT, "transform_many", fake_transform_many)
+    mock_archiver = mocker.patch("data_pipeline.batch_elt.RawArchiver")
+    archiver = mock_archiver.return_value.__enter__.return_value
+
+    def handler(request):
+        email = request.url.path.rsplit("/", 1)[-1]
+        return httpx.Response(200, json={"person": {"linkedInIdentifier": email}})
+
+    extractor = make_extractor(handler)
+    batch_elt = BatchELT(
+        extractor=extractor,
+        s3_connector=mocker.MagicMock(),
+        s3_uploaders=2,
+        batch_size=2,
+    )
+    emails = [f"lead{i}@example.com" for i in range(7)]
+    stats = await batch_elt.run(emails)
+
+    assert stats == {"processed": 7, "missing": 0, "failed": 0, "left": 0}
+    assert sorted(transformed) == sorted(emails)
+    archived = sum(len(call.args[0]) for call in archiver.write_many.call_args_list)
+    assert archived == 7
+    # One object per flush
+    assert mock_archiver.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_transform_loaded_targets_flushed_identifiers(mocker):
+    leads = [mocker.MagicMock(), mocker.MagicMock()]
+    mock_transform_many = mocker.patch.object(
+        ELT, "transform_many", new=mocker.AsyncMock(return_value=leads)
+    )
+    batch_elt = BatchELT(extractor=mocker.MagicMock(), s3_connector=mocker.MagicMock())
+    batch_elt.raw_writer = raw_writer()
+    writer = mocker.patch("data_pipeline.batch_elt.lead_writer").return_value
+    writer.add, writer.flush = mocker.AsyncMock(), mocker.AsyncMock()
+    docs = [
+        mocker.MagicMock(person={"linkedInIdentifier": "a"}),
+        mocker.MagicMock(person={}),
+        mocker.MagicMock(person={"linkedInIdentifier": "b"}),
+    ]
+
+    await batch_elt.transform_loaded(docs)
+
+    mock_transform_many.assert_awaited_once_with(["a", "b"])
+    assert writer.add.await_count == 2
+    writer.flush.assert_awaited_once()
+
+
+@pytest.fixture
+def s3_connector():
+    with mock_aws():
+        s3_connector = S3Connector(client=boto3.client("s3", region_name="us-east-1"))
+        s3_connector.s3.create_bucket(Bucket=LINKEDIN_BUCKET)
+        yield s3_connector
+
+
+def slim_batch_elt(s3_connector, ingest_mode="slim"):
+    def handler(request):
+        email = request.url.path.rsplit("/", 1)[-1]
+        person = {"linkedInIdentifier": email, "skills": ["a"]}
+        return httpx.Response(200, json={"person": person})
+
+    return BatchELT(
+        extractor=make_extractor(handler),
+        s3_connector=s3_connector,
+        s3_uploaders=3,
+        batch_size=3,
+        ingest_mode=ingest_mode,
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_slim_archives_full_payloads(mocker, mongo, s3_connector):
+    batch_elt = slim_batch_elt(s3_connector)
+    await batch_elt.init()
+    emails = [f"lead{i}@example.com" for i in range(8)]
+
+    await batch_elt.run(emails)
+
+    docs = await Linkedin.find_all().to_list()
+    assert sorted(doc.person["linkedInIdentifier"] for doc in docs) == emails
+    assert all("skills" not in doc.person for doc in docs)
+    # One archive per flush, each payload read back alone from its range
+    assert len({doc.payload_key for doc in docs}) == 3
+    for doc in docs:
+        payload = read_payload(
+            doc.payload_key,
+            doc.payload_offset,
+            doc.payload_length,
+            s3_connector,
+            LINKEDIN_BUCKET,
+        )
+        assert payload["person"] == {**doc.person, "skills": ["a"]}
+    assert batch_elt._payloads == {}
+
+
+@pytest.mark.asyncio
+async def test_run_slim_writes_nothing_if_archiving_fails(mocker, mongo, s3_connector):
+    batch_elt = slim_batch_elt(s3_connector)
+    await batch_elt.init()
+    mocker.patch.object(
+        s3_connector, "put_object", side_effect=RuntimeError("S3 is down")
+    )
+
+    with pytest.raises(RuntimeError):
+        await batch_elt.run(["lead0@example.com", "lead1@example.com"])
+
+    # No document references a payload that was not stored
+    assert await Linkedin.get_motor_collection().count_documents({}) == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "ingest_mode, failing",
+    [
+        ("full", "data_pipeline.batch_elt.RawArchiver.write_many"),
+        ("full", "data_pipeline.batch_elt.ELT.transform_many"),
+        ("slim", "data_pipeline.batch_elt.ELT.transform_many"),
+    ],
+)
+async def test_run_counts_every_email_of_a_failed_flush(
+    mocker, mongo, s3_connector, ingest_mode, failing
+):
+    batch_elt = slim_batch_elt(s3_connector, ingest_mode)
+    await batch_elt.init()
+    failure = mocker.patch(failing, side_effect=RuntimeError("failed"))
+
+    emails = [f"lead{i}@example.com" for i in range(5)]
+    stats = await batch_elt.run(emails)
+
+    # Written, but not both archived and transformed
+    assert await Linkedin.get_motor_collection().count_documents({}) == 5
+    assert stats == {"processed": 0, "missing": 0, "failed": 5, "left": 0}
+    assert sorted(batch_elt.failed_emails) == emails
+
+    # Not skipped as unchanged on the next run
+    mocker.stop(failure)
+    batch_elt = slim_batch_elt(s3_connector, ingest_mode)
+    stats = await batch_elt.run(emails)
+
+    assert stats == {"processed": 5, "missing": 0, "failed": 0, "left": 0}
+    assert await Lead.get_motor_collection().count_documents({}) == 5
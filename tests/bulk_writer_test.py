@@ -0,0 +1,226 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from database.bulk_writer import BulkWriter, raw_writer
+from database.models.lead import Lead
+from database.models.linkedin_data import Linkedin
+
+
+@pytest.fixture
+def mock_collection(mocker):
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock()
+    collection.find.return_value.to_list = AsyncMock(return_value=[])
+    for model in (Linkedin, Lead):
+        # Documents can only be built once their collection is initialized
+        mocker.patch.object(model, "get_settings")
+        mocker.patch.object(
+            model, "get_motor_collection", return_value=collection, create=True
+        )
+    return collection
+
+
+def linkedin(identifier, **kwargs):
+    return Linkedin(person={"linkedInIdentifier": identifier}, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_flush_upserts_on_key(mock_collection):
+    writer = raw_writer(max_batch_size=10)
+    doc = linkedin("abc", credits_left=1)
+    await writer.add(doc)
+    mock_collection.bulk_write.assert_not_awaited()
+
+    assert await writer.flush() == 1
+    (operations,), kwargs = mock_collection.bulk_write.await_args
+    assert kwargs == {"ordered": False}
+    assert operations == [
+        UpdateOne(
+            {"person.linkedInIdentifier": "abc"},
+            {
+                "$set": {
+                    "credits_left": 1,
+                    "person": {"linkedInIdentifier": "abc"},
+                    "company": None,
+                    "rate_limit_left": None,
+                    "success": None,
+                    "payload_key": None,
+                    "payload_offset": None,
+                    "payload_length": None,
+                },
+                "$setOnInsert": {"_id": doc.id},
+                # Until save_hashes
+                "$unset": {"content_hash": ""},
+                "$currentDate": {"updated_at": True},
+            },
+            upsert=True,
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_add_flushes_at_batch_size(mock_collection):
+    on_flush = AsyncMock()
+    writer = raw_writer(max_batch_size=2, on_flush=on_flush)
+    await writer.add(linkedin("a"))
+    await writer.add(linkedin("b"))
+
+    mock_collection.bulk_write.assert_awaited_once()
+    assert len(on_flush.await_args.args[0]) == 2
+    assert await writer.flush() == 0
+
+
+@pytest.mark.asyncio
+async def test_add_keeps_latest_document_per_key(mock_collection):
+    writer = raw_writer(max_batch_size=10)
+    await writer.add(linkedin("a", credits_left=1))
+    await writer.add(linkedin("a", credits_left=2))
+
+    assert await writer.flush() == 1
+    (operations,), _ = mock_collection.bulk_write.await_args
+    assert operations[0]._doc["$set"]["credits_left"] == 2
+
+
+@pytest.mark.asyncio
+async def test_documents_without_key_are_inserted(mock_collection):
+    doc = Lead(first_name="John")
+    async with BulkWriter(Lead, key="linkedin_id") as writer:
+        await writer.add(doc)
+
+    (operations,), _ = mock_collection.bulk_write.await_args
+    assert isinstance(operations[0], InsertOne)
+    assert operations[0]._doc["_id"] == doc.id
+    assert operations[0]._doc["updated_at"] is not None
+
+
+@pytest.mark.asyncio
+async def test_flush_skips_unchanged_documents(mock_collection):
+    unchanged = AsyncMock()
+    writer = raw_writer(max_batch_size=10, on_unchanged=unchanged)
+    same = linkedin("abc", content_hash="h1")
+    changed = linkedin("def", content_hash="h2")
+    new = linkedin("ghi", content_hash="h3")
+    mock_collection.find.return_value.to_list.return_value = [
+        {"person": {"linkedInIdentifier": "abc"}, "content_hash": "h1"},
+        {"person": {"linkedInIdentifier": "def"}, "content_hash": "old"},
+    ]
+    for doc in (same, changed, new):
+        await writer.add(doc)
+
+    assert await writer.flush() == 2
+    (filter, projection), _ = mock_collection.find.call_args
+    assert sorted(filter["person.linkedInIdentifier"]["$in"]) == ["abc", "def", "ghi"]
+    (operations,), _ = mock_collection.bulk_write.await_args
+    assert [op._filter for op in operations] == [
+        {"person.linkedInIdentifier": "def"},
+        {"person.linkedInIdentifier": "ghi"},
+    ]
+    unchanged.assert_awaited_once_with([same])
+
+
+@pytest.mark.asyncio
+async def test_save_hashes_stores_hashes_of_written_documents(mock_collection):
+    writer = raw_writer()
+    await writer.save_hashes(
+        [linkedin("abc", content_hash="h1"), linkedin("def"), linkedin(None)]
+    )
+
+    (operations,), kwargs = mock_collection.bulk_write.await_args
+    assert kwargs == {"ordered": False}
+    assert operations == [
+        UpdateOne(
+            {"person.linkedInIdentifier": "abc"}, {"$set": {"content_hash": "h1"}}
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_before_write_runs_before_the_write(mock_collection):
+    async def set_payload_key(docs):
+        mock_collection.bulk_write.assert_not_awaited()
+        for doc in docs:
+            doc.payload_key = "raw/part.ndjson.gz"
+
+    writer = raw_writer(max_batch_size=10, before_write=set_payload_key)
+    await writer.add(linkedin("abc"))
+
+    assert await writer.flush() == 1
+    (operations,), _ = mock_collection.bulk_write.await_args
+    assert operations[0]._doc["$set"]["payload_key"] == "raw/part.ndjson.gz"
+
+
+@pytest.mark.asyncio
+async def test_before_write_error_skips_the_write(mock_collection):
+    on_flush = AsyncMock()
+    writer = raw_writer(
+        max_batch_size=10,
+        before_write=AsyncMock(side_effect=RuntimeError("archive failed")),
+        on_flush=on_flush,
+    )
+    await writer.add(linkedin("abc"))
+
+    with pytest.raises(RuntimeError):
+        await writer.flush()
+    mock_collection.bulk_write.assert_not_awaited()
+    on_flush.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_exit_waits_for_timed_flush(mock_collection):
+    on_flush = AsyncMock()
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_write(*args, **kwargs):
+        started.set()
+        await release.wait()
+
+    mock_collection.bulk_write.side_effect = slow_write
+    writer = raw_writer(max_batch_size=10, flush_interval=0.01, on_flush=on_flush)
+
+    async def run():
+        async with writer:
+            for identifier in ("a", "b", "c"):
+                await writer.add(linkedin(identifier))
+            # Exits while the timed flush is writing
+            await started.wait()
+
+    task = asyncio.create_task(run())
+    await started.wait()
+    await asyncio.sleep(0.02)
+    assert not task.done()
+    release.set()
+    await task
+
+    on_flush.assert_awaited_once()
+    assert len(on_flush.await_args.args[0]) == 3
+    assert not writer._buffer
+
+
+@pytest.mark.asyncio
+async def test_exit_raises_timed_flush_error(mock_collection):
+    mock_collection.bulk_write.side_effect = RuntimeError("Mongo is down")
+    writer = raw_writer(max_batch_size=10, flush_interval=0.01)
+
+    with pytest.raises(RuntimeError, match="Mongo is down"):
+        async with writer:
+            await writer.add(linkedin("a"))
+            await asyncio.sleep(0.05)
+    assert mock_collection.bulk_write.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_partial_failure_passes_written_documents_to_on_flush(mock_collection):
+    on_flush = AsyncMock()
+    mock_collection.bulk_write.side_effect = BulkWriteError(
+        {"writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate"}]}
+    )
+    writer = raw_writer(max_batch_size=10, on_flush=on_flush)
+    docs = [linkedin("a"), linkedin("b"), linkedin("c")]
+    for doc in docs:
+        await writer.add(doc)
+
+    with pytest.raises(BulkWriteError):
+        await writer.flush()
+    on_flush.assert_awaited_once_with([docs[0], docs[2]])
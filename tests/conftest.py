@@ -0,0 +1,18 @@
+import pytest
+import pytest_asyncio
+from database.mongodb_connector import MongoConnectionManager
+from configs import MongoConfig
+
+
+@pytest_asyncio.fixture
+async def mongo(mocker):
+    """
+    Routes every `init` to a fresh in-memory mongomock-motor client, so tests
+    run queries and aggregations end to end, without a mongod.
+    """
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    manager = MongoConnectionManager()
+    mocker.patch("database.mongodb_connector.connection_manager", manager)
+    manager.use_client(mongomock_motor.AsyncMongoMockClient(), MongoConfig.MONGO_URI)
+    yield manager
+    manager.close()
@@ -0,0 +1,106 @@
+import asyncio
+import time
+import httpx
+import pytest
+from data_pipeline.extractor import AsyncExtractor, TokenBucket
+
+
+def make_extractor(handler, **kwargs):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    kwargs.setdefault("backoff_base", 0.001)
+    return AsyncExtractor(
+        linkedin_api="http://test/get_linkedin_data/{email}", client=client, **kwargs
+    )
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+    # The first token is available right away, the next five take 1/50s each
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_retries_server_errors_and_429():
+    responses = [
+        httpx.Response(503),
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(200, json={"success": True}),
+    ]
+    extractor = make_extractor(lambda request: responses.pop(0), max_in_flight=4)
+
+    assert await extractor.extract("a@example.com") == {"success": True}
+    assert responses == []
+    # The 429 halved the concurrency
+    assert extractor.limit == 2
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ConnectTimeout("timeout")
+
+    extractor = make_extractor(handler, max_retries=2)
+
+    assert await extractor.extract("a@example.com") == {}
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(404 if "missing" in request.url.path else 400)
+
+    extractor = make_extractor(handler)
+
+    assert await extractor.extract("a@example.com") == {}
+    # No profile, which is a result rather than an error
+    assert await extractor.extract("missing@example.com") is None
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrency_follows_rate_limit_left():
+    in_flight = peak = 0
+    left = iter([1, 1, 1, 10, 10, 10, 10, 10])
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"rate_limit_left": next(left)})
+
+    extractor = make_extractor(handler, max_in_flight=4)
+    extractor.limit = 1
+    await asyncio.gather(*(extractor.extract(f"{i}@example.com") for i in range(8)))
+
+    # One more request is let in after every response with quota to spare
+    assert 1 < peak < 4
+    assert extractor.limit > 1
+
+
+@pytest.mark.asyncio
+async def test_stops_when_credits_run_out():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"credits_left": 5})
+
+    extractor = make_extractor(handler, min_credits=5)
+
+    assert await extractor.extract("a@example.com") == {"credits_left": 5}
+    assert extractor.credits_exhausted
+    assert await extractor.extract("b@example.com") == {}
+    assert len(calls) == 1
@@ -0,0 +1,56 @@
+import math
+import pandas as pd
+import pytest
+from persona_mapping.field_matcher import FieldOfStudyMatcher
+from configs import PersonaConfig
+
+
+def scan(academic_df: pd.DataFrame, field_of_study: str):
+    # The original row-by-row implementation, without the iterrows overhead
+    field_of_study = field_of_study.lower()
+    for row_field, academic_field in zip(
+        academic_df["field_of_study"], academic_df["academic_field"]
+    ):
+        if field_of_study in row_field.lower():
+            return academic_field
+    return "Other"
+
+
+def same(a, b) -> bool:
+    if isinstance(a, float) and isinstance(b, float):
+        return (math.isnan(a) and math.isnan(b)) or a == b
+    return a == b
+
+
+@pytest.fixture(scope="module")
+def academic_df():
+    return pd.read_csv(PersonaConfig.ACADEMIC_FIELDS_PATH)
+
+
+def test_classify_matches_row_scan(academic_df):
+    matcher = FieldOfStudyMatcher.from_dataframe(academic_df)
+    samples = pd.read_csv("test_data/field_of_study_exercise.csv")["field_of_study"]
+    inputs = list(samples) + [
+        "",
+        "computer science",
+        "COMPUTER SCIENCE",
+        "physics",
+        "business",
+        "marketing",
+        "general",
+        ", ",
+        "a\x00b",
+    ]
+    inputs += [field[: len(field) // 2] for field in samples]
+    for field_of_study in inputs:
+        assert same(matcher.classify(field_of_study), scan(academic_df, field_of_study))
+
+
+def test_classify_many_keeps_input_order():
+    matcher = FieldOfStudyMatcher(
+        ["Computer Science", "Applied Computer Science", "Marketing"],
+        ["computer science", "applied", "marketing"],
+    )
+    assert matcher.classify_many(
+        ["applied", "Marketing", "physics", "computer", "applied"]
+    ) == ["applied", "marketing", "Other", "computer science", "applied"]
@@ -0,0 +1,159 @@
+import asyncio
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock
+from bson.timestamp import Timestamp
+from pymongo.errors import OperationFailure
+from database.models.lead import Lead
+from database.models.linkedin_data import Linkedin
+from persona_mapping.incremental_mapper import (
+    IncrementalPersonaMapper,
+    watermark_filter,
+)
+
+UNTIL = datetime(2024, 1, 31, tzinfo=timezone.utc)
+BOUND = {"$or": [{"updated_at": None}, {"updated_at": {"$lt": UNTIL}}]}
+
+
+def test_watermark_filter():
+    updated_at = datetime(2024, 1, 30, tzinfo=timezone.utc)
+
+    assert watermark_filter(None, None, UNTIL) == BOUND
+    assert watermark_filter(updated_at, "b", UNTIL) == {
+        "$and": [
+            {
+                "$or": [
+                    {"updated_at": {"$gt": updated_at}},
+                    {"updated_at": updated_at, "_id": {"$gt": "b"}},
+                ]
+            },
+            BOUND,
+        ]
+    }
+    # Documents that were never timestamped come first
+    assert watermark_filter(None, "b", UNTIL)["$and"][0] == {
+        "$or": [
+            {"updated_at": None, "_id": {"$gt": "b"}},
+            {"updated_at": {"$ne": None}},
+        ]
+    }
+    assert watermark_filter(updated_at, None, UNTIL)["$and"][0] == {
+        "updated_at": {"$gt": updated_at}
+    }
+
+
+def mock_collection(mocker, model, pages):
+    collection = MagicMock()
+    cursor = collection.find.return_value.sort.return_value.limit.return_value
+    cursor.to_list = AsyncMock(side_effect=pages)
+    mocker.patch.object(
+        model, "get_motor_collection", return_value=collection, create=True
+    )
+    mocker.patch.object(
+        model, "get_collection_name", return_value=model.__name__.lower(), create=True
+    )
+    return collection
+
+
+@pytest.fixture
+def state(mocker):
+    state = MagicMock(resume_token=None, updated_at=None, last_id=None)
+    state.save = AsyncMock()
+    mocker.patch.object(
+        IncrementalPersonaMapper, "load_state", new=AsyncMock(return_value=state)
+    )
+    return state
+
+
+@pytest.mark.asyncio
+async def test_map_changes_of_raw_documents(mocker):
+    mock_collection(mocker, Linkedin, [])
+    leads = mock_collection(mocker, Lead, [])
+    leads.find.return_value.to_list = AsyncMock(
+        return_value=[{"_id": "lead_1"}, {"_id": "lead_2"}]
+    )
+    persona_mapper = MagicMock()
+    persona_mapper.map_many = AsyncMock(
+        return_value={"lead_1": ("startup", "Other")}
+    )
+    mapper = IncrementalPersonaMapper(persona_mapper=persona_mapper, batch_size=10)
+
+    docs = [
+        {"_id": "a", "person": {"linkedInIdentifier": "li_1"}},
+        {"_id": "b", "person": {"linkedInIdentifier": "li_1"}},
+        {"_id": "c", "person": {}},
+    ]
+    assert await mapper.map_changes(Linkedin, docs) == 1
+
+    leads.find.assert_called_once_with({"linkedin_id": {"$in": ["li_1"]}}, {"_id": 1})
+    persona_mapper.map_many.assert_awaited_once_with(["lead_1", "lead_2"], batch_size=10)
+
+
+@pytest.mark.asyncio
+async def test_poll_advances_the_watermark_per_micro_batch(mocker, state):
+    first = datetime(2024, 1, 1)
+    second = datetime(2024, 1, 2)
+    leads = mock_collection(
+        mocker,
+        Lead,
+        [
+            [{"_id": "a", "updated_at": first}, {"_id": "b", "updated_at": first}],
+            [{"_id": "c", "updated_at": second}],
+        ],
+    )
+    mapper = IncrementalPersonaMapper(batch_size=2)
+    mock_map_changes = mocker.patch.object(mapper, "map_changes", new=AsyncMock())
+
+    assert await mapper.poll(Lead) == 3
+
+    assert [call.args[1] for call in mock_map_changes.await_args_list] == [
+        [{"_id": "a", "updated_at": first}, {"_id": "b", "updated_at": first}],
+        [{"_id": "c", "updated_at": second}],
+    ]
+    # The second page starts after the last document of the first one
+    second_filter = leads.find.call_args_list[1].args[0]
+    assert second_filter["$and"][0]["$or"][1] == {
+        "updated_at": first,
+        "_id": {"$gt": "b"},
+    }
+    assert (state.updated_at, state.last_id) == (second, "c")
+    assert state.save.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_follow_falls_back_to_polling(mocker, state):
+    mapper = IncrementalPersonaMapper(poll_interval=0)
+    mock_poll = mocker.patch.object(
+        mapper,
+        "poll",
+        new=AsyncMock(side_effect=[0, 0, asyncio.CancelledError()]),
+    )
+    mocker.patch.object(
+        mapper,
+        "watch",
+        new=AsyncMock(side_effect=OperationFailure("not a replica set", 40573)),
+    )
+    mocker.patch.object(Lead, "get_collection_name", return_value="leads", create=True)
+
+    with pytest.raises(asyncio.CancelledError):
+        await mapper.follow(Lead)
+
+    # One catch-up poll, then polling once change streams are unavailable
+    assert mock_poll.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_watch_starts_at_the_bound_of_the_preceding_poll(mocker, state):
+    leads = mock_collection(mocker, Lead, [[]])
+    stream = leads.watch.return_value.__aenter__.return_value
+    stream.alive = False
+    mapper = IncrementalPersonaMapper(lag=5)
+
+    assert await mapper.poll(Lead) == 0
+    await mapper.watch(Lead)
+
+    # Not "now", which would miss the writes between the poll and the watch
+    until = leads.find.call_args.args[0]["$or"][1]["updated_at"]["$lt"]
+    assert leads.watch.call_args.kwargs["start_at_operation_time"] == Timestamp(
+        int(until.timestamp()), 0
+    )
@@ -0,0 +1,164 @@
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+from database import indexes
+from database.indexes import (
+    build_indexes,
+    check_query_plans,
+    find_stages,
+    merge_duplicate_leads,
+    merge_duplicate_personas,
+    merge_duplicate_raw_documents,
+    migrate_persona_leads,
+)
+from database.mongodb_connector import init
+from database.models.job import Job
+from database.models.lead import Lead
+from database.models.linkedin_data import Linkedin
+from database.models.persona import Persona
+from database.models.persona_lead import PersonaLead
+
+IXSCAN_PLAN = {
+    "queryPlanner": {
+        "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+        "rejectedPlans": [{"stage": "COLLSCAN"}],
+    }
+}
+COLLSCAN_PLAN = {
+    # Aggregations nest the plan of their first stage
+    "stages": [
+        {"$cursor": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}},
+        {"$group": {}},
+    ]
+}
+
+
+@pytest.fixture
+def collections(mocker):
+    collections = {}
+    for model in (Lead, Linkedin, Persona, PersonaLead, Job):
+        collection = MagicMock()
+        collection.create_indexes = AsyncMock(
+            side_effect=lambda models: [model.document["name"] for model in models]
+        )
+        collection.aggregate.return_value.to_list = AsyncMock(return_value=[])
+        collections[model] = collection
+        mocker.patch.object(
+            model, "get_motor_collection", return_value=collection, create=True
+        )
+        mocker.patch.object(
+            model, "get_collection_name", return_value=model.__name__, create=True
+        )
+    return collections
+
+
+def test_find_stages_ignores_rejected_plans():
+    assert find_stages(IXSCAN_PLAN, "COLLSCAN") == []
+    assert find_stages(COLLSCAN_PLAN, "COLLSCAN") == [{"stage": "COLLSCAN"}]
+    # Slot based execution nests the plan under queryPlan
+    sbe_plan = {"queryPlanner": {"winningPlan": {"queryPlan": {"stage": "COLLSCAN"}}}}
+    assert len(find_stages(sbe_plan, "COLLSCAN")) == 1
+
+
+@pytest.mark.asyncio
+async def test_build_indexes_in_background(collections):
+    names = await build_indexes()
+
+    assert "email" in names and "person_emails" in names
+    (lead_indexes,) = collections[Lead].create_indexes.await_args.args
+    email = next(index for index in lead_indexes if index.document["name"] == "email")
+    assert email.document["background"] is True
+    assert email.document["partialFilterExpression"] == {"email": {"$type": "string"}}
+    # The declarations of the models are left untouched
+    assert all("background" not in index.document for index in Lead.Settings.indexes)
+
+
+@pytest.mark.asyncio
+async def test_check_query_plans_reports_collscans(mocker, collections):
+    async def explain(command):
+        collection = command["explain"].get("find") or command["explain"]["aggregate"]
+        return COLLSCAN_PLAN if collection == "Persona" else IXSCAN_PLAN
+
+    database = MagicMock(command=AsyncMock(side_effect=explain))
+    for collection in collections.values():
+        collection.database = database
+
+    assert await check_query_plans() == ["persona_by_segment"]
+    assert database.command.await_count == len(indexes.hot_queries())
+    assert all(
+        call.args[0]["verbosity"] == "queryPlanner"
+        for call in database.command.await_args_list
+    )
+
+
+def persona(_id, company_type, lead_ids=None):
+    persona = {"_id": _id, "company_type": company_type, "academic_field": "Other"}
+    if lead_ids:
+        persona["lead_ids"] = lead_ids
+    return persona
+
+
+@pytest.mark.asyncio
+async def test_build_indexes_merges_duplicate_personas(mongo):
+    await init(database="prospects", document_models=[Persona, PersonaLead])
+    collection = Persona.get_motor_collection()
+    await collection.insert_many(
+        [
+            persona("b", "startup", ["lead_1", "lead_2"]),
+            persona("a", "startup", ["lead_2", "lead_3"]),
+            persona("c", "startup"),
+            persona("d", "mid_market", ["lead_4"]),
+        ]
+    )
+
+    assert await build_indexes([Persona]) == ["segment"]
+
+    personas = await collection.find({}).sort("_id").to_list(None)
+    assert [persona["_id"] for persona in personas] == ["a", "d"]
+    assert not any("lead_ids" in persona for persona in personas)
+    memberships = await PersonaLead.find_all().sort("_id").to_list()
+    assert [(lead.id, lead.company_type) for lead in memberships] == [
+        ("lead_1", "startup"),
+        ("lead_2", "startup"),
+        ("lead_3", "startup"),
+        ("lead_4", "mid_market"),
+    ]
+    assert (await collection.index_information())["segment"]["unique"] is True
+    assert await merge_duplicate_personas() == 0
+    assert await migrate_persona_leads() == 0
+
+
+@pytest.mark.asyncio
+async def test_build_indexes_merges_duplicate_leads_and_raw_documents(mongo):
+    await init(database="prospects", document_models=[Lead, Linkedin, PersonaLead])
+    # mongomock ignores partial filters, so documents without an identifier,
+    # which the unique indexes leave out, are not part of the data
+    old, new = datetime(2024, 1, 1), datetime(2024, 1, 2)
+    await Linkedin.get_motor_collection().insert_many(
+        [
+            {"_id": "r1", "person": {"linkedInIdentifier": "li_1"}, "updated_at": old},
+            {"_id": "r2", "person": {"linkedInIdentifier": "li_1"}, "updated_at": new},
+        ]
+    )
+    await Lead.get_motor_collection().insert_many(
+        [
+            {"_id": "l1", "linkedin_id": "li_1", "updated_at": new},
+            {"_id": "l2", "linkedin_id": "li_1", "updated_at": old},
+        ]
+    )
+    await PersonaLead.get_motor_collection().insert_one(
+        {"_id": "l2", "company_type": "startup", "academic_field": "Other"}
+    )
+
+    await build_indexes([Linkedin, Lead])
+
+    raw_ids = await Linkedin.get_motor_collection().distinct("_id")
+    assert raw_ids == ["r2"]
+    assert await Lead.get_motor_collection().distinct("_id") == ["l1"]
+    # The kept lead takes the membership of its duplicate
+    memberships = await PersonaLead.find_all().to_list()
+    assert [(lead.id, lead.company_type) for lead in memberships] == [("l1", "startup")]
+    indexes = await Lead.get_motor_collection().index_information()
+    assert indexes["linkedin_id_unique"]["unique"] is True
+    assert await merge_duplicate_leads() == 0
+    assert await merge_duplicate_raw_documents() == 0
@@ -0,0 +1,183 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from database.job_queue import JobQueue
+from database.models.job import Job
+from data_pipeline import job_worker
+from data_pipeline.job_worker import JobWorker
+
+
+@pytest.fixture
+def collection(mocker):
+    collection = MagicMock()
+    collection.insert_many = AsyncMock()
+    collection.find_one_and_update = AsyncMock(return_value=None)
+    collection.update_one = AsyncMock(return_value=MagicMock(modified_count=1))
+    collection.update_many = AsyncMock(return_value=MagicMock(modified_count=0))
+    # Documents can only be built once their collection is initialized
+    mocker.patch.object(Job, "get_settings")
+    mocker.patch.object(
+        Job, "get_motor_collection", return_value=collection, create=True
+    )
+    return collection
+
+
+@pytest.fixture
+def queue(collection):
+    return JobQueue(worker_id="w1", lease_seconds=60, max_attempts=3, retry_delay=10)
+
+
+def job(attempts=1, **kwargs):
+    return {"_id": "j1", "kind": "elt", "items": ["a"], "attempts": attempts, **kwargs}
+
+
+@pytest.mark.asyncio
+async def test_enqueue_batches_items(queue, collection):
+    ids = await queue.enqueue("persona", [f"lead{i}" for i in range(5)], batch_size=2)
+
+    (docs,), _ = collection.insert_many.await_args
+    assert [doc["_id"] for doc in docs] == ids
+    assert [doc["items"] for doc in docs] == [
+        ["lead0", "lead1"],
+        ["lead2", "lead3"],
+        ["lead4"],
+    ]
+    assert all(doc["status"] == "pending" and doc["kind"] == "persona" for doc in docs)
+    assert await queue.enqueue("elt", []) == []
+
+
+@pytest.mark.asyncio
+async def test_claim_takes_pending_or_expired_jobs(queue, collection):
+    collection.find_one_and_update.return_value = job()
+
+    assert await queue.claim(["elt"]) == job()
+    (filter, update), kwargs = collection.find_one_and_update.await_args
+    assert filter["kind"] == {"$in": ["elt"]}
+    assert [branch["status"] for branch in filter["$or"]] == ["pending", "running"]
+    assert filter["$expr"] == {"$lt": ["$attempts", "$max_attempts"]}
+    assert update["$set"]["worker"] == "w1"
+    assert update["$inc"] == {"attempts": 1}
+    assert kwargs["sort"] == [("available_at", 1)]
+
+
+@pytest.mark.asyncio
+async def test_updates_require_the_lease(queue, collection):
+    assert await queue.heartbeat(job())
+    collection.update_one.return_value = MagicMock(modified_count=0)
+    assert not await queue.complete(job(), {"processed": 1})
+
+    for call in collection.update_one.await_args_list:
+        assert call.args[0] == {"_id": "j1", "status": "running", "worker": "w1"}
+
+
+@pytest.mark.asyncio
+async def test_fail_retries_with_backoff_then_fails(queue, collection):
+    await queue.fail(job(attempts=2, max_attempts=3), "boom")
+    update = collection.update_one.await_args.args[1]["$set"]
+    assert update["status"] == "pending"
+    assert update["error"] == "boom"
+
+    await queue.fail(job(attempts=3, max_attempts=3), "boom")
+    assert collection.update_one.await_args.args[1]["$set"]["status"] == "failed"
+
+
+@pytest.mark.asyncio
+async def test_fail_keeps_only_the_items_left(queue, collection):
+    await queue.fail(job(items=["a", "b", "c"]), "boom", items=["b"])
+
+    update = collection.update_one.await_args.args[1]["$set"]
+    assert update["status"] == "pending"
+    assert update["items"] == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_worker_runs_jobs_until_empty(mocker):
+    queue = MagicMock(lease_seconds=60)
+    queue.fail_expired = AsyncMock(return_value=0)
+    queue.claim = AsyncMock(side_effect=[job(), job(_id="j2", kind="persona"), None])
+    queue.complete = AsyncMock()
+    queue.fail = AsyncMock()
+
+    async def handle(self, job):
+        if job["kind"] == "persona":
+            raise ValueError("broken")
+        return {"processed": 1}
+
+    mocker.patch.object(JobWorker, "handle", handle)
+
+    assert await JobWorker(queue).run(once=True) == 2
+    queue.complete.assert_awaited_once_with(job(), {"processed": 1})
+    queue.fail.assert_awaited_once()
+    assert queue.fail.await_args.args[0]["_id"] == "j2"
+
+
+@pytest.mark.asyncio
+async def test_worker_cancels_job_when_lease_is_lost(mocker):
+    queue = MagicMock(lease_seconds=0.03)
+    queue.heartbeat = AsyncMock(return_value=False)
+    queue.complete = AsyncMock()
+
+    async def handle(self, job):
+        await asyncio.sleep(1)
+
+    mocker.patch.object(JobWorker, "handle", handle)
+
+    assert await JobWorker(queue).run_job(job()) is None
+    queue.complete.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_handle_dispatches_on_kind(mocker):
+    stats = {"processed": 1, "missing": 0, "failed": 0, "left": 0}
+    batch_elt = MagicMock(run=AsyncMock(return_value=stats), failed_emails=[])
+    mocker.patch.object(
+        job_worker.BatchELT, "create", AsyncMock(return_value=batch_elt)
+    )
+    persona_mapper = MagicMock(map_many=AsyncMock(return_value={"l1": ("a", "b")}))
+    mocker.patch.object(
+        job_worker.PersonaMapper, "create", AsyncMock(return_value=persona_mapper)
+    )
+    worker = JobWorker(MagicMock())
+
+    assert await worker.handle(job()) == stats
+    batch_elt.run.assert_awaited_once_with(["a"])
+    assert await worker.handle(job(kind="persona", items=["l1", "l2"])) == {
+        "mapped": 1,
+        "unmapped": 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_elt_job_retries_only_unprocessed_emails(mocker):
+    stats = {"processed": 1, "missing": 1, "failed": 1, "left": 2}
+    batch_elt = MagicMock(run=AsyncMock(return_value=stats), failed_emails=["b"])
+    mocker.patch.object(
+        job_worker.BatchELT, "create", AsyncMock(return_value=batch_elt)
+    )
+    queue = MagicMock(lease_seconds=60)
+    queue.complete = AsyncMock()
+    queue.fail = AsyncMock()
+
+    items = ["a", "b", "missing", "d", "e"]
+    assert await JobWorker(queue).run_job(job(items=items)) is None
+    queue.complete.assert_not_awaited()
+    (failed, error), kwargs = queue.fail.await_args
+    assert failed["_id"] == "j1"
+    assert "3 of 5 emails were not processed" in error
+    # Neither the processed nor the missing emails
+    assert kwargs == {"items": ["b", "d", "e"]}
+
+
+@pytest.mark.asyncio
+async def test_elt_job_with_missing_emails_is_done(mocker):
+    stats = {"processed": 1, "missing": 1, "failed": 0, "left": 0}
+    batch_elt = MagicMock(run=AsyncMock(return_value=stats), failed_emails=[])
+    mocker.patch.object(
+        job_worker.BatchELT, "create", AsyncMock(return_value=batch_elt)
+    )
+    queue = MagicMock(lease_seconds=60)
+    queue.complete = AsyncMock()
+    queue.fail = AsyncMock()
+
+    assert await JobWorker(queue).run_job(job(items=["a", "missing"])) == stats
+    queue.fail.assert_not_awaited()
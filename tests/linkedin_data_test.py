@@ -0,0 +1,70 @@
+import pytest
+from database.models.linkedin_data import Linkedin, content_hash, slim_person
+
+PAYLOAD = {
+    "credits_left": 10,
+    "rate_limit_left": 5,
+    "success": True,
+    "person": {
+        "linkedInIdentifier": "a",
+        "firstName": "Ada",
+        "emails": ["ada@example.com"],
+        "skills": ["Math"],
+        "schools": {
+            "educationHistory": [
+                {"fieldOfStudy": "Mathematics", "schoolName": "London"},
+                {"fieldOfStudy": "Poetry", "schoolName": "Home"},
+            ]
+        },
+    },
+    "company": {"name": "Engines", "employeeCount": 3, "industry": "Computing"},
+}
+
+
+@pytest.fixture(autouse=True)
+def settings(mocker):
+    # Documents can only be built once their collection is initialized
+    mocker.patch.object(Linkedin, "get_settings")
+
+
+def test_slim_person_keeps_core_fields_and_latest_field_of_study():
+    assert slim_person(PAYLOAD["person"]) == {
+        "linkedInIdentifier": "a",
+        "firstName": "Ada",
+        "emails": ["ada@example.com"],
+        "schools": {"educationHistory": [{"fieldOfStudy": "Mathematics"}]},
+    }
+    assert slim_person(None) is None
+
+
+def test_from_payload_full():
+    doc = Linkedin.from_payload(PAYLOAD)
+
+    assert doc.person == PAYLOAD["person"]
+    assert doc.company == PAYLOAD["company"]
+    assert doc.payload_key is None
+
+
+def test_from_payload_slim():
+    doc = Linkedin.from_payload(PAYLOAD, slim=True, payload_key="raw/a.json")
+
+    assert "skills" not in doc.person
+    assert doc.company == {"name": "Engines", "employeeCount": 3}
+    assert (doc.credits_left, doc.rate_limit_left, doc.success) == (10, 5, True)
+    assert doc.payload_key == "raw/a.json"
+
+
+def test_content_hash_ignores_key_order_and_quota():
+    reordered = {
+        "company": dict(reversed(PAYLOAD["company"].items())),
+        "person": PAYLOAD["person"],
+        "credits_left": 9,
+    }
+    changed = {**PAYLOAD, "company": {**PAYLOAD["company"], "employeeCount": 4}}
+
+    assert content_hash(reordered) == content_hash(PAYLOAD)
+    assert content_hash(changed) != content_hash(PAYLOAD)
+    # Slim documents keep the hash of their full payload
+    assert Linkedin.from_payload(PAYLOAD, slim=True).content_hash == content_hash(
+        PAYLOAD
+    )
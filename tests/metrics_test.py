@@ -0,0 +1,82 @@
+import json
+import pytest
+from utils import metrics as metrics_module
+from utils.metrics import MetricsRegistry, timed
+
+
+@pytest.fixture
+def registry(mocker):
+    registry = MetricsRegistry(enabled=True)
+    mocker.patch.object(metrics_module, "metrics", registry)
+    return registry
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    registry.inc("records_total")
+    registry.observe("stage_seconds", 1.0)
+    with registry.timer("stage_seconds"):
+        pass
+
+    assert registry.summary() == {"counters": {}, "histograms": {}}
+    assert registry.to_prometheus() == ""
+
+
+def test_counters_and_histograms(registry):
+    registry.inc("records_total", 3, stage="transform")
+    registry.inc("records_total", 2, stage="transform")
+    registry.inc("records_total", stage="extract")
+    registry.observe("stage_seconds", 0.02, stage="transform")
+    registry.observe("stage_seconds", 3.0, stage="transform")
+
+    summary = registry.summary()
+    assert summary["counters"]["records_total"] == {
+        '{stage="transform"}': 5,
+        '{stage="extract"}': 1,
+    }
+    histogram = summary["histograms"]["stage_seconds"]['{stage="transform"}']
+    assert histogram == {"count": 2, "sum": 3.02, "mean": 1.51, "max": 3.0}
+
+    text = registry.to_prometheus()
+    assert "# TYPE records_total counter" in text
+    assert 'records_total{stage="transform"} 5' in text
+    assert 'stage_seconds_bucket{stage="transform",le="0.025"} 1' in text
+    assert 'stage_seconds_bucket{stage="transform",le="+Inf"} 2' in text
+    assert 'stage_seconds_count{stage="transform"} 2' in text
+
+
+@pytest.mark.asyncio
+async def test_timed_records_sync_and_async_calls(registry):
+    @timed("stage_seconds", stage="sync")
+    def sync_stage(value):
+        return value
+
+    @timed("stage_seconds", stage="async")
+    async def async_stage(value):
+        return value
+
+    assert sync_stage(1) == 1
+    assert await async_stage(2) == 2
+    with pytest.raises(ValueError):
+        with registry.timer("stage_seconds", stage="failed"):
+            raise ValueError
+
+    histograms = registry.summary()["histograms"]["stage_seconds"]
+    assert {key: value["count"] for key, value in histograms.items()} == {
+        '{stage="sync"}': 1,
+        '{stage="async"}': 1,
+        '{stage="failed"}': 1,
+    }
+
+
+def test_write(registry, tmp_path):
+    registry.inc("records_total")
+
+    registry.write(str(tmp_path / "metrics.json"))
+    registry.write(str(tmp_path / "metrics.prom"))
+
+    with open(tmp_path / "metrics.json") as f:
+        assert json.load(f)["counters"] == {"records_total": {"{}": 1}}
+    assert (tmp_path / "metrics.prom").read_text() == (
+        "# TYPE records_total counter\nrecords_total 1\n"
+    )
@@ -2,38 +2,82 @@ import pytest
 from database.models.lead import Lead
 from database.models.linkedin_data import Linkedin
 from database.models.persona import Persona
-from database.mongodb_connector import init
+from database.mongodb_connector import init, close, MongoConnectionManager
 from configs import MongoConfig
 from unittest.mock import patch, MagicMock, AsyncMock
 
 
+@pytest.fixture(autouse=True)
+def connection_manager(mocker):
+    # Use a fresh connection manager for every test
+    manager = MongoConnectionManager()
+    mocker.patch("database.mongodb_connector.connection_manager", manager)
+    return manager
+
+
 @pytest.mark.asyncio
 async def test_init_success(mocker):
     # Mock MongoDB client and init_beanie
-    mock_client = mocker.patch(
-        "motor.motor_asyncio.AsyncIOMotorClient", new=AsyncMock()
+    mock_client = mocker.patch("database.mongodb_connector.AsyncIOMotorClient")
+    mock_init_beanie = mocker.patch(
+        "database.mongodb_connector.init_beanie", new=AsyncMock()
     )
-    mock_init_beanie = mocker.patch("beanie.init_beanie")
-    mock_db = AsyncMock()
+    mock_db = MagicMock()
     mock_client.return_value.__getitem__.return_value = mock_db
 
     # Call the function
     await init("prospects", [Lead, Linkedin])
 
     # Assertions
-    mock_client.assert_called_once_with(MongoConfig.MONGO_URI)
+    mock_client.assert_called_once_with(
+        MongoConfig.MONGO_URI,
+        maxPoolSize=MongoConfig.MAX_POOL_SIZE,
+        minPoolSize=MongoConfig.MIN_POOL_SIZE,
+        maxIdleTimeMS=MongoConfig.MAX_IDLE_TIME_MS,
+        event_listeners=[],
+    )
     mock_client.return_value.__getitem__.assert_called_once_with("prospects")
-    mock_init_beanie.assert_called_once_with(
-        database=mock_db, document_models=[Lead, Linkedin]
+    mock_init_beanie.assert_awaited_once_with(
+        database=mock_db, document_models=[Lead, Linkedin], skip_indexes=True
     )
 
 
+@pytest.mark.asyncio
+async def test_init_reuses_client_and_registers_new_models_only(mocker):
+    mock_client = mocker.patch("database.mongodb_connector.AsyncIOMotorClient")
+    mock_init_beanie = mocker.patch(
+        "database.mongodb_connector.init_beanie", new=AsyncMock()
+    )
+
+    await init("prospects", [Lead, Linkedin])
+    await init("prospects", [Lead])
+    await init("prospects", [Lead, Linkedin, Persona])
+
+    mock_client.assert_called_once()
+    assert mock_init_beanie.await_count == 2
+    assert mock_init_beanie.await_args.kwargs["document_models"] == [Persona]
+
+
+@pytest.mark.asyncio
+async def test_close(mocker):
+    mock_client = mocker.patch("database.mongodb_connector.AsyncIOMotorClient")
+    mock_init_beanie = mocker.patch(
+        "database.mongodb_connector.init_beanie", new=AsyncMock()
+    )
+
+    await init("prospects", [Lead])
+    close()
+    await init("prospects", [Lead])
+
+    mock_client.return_value.close.assert_called_once()
+    assert mock_client.call_count == 2
+    assert mock_init_beanie.await_count == 2
+
+
 @pytest.mark.asyncio
 async def test_init_failure(mocker):
     # Mock MongoDB client to raise an exception
-    mock_client = mocker.patch(
-        "motor.motor_asyncio.AsyncIOMotorClient", new=AsyncMock()
-    )
+    mock_client = mocker.patch("database.mongodb_connector.AsyncIOMotorClient")
     mock_client.side_effect = Exception("Connection Error")
 
     # Call the function and expect an exception
@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from persona_mapping import parallel_mapper
+from persona_mapping.parallel_mapper import ParallelPersonaMapper, partition, shard_of
+
+
+def test_partition_is_stable_and_complete():
+    lead_ids = [f"lead{i}" for i in range(100)] + ["lead0"]
+    shards = partition(lead_ids, 4)
+
+    assert sorted(sum(shards, [])) == sorted(set(lead_ids))
+    for index, shard in enumerate(shards):
+        assert all(shard_of(lead_id, 4) == index for lead_id in shard)
+    assert partition(lead_ids, 4) == shards
+
+
+@pytest.mark.asyncio
+async def test_map_many_merges_shards(mocker):
+    def fake_map_shard(shard, lead_ids, batch_size):
+        mappings = {
+            lead_id: ("startup", "Other") for lead_id in lead_ids if lead_id != "lead0"
+        }
+        return {
+            "mappings": mappings,
+            "stats": {
+                "shard": shard,
+                "leads": len(lead_ids),
+                "mapped": len(mappings),
+                "seconds": 0.0,
+            },
+        }
+
+    mock_map_shard = mocker.patch.object(
+        parallel_mapper, "map_shard", side_effect=fake_map_shard
+    )
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        mapper = ParallelPersonaMapper(workers=3, batch_size=10, executor=executor)
+        mappings = await mapper.map_many(f"lead{i}" for i in range(30))
+
+    assert sorted(mappings) == sorted(f"lead{i}" for i in range(1, 30))
+    assert mock_map_shard.call_count == 3
+    assert sum(stats["leads"] for stats in mapper.shard_stats) == 30
+    assert {call.args[2] for call in mock_map_shard.call_args_list} == {10}
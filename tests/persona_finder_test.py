@@ -0,0 +1,70 @@
+import pytest
+import pytest_asyncio
+from database.models.lead import Lead
+from database.models.persona import Persona
+from database.models.persona_lead import PersonaLead
+from persona_mapping.persona_finder import LeadFinder
+
+LEAD_IDS = [f"lead_{i}" for i in range(5)]
+
+
+@pytest_asyncio.fixture
+async def lead_finder(mongo):
+    lead_finder = await LeadFinder.create(page_size=3, max_in_size=2)
+    await Lead.get_motor_collection().insert_many(
+        [{"_id": lead_id, "first_name": lead_id} for lead_id in LEAD_IDS]
+    )
+    # Memberships in another order, and of another segment
+    await PersonaLead.get_motor_collection().insert_many(
+        [
+            {"_id": lead_id, "company_type": "startup", "academic_field": "marketing"}
+            for lead_id in reversed(LEAD_IDS)
+        ]
+        + [{"_id": "other", "company_type": "startup", "academic_field": "Other"}]
+    )
+    return lead_finder
+
+
+@pytest.mark.asyncio
+async def test_iter_leads_caps_in_size(mocker, lead_finder):
+    find = mocker.spy(Lead, "find")
+
+    leads = [lead async for lead in lead_finder.iter_leads(("startup", "marketing"))]
+
+    assert [lead.id for lead in leads] == LEAD_IDS
+    assert [len(call.args[0]["_id"]["$in"]) for call in find.call_args_list] == [
+        2,
+        2,
+        1,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_page_returns_next_cursor(lead_finder):
+    persona = Persona(company_type="startup", academic_field="marketing")
+
+    leads, cursor = await lead_finder.page(persona, limit=2)
+    assert sorted(lead.id for lead in leads) == LEAD_IDS[:2]
+    assert cursor == "lead_1"
+
+    leads, cursor = await lead_finder.page(persona, cursor, limit=2)
+    assert sorted(lead.id for lead in leads) == LEAD_IDS[2:4]
+    assert cursor == "lead_3"
+
+    leads, cursor = await lead_finder.page(persona, cursor, limit=2)
+    assert [lead.id for lead in leads] == LEAD_IDS[4:]
+    assert cursor is None
+
+
+@pytest.mark.asyncio
+async def test_page_does_not_skip_leads_moved_between_pages(lead_finder):
+    persona = Persona(company_type="startup", academic_field="marketing")
+
+    leads, cursor = await lead_finder.page(persona, limit=2)
+    # A lead of the first page is remapped to another persona
+    await PersonaLead.find_one(PersonaLead.id == "lead_0").update(
+        {"$set": {"academic_field": "Other"}}
+    )
+    next_leads, cursor = await lead_finder.page(persona, cursor, limit=2)
+
+    assert sorted(lead.id for lead in leads + next_leads) == LEAD_IDS[:4]
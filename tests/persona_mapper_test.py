@@ -1,6 +1,10 @@
+import pytest
 import unittest
-from unittest.mock import patch, MagicMock
+from datetime import datetime
+from uuid import uuid4
+from unittest.mock import patch, MagicMock, AsyncMock
 from database.models.persona import Persona
+from database.models.persona_lead import PersonaLead
 from database.models.linkedin_data import Linkedin
 from database.models.lead import Lead
 from persona_mapping.persona_mapper import PersonaMapper
@@ -22,7 +26,8 @@ class PersonaMapperTestCase(unittest.TestCase):
         mock_init.return_value = None
         await self.persona_mapper.init()
         mock_init.assert_awaited_once_with(
-            database="prospects", document_models=[Lead, Linkedin, Persona]
+            database="prospects",
+            document_models=[Lead, Linkedin, Persona, PersonaLead],
         )
 
     @patch.object(Lead, "find_one")
@@ -59,6 +64,8 @@ class PersonaMapperTestCase(unittest.TestCase):
         mock_aggregate.aggregate.assert_called_once_with(
             [
                 {"$match": {"person.linkedInIdentifier": f"{linkedin_id}"}},
+                {"$sort": {"updated_at": -1}},
+                {"$limit": 1},
                 {
                     "$project": {
                         "company_size": "$company.employeeCount",
@@ -70,8 +77,6 @@ class PersonaMapperTestCase(unittest.TestCase):
                         },
                     }
                 },
-                {"$sort": {"_id": -1}},
-                {"$limit": 1},
             ]
         )
 
@@ -89,6 +94,8 @@ class PersonaMapperTestCase(unittest.TestCase):
         mock_aggregate.aggregate.assert_called_once_with(
             [
                 {"$match": {"person.linkedInIdentifier": f"{linkedin_id}"}},
+                {"$sort": {"updated_at": -1}},
+                {"$limit": 1},
                 {
                     "$project": {
                         "company_size": "$company.employeeCount",
@@ -100,8 +107,6 @@ class PersonaMapperTestCase(unittest.TestCase):
                         },
                     }
                 },
-                {"$sort": {"_id": -1}},
-                {"$limit": 1},
             ]
         )
 
@@ -130,16 +135,147 @@ class PersonaMapperTestCase(unittest.TestCase):
         result = self.persona_mapper.fied_of_study_mapper(field_of_study)
         self.assertEqual(result, "Other")
 
-    @patch.object(Persona, "insert")
-    async def test_insert_persona(self, mock_insert):
-        mock_insert.return_value = None
+    @patch.object(PersonaMapper, "insert_personas")
+    async def test_insert_persona(self, mock_insert_personas):
+        mock_insert_personas.return_value = None
         company_type = "startup"
         academic_field = "computer science"
-        await self.persona_mapper.insert_persona(company_type, academic_field)
-        mock_insert.assert_awaited_once_with(
-            company_type=company_type,
-            academic_field=academic_field,
+        await self.persona_mapper.insert_persona(
+            "lead_id", company_type, academic_field
         )
+        mock_insert_personas.assert_awaited_once_with(
+            {"lead_id": (company_type, academic_field)}
+        )
+
+
+def test_map_features():
+    persona_mapper = PersonaMapper()
+    features = {
+        "lead_1": {"company_size": 30, "field_of_study": "computer science"},
+        "lead_2": {"company_size": 5000, "field_of_study": "physics"},
+        "lead_3": {"company_size": 500, "field_of_study": None},
+        "lead_4": {"company_size": None, "field_of_study": "computer science"},
+    }
+    assert persona_mapper.map_features(features) == {
+        "lead_1": ("startup", "computer science"),
+        "lead_2": ("multi_national", "Other"),
+        "lead_3": ("mid_market", "Other"),
+    }
+
+
+@pytest.mark.asyncio
+async def test_map_many(mocker):
+    persona_mapper = PersonaMapper()
+    mock_linkedin_ids = mocker.patch.object(
+        persona_mapper,
+        "query_linkedin_ids",
+        new=AsyncMock(side_effect=[{"lead_1": "li_1", "lead_2": "li_1"}, {}]),
+    )
+    mock_features = mocker.patch.object(
+        persona_mapper,
+        "query_many_persona_features",
+        new=AsyncMock(
+            return_value={
+                "li_1": {"company_size": 30, "field_of_study": "computer science"}
+            }
+        ),
+    )
+    mock_insert = mocker.patch.object(
+        persona_mapper, "insert_personas", new=AsyncMock()
+    )
+
+    result = await persona_mapper.map_many(
+        ["lead_1", "lead_2", "lead_1", "lead_3"], batch_size=2
+    )
+
+    assert result == {
+        "lead_1": ("startup", "computer science"),
+        "lead_2": ("startup", "computer science"),
+    }
+    assert mock_linkedin_ids.await_args_list[0].args == (["lead_1", "lead_2"],)
+    assert mock_linkedin_ids.await_args_list[1].args == (["lead_3"],)
+    mock_features.assert_awaited_once_with(["li_1"])
+    mock_insert.assert_awaited_once_with(result)
+
+
+@pytest.mark.asyncio
+async def test_insert_personas_upserts_one_document_per_segment(mongo):
+    persona_mapper = await PersonaMapper.create()
+    for _ in range(2):
+        await persona_mapper.insert_personas(
+            {
+                "lead_1": ("startup", "computer science"),
+                "lead_2": ("startup", "computer science"),
+                "lead_3": ("mid_market", "marketing"),
+            }
+        )
+
+    personas = await Persona.get_motor_collection().find({}).to_list(None)
+    assert sorted(
+        (persona["company_type"], persona["academic_field"]) for persona in personas
+    ) == [("mid_market", "marketing"), ("startup", "computer science")]
+    memberships = await PersonaLead.find_all().sort("_id").to_list()
+    assert [
+        (lead.id, lead.company_type, lead.academic_field) for lead in memberships
+    ] == [
+        ("lead_1", "startup", "computer science"),
+        ("lead_2", "startup", "computer science"),
+        ("lead_3", "mid_market", "marketing"),
+    ]
+    assert all(lead.updated_at for lead in memberships)
+
+
+def raw(linkedin_id, employee_count, field_of_study, updated_at, _id=None):
+    return {
+        "_id": _id or uuid4().hex,
+        "person": {
+            "linkedInIdentifier": linkedin_id,
+            "schools": {"educationHistory": [{"fieldOfStudy": field_of_study}]},
+        },
+        "company": {"employeeCount": employee_count},
+        "updated_at": updated_at,
+    }
+
+
+@pytest.mark.asyncio
+async def test_query_many_persona_features_reads_latest_document(mongo):
+    persona_mapper = await PersonaMapper.create()
+    # _ids are random, so the latest document may well have the smallest one
+    await Linkedin.get_motor_collection().insert_many(
+        [
+            raw("li_1", 5000, "marketing", datetime(2024, 1, 2), _id="a"),
+            raw("li_1", 30, "computer science", datetime(2024, 1, 1), _id="b"),
+        ]
+    )
+
+    features = await persona_mapper.query_many_persona_features(["li_1"])
+
+    assert features["li_1"]["company_size"] == 5000
+    assert features["li_1"]["field_of_study"] == "marketing"
+
+
+@pytest.mark.asyncio
+async def test_map_many_moves_remapped_leads(mongo):
+    persona_mapper = await PersonaMapper.create()
+    await Lead.get_motor_collection().insert_one(
+        {"_id": "lead_1", "linkedin_id": "li_1"}
+    )
+    await Linkedin.get_motor_collection().insert_one(
+        raw("li_1", 30, "computer science", datetime(2024, 1, 1))
+    )
+    await persona_mapper.map_many(["lead_1"])
+    await Linkedin.get_motor_collection().update_one(
+        {"person.linkedInIdentifier": "li_1"},
+        {"$set": {"company.employeeCount": 5000}},
+    )
+
+    assert await persona_mapper.map_many(["lead_1"]) == {
+        "lead_1": ("multi_national", "computer science")
+    }
+    assert await Persona.get_motor_collection().count_documents({}) == 2
+    membership = await PersonaLead.get("lead_1")
+    assert membership.company_type == "multi_national"
+    assert await PersonaLead.get_motor_collection().count_documents({}) == 1
 
 
 if __name__ == "__main__":
@@ -0,0 +1,45 @@
+import pytest
+from benchmarks.pipeline_benchmark import (
+    STAGES,
+    PipelineBenchmark,
+    StageStats,
+    percentile,
+)
+
+
+def test_percentile():
+    assert percentile([], 50) == 0.0
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0, 5.0], 95) == pytest.approx(4.8)
+    assert percentile([1.0, 2.0, 3.0], 100) == 3.0
+
+
+@pytest.mark.asyncio
+async def test_stage_stats_summary():
+    stats = StageStats()
+    for _ in range(3):
+        async with stats.measure(10):
+            pass
+    stats.seconds = 2.0
+
+    summary = stats.summary()
+    assert summary["records"] == 30
+    assert summary["calls"] == 3
+    assert summary["records_per_sec"] == 15.0
+    assert summary["p50_ms"] <= summary["p95_ms"] <= summary["p99_ms"]
+    assert StageStats().summary()["records_per_sec"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_benchmark_smoke():
+    pytest.importorskip("mongomock_motor")
+    report = await PipelineBenchmark(sizes=[10], batch_size=4, max_in_flight=4).run()
+
+    results = report["results"]["10"]
+    assert list(results) == STAGES
+    for stage in STAGES:
+        assert results[stage]["records"] == 10, stage
+        assert results[stage]["calls"] >= 1, stage
+    assert results["extract"]["calls"] == 10
+    assert results["transform"]["calls"] == 3
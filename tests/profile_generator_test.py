@@ -0,0 +1,42 @@
+import json
+from api.server import ProfileIndex
+from benchmarks.profile_generator import ProfileGenerator, load_fields_of_study
+
+
+def test_profiles_are_reproducible():
+    assert list(ProfileGenerator(seed=1).generate(5)) == list(
+        ProfileGenerator(seed=1).generate(5)
+    )
+    assert ProfileGenerator(seed=1).profile(0) != ProfileGenerator(seed=2).profile(0)
+    # A profile only depends on its index
+    assert ProfileGenerator(seed=1).profile(3) == list(
+        ProfileGenerator(seed=1).generate(2, start=3)
+    )[0]
+
+
+def test_profiles_vary_within_the_schema():
+    fields_of_study = set(load_fields_of_study())
+    profiles = list(ProfileGenerator().generate(50))
+
+    identifiers = {profile["person"]["linkedInIdentifier"] for profile in profiles}
+    assert len(identifiers) == 50
+    assert len({profile["company"]["employeeCount"] for profile in profiles}) > 10
+    for profile in profiles:
+        history = profile["person"]["schools"]["educationHistory"]
+        assert history and {school["fieldOfStudy"] for school in history} <= (
+            fields_of_study
+        )
+        assert profile["person"]["positions"]["positionsCount"] == len(
+            profile["person"]["positions"]["positionHistory"]
+        )
+
+
+def test_write_ndjson_serves_through_mock_api(tmp_path):
+    path = tmp_path / "profiles.ndjson"
+    ProfileGenerator().write_ndjson(str(path), 10)
+
+    profiles = [json.loads(line) for line in path.read_text().splitlines()]
+    index = ProfileIndex.load(str(path), fallback_to_default=False)
+    assert len(index) == 10
+    email = profiles[4]["person"]["emails"][0]
+    assert json.loads(index.get(email)) == profiles[4]
@@ -0,0 +1,142 @@
+import threading
+import httpx
+import pytest
+from data_pipeline.extractor import AsyncExtractor
+from data_pipeline.response_cache import ResponseCache
+
+PROFILE = {"success": True, "person": {"linkedInIdentifier": "a"}}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with ResponseCache(path=str(tmp_path / "cache.db"), memory_entries=2) as cache:
+        yield cache
+
+
+def test_get_normalizes_email(cache):
+    cache.put(" Ada@Example.com", PROFILE)
+
+    assert cache.get("ada@example.com") == PROFILE
+    assert cache.get("bob@example.com") is None
+
+
+def test_failed_responses_are_not_cached(cache):
+    cache.put("a@example.com", {})
+    cache.put("b@example.com", {"success": False})
+
+    assert cache.get("a@example.com") is None
+    assert cache.get("b@example.com") is None
+
+
+def test_responses_persist_beyond_memory(tmp_path):
+    path = str(tmp_path / "cache.db")
+    with ResponseCache(path=path, memory_entries=1) as cache:
+        cache.put("a@example.com", PROFILE)
+        cache.put("b@example.com", PROFILE)
+        assert list(cache._memory) == ["b@example.com"]
+        assert cache.get("a@example.com") == PROFILE
+
+    with ResponseCache(path=path) as cache:
+        assert cache.get("b@example.com") == PROFILE
+
+
+def test_expired_responses_miss(cache, mocker):
+    cache.put("a@example.com", PROFILE)
+    fetched_at = cache._memory["a@example.com"][0]
+    mocker.patch("time.time", return_value=fetched_at + cache.ttl)
+
+    assert cache.get("a@example.com") is None
+    assert cache.evict() == 1
+
+
+def test_evict_keeps_most_recently_used(cache):
+    cache.max_entries = 2
+    for email in ("a@example.com", "b@example.com", "c@example.com"):
+        cache.put(email, PROFILE)
+    cache._memory.clear()
+    cache.get("a@example.com")
+
+    assert cache.evict() == 1
+    cache._memory.clear()
+    assert cache.get("a@example.com") == PROFILE
+    assert cache.get("b@example.com") is None
+
+
+def test_access_times_are_written_in_batches(cache):
+    cache.touch_every = 2
+
+    def accessed_at(email):
+        return cache._db.execute(
+            "SELECT accessed_at FROM responses WHERE key = ?", (email,)
+        ).fetchone()[0]
+
+    for email in ("a@example.com", "b@example.com"):
+        cache.put(email, PROFILE)
+    written = {
+        email: accessed_at(email) for email in ("a@example.com", "b@example.com")
+    }
+    cache._memory.clear()
+
+    cache.get("a@example.com")
+    assert accessed_at("a@example.com") == written["a@example.com"]
+    cache.get("b@example.com")
+    assert accessed_at("a@example.com") > written["a@example.com"]
+    assert accessed_at("b@example.com") > written["b@example.com"]
+    assert cache._accessed == {}
+
+
+def test_bypass_refreshes(cache):
+    cache.put("a@example.com", PROFILE)
+    cache.bypass = True
+    cache.put("a@example.com", {**PROFILE, "credits_left": 1})
+
+    assert cache.get("a@example.com") is None
+    cache.bypass = False
+    assert cache.get("a@example.com")["credits_left"] == 1
+
+
+@pytest.mark.asyncio
+async def test_extractor_reads_through_cache(cache):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json=PROFILE)
+
+    extractor = AsyncExtractor(
+        linkedin_api="http://test/get_linkedin_data/{email}",
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        cache=cache,
+    )
+
+    assert await extractor.extract("a@example.com") == PROFILE
+    assert await extractor.extract("A@example.com") == PROFILE
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_extractor_uses_cache_off_the_event_loop(cache, mocker):
+    loop_thread = threading.get_ident()
+    threads = []
+    for method in ("get", "put"):
+        original = getattr(cache, method)
+
+        def call(*args, original=original):
+            threads.append(threading.get_ident())
+            return original(*args)
+
+        mocker.patch.object(cache, method, side_effect=call)
+    extractor = AsyncExtractor(
+        linkedin_api="http://test/get_linkedin_data/{email}",
+        client=httpx.AsyncClient(
+            transport=httpx.MockTransport(
+                lambda request: httpx.Response(200, json=PROFILE)
+            )
+        ),
+        cache=cache,
+    )
+
+    await extractor.extract("a@example.com")
+
+    assert len(threads) == 2
+    assert loop_thread not in threads
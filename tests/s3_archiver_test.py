@@ -0,0 +1,112 @@
+import gzip
+import json
+import random
+import boto3
+import pytest
+from moto import mock_aws
+from database.s3_archiver import RawArchiver, partition_prefix, read_payload
+from database.s3_connector import S3Connector
+
+BUCKET = "linkedin-data"
+
+
+@pytest.fixture
+def s3_connector(mocker):
+    with mock_aws():
+        # Let the test use small multipart parts
+        mocker.patch("moto.s3.models.S3_UPLOAD_PART_MIN_SIZE", 256)
+        s3_connector = S3Connector(client=boto3.client("s3", region_name="us-east-1"))
+        s3_connector.s3.create_bucket(Bucket=BUCKET)
+        yield s3_connector
+
+
+def read_archive(s3_connector, key):
+    body = s3_connector.s3.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    return [json.loads(line) for line in gzip.decompress(body).splitlines()]
+
+
+def test_small_archive_is_one_object(s3_connector, mocker):
+    spy = mocker.spy(s3_connector, "create_multipart_upload")
+    with RawArchiver(s3_connector=s3_connector, bucket=BUCKET) as archiver:
+        archiver.write({"person": {"linkedInIdentifier": "a"}})
+        archiver.write_many([{"person": {"linkedInIdentifier": "b"}}])
+
+    assert archiver.key.startswith(f"{partition_prefix()}/part-")
+    assert archiver.key.endswith(".ndjson.gz")
+    assert read_archive(s3_connector, archiver.key) == [
+        {"person": {"linkedInIdentifier": "a"}},
+        {"person": {"linkedInIdentifier": "b"}},
+    ]
+    spy.assert_not_called()
+
+
+def test_large_archive_is_uploaded_in_parts(s3_connector, mocker):
+    spy = mocker.spy(s3_connector, "upload_part")
+    rng = random.Random(0)
+    records = [{"id": i, "payload": rng.randbytes(256).hex()} for i in range(2000)]
+    archiver = RawArchiver(s3_connector=s3_connector, bucket=BUCKET, part_size=1024)
+    archiver.write_many(records)
+    # Parts are uploaded while writing, only one part stays buffered
+    assert spy.call_count > 1
+    assert len(archiver._buffer) < 1024
+
+    key = archiver.close()
+
+    assert read_archive(s3_connector, key) == records
+
+
+def test_abort_discards_upload(s3_connector):
+    with pytest.raises(RuntimeError):
+        with RawArchiver(
+            s3_connector=s3_connector, bucket=BUCKET, part_size=256
+        ) as archiver:
+            archiver.write_many(
+                {"payload": random.randbytes(256).hex()} for _ in range(200)
+            )
+            raise RuntimeError("batch failed")
+
+    uploads = s3_connector.s3.list_multipart_uploads(Bucket=BUCKET)
+    assert not uploads.get("Uploads")
+    assert "Contents" not in s3_connector.s3.list_objects_v2(Bucket=BUCKET)
+
+
+def test_empty_archive_writes_nothing(s3_connector):
+    assert RawArchiver(s3_connector=s3_connector, bucket=BUCKET).close() is None
+    assert "Contents" not in s3_connector.s3.list_objects_v2(Bucket=BUCKET)
+
+
+def test_read_payload_from_object_or_archive(s3_connector, mocker):
+    s3_connector.put_object(BUCKET, "raw/a.json", json.dumps({"id": "a"}))
+    with RawArchiver(
+        s3_connector=s3_connector, bucket=BUCKET, part_size=256
+    ) as archiver:
+        archiver.write({"id": "b"})
+        ranges = {
+            record["id"]: archiver.write_member(record)
+            for record in (
+                {"id": "c"},
+                {"id": "d", "payload": random.Random(0).randbytes(512).hex()},
+            )
+        }
+        archiver.write({"id": "e"})
+    # The members span several parts
+    assert len(archiver._parts) > 1
+    get_object = mocker.spy(s3_connector, "get_object")
+
+    assert read_payload("raw/a.json", s3_connector=s3_connector, bucket=BUCKET) == {
+        "id": "a"
+    }
+    for id_, (offset, length) in ranges.items():
+        payload = read_payload(archiver.key, offset, length, s3_connector, BUCKET)
+        assert payload["id"] == id_
+    # Only the range of an archived payload is downloaded
+    assert get_object.call_count == 1
+    # Members are still read as one archive
+    assert [record["id"] for record in read_archive(s3_connector, archiver.key)] == [
+        "b",
+        "c",
+        "d",
+        "e",
+    ]
+    with pytest.raises(ValueError):
+        read_payload(archiver.key, s3_connector=s3_connector, bucket=BUCKET)
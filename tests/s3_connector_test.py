@@ -1,35 +1,61 @@
-# from moto import mock_aws
-# from database.s3_connector import S3Connector
-# import pytest
+import boto3
+import gzip
+import pytest
+from moto import mock_aws
+from database.s3_archiver import RawArchiver, iter_archive
+from database.s3_connector import S3Connector, get_s3_client
 
 
-# @pytest.fixture
-# def s3_connector():
-#     with mock_aws():
-#         yield S3Connector()
+@pytest.fixture
+def s3_connector():
+    with mock_aws():
+        s3_connector = S3Connector(client=boto3.client("s3", region_name="us-east-1"))
+        s3_connector.s3.create_bucket(Bucket="linkedin-data")
+        yield s3_connector
 
 
-# @mock_aws
-# def test_put_object(s3_connector):
-#     s3_connector.s3.create_bucket(Bucket="linkedin-data")
+def test_put_object(s3_connector):
+    result = s3_connector.put_object("linkedin-data", "test-key", "test body")
 
-#     result = s3_connector.put_object("linkedin-data", "test-key", "test body")
+    assert "ETag" in result
 
-#     assert "ETag" in result
+    obj = s3_connector.s3.get_object(Bucket="linkedin-data", Key="test-key")
+    assert obj["Body"].read().decode("utf-8") == "test body"
 
-#     obj = s3_connector.s3.get_object(Bucket="linkedin-data", Key="test-key")
-#     assert obj["Body"].read().decode("utf-8") == "test body"
 
+def test_get_object(s3_connector):
+    s3_connector.put_object("linkedin-data", "test-key", "test body")
 
-# @mock_aws
-# def test_get_object(s3_connector):
-#     s3_connector.s3.create_bucket(Bucket="linkedin-data")
+    body = s3_connector.get_object("linkedin-data", "test-key")
 
-#     s3_connector.put_object("linkedin-data", "test-key", "test body")
+    assert body is not None
+    assert body.read().decode("utf-8") == "test body"
 
-#     obj = s3_connector.get_object("linkedin-data", "test-key")
 
-#     assert obj and isinstance(obj, dict)
+def test_get_object_missing(s3_connector):
+    assert s3_connector.get_object("linkedin-data", "missing") is None
 
-#     assert obj.get("Body") is not None
-#     assert obj["Body"].read().decode("utf-8") == "test body"
+
+def test_put_many_and_get_many(s3_connector):
+    objects = [(f"key-{i}", f"body {i}".encode()) for i in range(20)]
+
+    assert s3_connector.put_many("linkedin-data", objects) == {
+        key: True for key, _ in objects
+    }
+    assert s3_connector.get_many(
+        "linkedin-data", [key for key, _ in objects] + ["missing"]
+    ) == {**dict(objects), "missing": None}
+
+
+def test_iter_archive(s3_connector):
+    records = [{"id": i} for i in range(100)]
+    with RawArchiver(s3_connector=s3_connector) as archiver:
+        archiver.write_many(records)
+
+    assert list(iter_archive(archiver.key, s3_connector=s3_connector)) == records
+
+
+def test_get_s3_client_is_shared():
+    assert get_s3_client() is get_s3_client()
+    assert get_s3_client(max_pool_connections=5) is not get_s3_client()
+    assert get_s3_client(max_pool_connections=5).meta.config.max_pool_connections == 5
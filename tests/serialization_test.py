@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+import pytest
+from utils import serialization
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, mocker):
+    if request.param == "orjson" and serialization.orjson is None:
+        pytest.skip("orjson is not installed")
+    if request.param == "json":
+        mocker.patch.object(serialization, "orjson", None)
+    return request.param
+
+
+def test_round_trip(backend):
+    data = {"person": {"firstName": "Léa", "emails": ["a@example.com"]}, "n": 1}
+
+    raw = serialization.dumps(data)
+
+    assert isinstance(raw, bytes)
+    assert serialization.loads(raw) == data
+    assert serialization.loads(raw.decode()) == data
+
+
+def test_default(backend):
+    raw = serialization.dumps({"at": datetime(2024, 1, 31, tzinfo=timezone.utc)}, str)
+
+    assert serialization.loads(raw)["at"].startswith("2024-01-31")
+
+
+def test_falls_back_on_objects_orjson_rejects(backend):
+    assert serialization.loads(serialization.dumps({1: 2**70})) == {"1": 2**70}
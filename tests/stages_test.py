@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from data_pipeline.stages import Stage
+
+
+@pytest.mark.asyncio
+async def test_join_drains_the_queue():
+    handled = []
+
+    async def handler(item):
+        await asyncio.sleep(0.001)
+        handled.append(item)
+
+    stage = Stage("test", handler, concurrency=3, queue_size=2)
+    stage.start()
+    for item in range(10):
+        await stage.put(item)
+    await stage.join()
+
+    assert sorted(handled) == list(range(10))
+
+
+@pytest.mark.asyncio
+async def test_put_waits_while_the_queue_is_full():
+    release = asyncio.Event()
+
+    async def handler(item):
+        await release.wait()
+
+    stage = Stage("test", handler, concurrency=1, queue_size=1)
+    stage.start()
+    await stage.put(1)  # Taken by the worker
+    await asyncio.sleep(0)
+    await stage.put(2)  # Fills the queue
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(stage.put(3), timeout=0.01)
+
+    release.set()
+    await stage.join()
+
+
+@pytest.mark.asyncio
+async def test_failed_items_do_not_stop_the_workers():
+    handled = []
+    errors = []
+
+    async def handler(item):
+        if item % 2:
+            raise ValueError(item)
+        handled.append(item)
+
+    stage = Stage(
+        "test",
+        handler,
+        concurrency=1,
+        queue_size=1,
+        on_error=lambda item, e: errors.append(item),
+    )
+    stage.start()
+    for item in range(6):
+        await stage.put(item)
+    await stage.join()
+
+    assert handled == [0, 2, 4]
+    assert errors == [1, 3, 5]
@@ -1,11 +1,15 @@
+import json
 import unittest
+from datetime import datetime
+import pytest
 from unittest.mock import patch, MagicMock
-from database.models.lead import Lead, LeadView
-from database.models.linkedin_data import Linkedin
+from database.models.lead import Lead
+from database.models.linkedin_data import Linkedin, content_hash
 from database.s3_connector import S3Connector
-from database.mongodb_connector import init
 from utils.logging_config import setup_logging
+from database.s3_archiver import partition_prefix
 from data_pipeline.elt_process import ELT
+from configs import LINKEDIN_BUCKET
 
 
 class ELTTestCase(unittest.TestCase):
@@ -15,7 +19,7 @@ class ELTTestCase(unittest.TestCase):
 
     @patch("requests.get")
     def test_extract_success(self, mock_get):
-        mock_get.return_value = MagicMock(json=lambda: {"data": "extracted_data"})
+        mock_get.return_value = MagicMock(content=b'{"data": "extracted_data"}')
         data = self.elt.extract()
         self.assertEqual(data, {"data": "extracted_data"})
 
@@ -30,84 +34,86 @@ class ELTTestCase(unittest.TestCase):
         self.elt.data = {"data": "extracted_data"}
         self.elt.load_s3()
         mock_put_object.assert_called_once_with(
-            bucket="linkedin_bucket", key="raw.json", body=b'{"data": "extracted_data"}'
+            bucket=LINKEDIN_BUCKET,
+            key=f"{partition_prefix()}/test@example.com.json",
+            body=b'{"data":"extracted_data"}',
         )
 
-    @patch.object(init, "init")
-    async def test_async_load_mongo_raw(self, mock_init):
-        self.elt.data = {
-            "credits_left": 10,
-            "person": "John Doe",
-            "rate_limit_left": 100,
-            "success": True,
-        }
-        await self.elt.async_load_mongo_raw()
-        mock_init.assert_called_once_with(
-            database="mongodb_db_name", document_models=[Linkedin]
-        )
-        Linkedin.insert.assert_called_once_with(
-            credits_left=10,
-            person="John Doe",
-            rate_limit_left=100,
-            success=True,
-        )
 
-    @patch.object(init, "init")
-    async def test_transform(self, mock_init):
-        mock_find = MagicMock()
-        mock_find.sort.return_value.project.return_value.limit.return_value.to_list.return_value = [
-            Lead(
-                linkedin_id="123",
-                status="active",
-                first_name="John",
-                last_name="Doe",
-                email="john.doe@example.com",
-                photo_url="http://example.com/photo.jpg",
-            )
+@pytest.fixture
+def payload():
+    with open("test_data/linkedin_example.json") as f:
+        data = json.load(f)
+    data["person"]["emails"] = ["julien.keraval@example.com"]
+    return data
+
+
+@pytest.mark.asyncio
+async def test_transform_many(mongo, payload):
+    elt = await ELT.create(data=payload, s3_connector=MagicMock())
+    await elt.async_load_mongo_raw()
+
+    leads = await ELT.transform_many([elt.linkedin_id, "unknown"])
+
+    assert len(leads) == 1
+    assert leads[0].linkedin_id == "ACoAACJrg3QBOHYEx_zMaj2sF7IgUFOpF5VLkss"
+    assert leads[0].first_name == "Julien"
+    assert leads[0].last_name == "Keraval"
+    assert leads[0].email == "julien.keraval@example.com"
+    assert leads[0].photo_url.startswith("https://media.licdn.com/")
+
+
+@pytest.mark.asyncio
+async def test_transform_many_uses_latest_raw_document(mongo, payload):
+    await ELT.create(data=payload, s3_connector=MagicMock())
+    linkedin_id = payload["person"]["linkedInIdentifier"]
+    await Linkedin.get_motor_collection().insert_many(
+        [
+            {
+                "_id": _id,
+                "person": {**payload["person"], "firstName": first_name},
+                "updated_at": datetime(2024, 1, day),
+            }
+            for _id, first_name, day in [
+                ("a", "Old", 1),
+                ("b", "New", 3),
+                ("c", "Mid", 2),
+            ]
         ]
-        Linkedin.find.return_value = mock_find
-        await self.elt.transform()
-        mock_init.assert_called_once_with(
-            database="mongodb_db_name", document_models=[Linkedin, Lead]
-        )
-        mock_find.sort.assert_called_once_with("-_id")
-        mock_find.sort.return_value.project.assert_called_once_with(LeadView)
-        mock_find.sort.return_value.project.return_value.limit.assert_called_once_with(
-            1
-        )
-        self.assertEqual(self.elt.doc.linkedin_id, "123")
-        self.assertEqual(self.elt.doc.status, "active")
-        self.assertEqual(self.elt.doc.first_name, "John")
-        self.assertEqual(self.elt.doc.last_name, "Doe")
-        self.assertEqual(self.elt.doc.email, "john.doe@example.com")
-        self.assertEqual(self.elt.doc.photo_url, "http://example.com/photo.jpg")
-
-    @patch.object(init, "init")
-    async def test_load_mongo_transformed(self, mock_init):
-        self.elt.doc = Lead(
-            linkedin_id="123",
-            status="active",
-            first_name="John",
-            last_name="Doe",
-            email="john.doe@example.com",
-            photo_url="http://example.com/photo.jpg",
-        )
-        await self.elt.load_mongo_transformed()
-        mock_init.assert_called_once_with(
-            database="mongodb_db_name", document_models=[Lead]
-        )
-        self.elt.doc.insert.assert_called_once()
-
-    @patch.object(ELT, "async_load_mongo_raw")
-    @patch.object(ELT, "transform")
-    @patch.object(ELT, "load_mongo_transformed")
-    async def test_main(
-        self, mock_load_mongo_transformed, mock_transform, mock_async_load_mongo_raw
-    ):
-        await self.elt.main()
-        mock_async_load_mongo_raw.assert_called_once()
-        mock_transform.assert_called_once()
-        mock_load_mongo_transformed.assert_called_once()
+    )
+
+    leads = await ELT.transform_many([linkedin_id])
+
+    assert [lead.first_name for lead in leads] == ["New"]
+
+
+@pytest.mark.asyncio
+async def test_main(mongo, payload):
+    elt = await ELT.create(data=payload, s3_connector=MagicMock())
+    await elt.main()
+
+    raw = await Linkedin.find_one({"person.linkedInIdentifier": elt.linkedin_id})
+    assert raw.content_hash == content_hash(payload)
+    lead = await Lead.find_one(Lead.linkedin_id == elt.linkedin_id)
+    assert lead.first_name == "Julien"
+    assert lead.email == "julien.keraval@example.com"
+    assert lead.updated_at is not None
+
+    # An unchanged profile is not written again
+    assert await ELT(data=payload, s3_connector=MagicMock()).is_unchanged()
+
+
+@pytest.mark.asyncio
+async def test_main_reruns_a_failed_transform(mongo, payload):
+    elt = await ELT.create(data=payload, s3_connector=MagicMock())
+    with patch.object(ELT, "transform_many", side_effect=RuntimeError("failed")):
+        with pytest.raises(RuntimeError):
+            await elt.main()
+    assert not await ELT(data=payload, s3_connector=MagicMock()).is_unchanged()
+
+    await ELT(data=payload, s3_connector=MagicMock()).main()
+
+    assert await Lead.find_one(Lead.linkedin_id == elt.linkedin_id) is not None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,304 @@
+import functools
+import inspect
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Optional
+from configs import MetricsConfig
+
+# Upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf
+)
+
+_disabled = nullcontext()
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: tuple, **extra) -> str:
+    labels = labels + tuple(extra.items())
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    """
+    Distribution of observed values, with cumulative buckets.
+
+    Attributes:
+        buckets (tuple[float, ...]): The upper bounds of the buckets.
+        counts (list[int]): The number of observations in every bucket.
+        count (int): The number of observations.
+        sum (float): The sum of the observations.
+        max (float): The largest observation.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry: "MetricsRegistry", name: str, labels: dict) -> None:
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.registry.observe(
+            self.name, time.perf_counter() - self.start, **self.labels
+        )
+
+
+class MetricsRegistry:
+    """
+    Process-wide registry of counters and histograms.
+
+    Metrics are identified by a name and labels, in the Prometheus data
+    model, and can be exported in the Prometheus text format or as a JSON
+    summary. When the registry is disabled, recording returns immediately
+    and timers are a shared no-op context manager, so instrumented code
+    pays for one attribute check.
+
+    Attributes:
+        enabled (bool): Whether metrics are recorded.
+
+    Methods:
+        inc: Increments a counter.
+        observe: Records a value in a histogram.
+        timer: Returns a context manager recording its duration in a histogram.
+        reset: Forgets all the recorded metrics.
+        summary: Returns the recorded metrics as a JSON-serializable dict.
+        to_prometheus: Returns the recorded metrics in the Prometheus text format.
+        write: Writes the recorded metrics to a file.
+    """
+
+    def __init__(self, enabled: bool = MetricsConfig.ENABLED) -> None:
+        self.enabled = enabled
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, Histogram]] = {}
+        # Metrics are recorded from S3 worker threads too
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """
+        Increments a counter.
+
+        Args:
+            name (str): The name of the counter.
+            value (float): The increment.
+            **labels: The labels of the counter.
+
+        Returns:
+            None
+        """
+        if not self.enabled:
+            return
+        key = _labels_key(labels)
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """
+        Records a value in a histogram.
+
+        Args:
+            name (str): The name of the histogram.
+            value (float): The observed value.
+            **labels: The labels of the histogram.
+
+        Returns:
+            None
+        """
+        if not self.enabled:
+            return
+        key = _labels_key(labels)
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def timer(self, name: str, **labels: Any):
+        """
+        Returns a context manager recording its duration, in seconds, in a
+        histogram. The duration is recorded even if the block raises.
+
+        Args:
+            name (str): The name of the histogram.
+            **labels: The labels of the histogram.
+
+        Returns:
+            The context manager.
+        """
+        if not self.enabled:
+            return _disabled
+        return _Timer(self, name, labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def summary(self) -> dict:
+        """
+        Returns the recorded metrics as a JSON-serializable dict, with the
+        count, sum, mean and max of every histogram.
+
+        Returns:
+            dict: The counters and histograms, by name, then by labels.
+        """
+        with self._lock:
+            return {
+                "counters": {
+                    name: {
+                        _format_labels(key) or "{}": value
+                        for key, value in series.items()
+                    }
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: {
+                        _format_labels(key) or "{}": {
+                            "count": histogram.count,
+                            "sum": round(histogram.sum, 6),
+                            "mean": round(histogram.sum / histogram.count, 6),
+                            "max": round(histogram.max, 6),
+                        }
+                        for key, histogram in series.items()
+                    }
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the recorded metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else repr(bound)
+                        lines.append(
+                            f"{name}_bucket{_format_labels(key, le=le)} {cumulative}"
+                        )
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def write(self, path: str) -> None:
+        """
+        Writes the recorded metrics to a file, as a JSON summary if the path
+        ends with .json, and in the Prometheus text format otherwise.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            None
+        """
+        with open(path, "w") as f:
+            if path.endswith(".json"):
+                json.dump(self.summary(), f, indent=2)
+            else:
+                f.write(self.to_prometheus())
+        logging.info(f"Wrote metrics to {path}")
+
+
+metrics = MetricsRegistry()
+
+
+def timed(name: str, **labels: Any) -> Callable:
+    """
+    Decorator recording the duration of every call of a function, sync or
+    async, in a histogram of the process-wide registry.
+
+    Args:
+        name (str): The name of the histogram.
+        **labels: The labels of the histogram.
+
+    Returns:
+        Callable: The decorator.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not metrics.enabled:
+                    return await func(*args, **kwargs)
+                with metrics.timer(name, **labels):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            with metrics.timer(name, **labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def report(output: Optional[str] = None) -> None:
+    """
+    Reports the recorded metrics at the end of a run: writes them to `output`
+    if given, and logs the JSON summary otherwise. Does nothing if metrics
+    are disabled.
+
+    Args:
+        output (Optional[str]): The file to write the metrics to.
+
+    Returns:
+        None
+    """
+    if not metrics.enabled:
+        return
+    if output:
+        metrics.write(output)
+    else:
+        logging.info("Metrics: %s", json.dumps(metrics.summary()))
@@ -0,0 +1,58 @@
+import json
+from typing import IO, Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library is the fallback
+    orjson = None
+
+
+def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """
+    Serializes an object to compact JSON bytes, with orjson when it is installed.
+
+    orjson serializes datetimes, UUIDs and dataclasses natively, and calls
+    `default` for any other type. Objects it rejects (e.g. integers over 64
+    bits, or non-string keys) are serialized with the standard library.
+
+    Args:
+        obj (Any): The object to serialize.
+        default (Optional[Callable]): Converts objects that are not serializable.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default)
+        except TypeError:
+            pass
+    return json.dumps(obj, default=default, separators=(",", ":")).encode()
+
+
+def loads(data: bytes | bytearray | str) -> Any:
+    """
+    Deserializes JSON, with orjson when it is installed.
+
+    Args:
+        data (bytes | bytearray | str): The JSON document.
+
+    Returns:
+        Any: The deserialized object.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load(f: IO) -> Any:
+    """
+    Deserializes a JSON file, or any object with a read method.
+
+    Args:
+        f (IO): The file, opened in binary or text mode.
+
+    Returns:
+        Any: The deserialized object.
+    """
+    return loads(f.read())